@@ -0,0 +1,273 @@
+import json
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from avlm.actions import ACTION_INVALID, Lateral, Longitudinal
+from avlm.generate import (
+    GenerationConfig,
+    compute_meta_action_labels,
+    get_action_rows,
+    get_label_inputs,
+)
+
+
+SOURCES = ("meta_actions_from_ti", "meta_actions_from_dt")
+FAMILIES = {"lateral": Lateral, "longitudinal": Longitudinal}
+
+
+def _class_lookup(ACTION) -> np.ndarray:
+    """Table from int8 label (offset by 128) to class index, -1 if invalid"""
+    lookup = np.full(256, -1, dtype=np.int64)
+    for i_class, label in enumerate(sorted(ACTION, key=int)):
+        lookup[int(label) + 128] = i_class
+    return lookup
+
+
+_LOOKUPS = {family: _class_lookup(ACTION) for family, ACTION in FAMILIES.items()}
+_CLASS_NAMES = {
+    family: [str(label) for label in sorted(ACTION, key=int)]
+    for family, ACTION in FAMILIES.items()
+}
+
+
+def get_action_horizons(config: GenerationConfig) -> List[str]:
+    """Horizon keys of the meta actions generated with a config"""
+    return [f"dt_{dt:.2f}" for dt in config.dts_action]
+
+
+def count_runs(classes: np.ndarray, n_classes: int, max_run_length: int) -> np.ndarray:
+    """Histogram the lengths of runs of equal classes along the first axis
+
+    Arguments:
+        classes - (F, H) class indices, negative where invalid; an invalid
+            entry ends a run and is not counted
+        n_classes - number of classes
+        max_run_length - longer runs are counted in the last bin
+
+    Returns:
+        (H, n_classes, max_run_length) counts, bin r is a run of r+1 frames
+    """
+    n_frames, n_horizons = classes.shape
+    # one row per horizon with an invalid separator so runs cannot span rows
+    padded = np.full((n_horizons, n_frames + 1), -1, dtype=np.int64)
+    padded[:, :n_frames] = classes.T
+    flat = padded.ravel()
+    starts = np.flatnonzero(np.concatenate([[True], flat[1:] != flat[:-1]]))
+    lengths = np.diff(np.concatenate([starts, [len(flat)]]))
+    keep = flat[starts] >= 0
+    horizon = starts[keep] // (n_frames + 1)
+    bins = np.minimum(lengths[keep], max_run_length) - 1
+    flat_index = (horizon * n_classes + flat[starts[keep]]) * max_run_length + bins
+    return np.bincount(
+        flat_index, minlength=n_horizons * n_classes * max_run_length
+    ).reshape(n_horizons, n_classes, max_run_length)
+
+
+class ActionStatistics:
+    """Streaming aggregate of the meta action labels over many agents
+
+    For each label source and horizon this accumulates the class histogram
+    of each action family, the lateral x longitudinal joint counts, the
+    frame-to-frame transition counts, and the distribution of run lengths.
+    Only the fixed-size count arrays are kept, so memory does not grow with
+    the number of frames seen. Partial statistics from parallel workers are
+    combined with merge.
+
+    Sequences are the labels of one agent over consecutive frames. A frame
+    without a future state at a horizon is counted as invalid there and
+    breaks both transitions and runs.
+
+    Arguments:
+        horizons - horizon keys of the labels, e.g., ["dt_1.00", "dt_2.00"]
+        max_run_length - runs of more frames are counted in the last bin
+    """
+
+    def __init__(self, horizons: Sequence[str], max_run_length: int = 50):
+        self.horizons = list(horizons)
+        self.max_run_length = max_run_length
+        self.n_sequences = 0
+        self.n_frames = 0
+        n_hor = len(self.horizons)
+        n_lat = len(_CLASS_NAMES["lateral"])
+        n_lon = len(_CLASS_NAMES["longitudinal"])
+        self.counts: Dict[str, Dict[str, np.ndarray]] = {}
+        for source in SOURCES:
+            self.counts[source] = {"invalid": np.zeros(n_hor, dtype=np.int64)}
+            self.counts[source]["joint"] = np.zeros((n_hor, n_lat, n_lon), np.int64)
+            for family, names in _CLASS_NAMES.items():
+                n_cls = len(names)
+                self.counts[source][family] = np.zeros((n_hor, n_cls), np.int64)
+                self.counts[source][f"transitions_{family}"] = np.zeros(
+                    (n_hor, n_cls, n_cls), np.int64
+                )
+                self.counts[source][f"runs_{family}"] = np.zeros(
+                    (n_hor, n_cls, max_run_length), np.int64
+                )
+
+    @classmethod
+    def from_config(cls, config: GenerationConfig, **kwargs) -> "ActionStatistics":
+        return cls(get_action_horizons(config), **kwargs)
+
+    def add_sequence(self, source: str, lateral: np.ndarray, longitudinal: np.ndarray):
+        """Add the integer labels of one agent over consecutive frames
+
+        Arguments:
+            source - label source, one of SOURCES
+            lateral - (F, H) int8 lateral labels, ACTION_INVALID if none
+            longitudinal - (F, H) int8 longitudinal labels, ACTION_INVALID if none
+        """
+        counts = self.counts[source]
+        n_hor = len(self.horizons)
+        classes = {}
+        for family, labels in zip(FAMILIES, [lateral, longitudinal]):
+            labels = np.asarray(labels).reshape(-1, n_hor)
+            classes[family] = _LOOKUPS[family][labels.astype(np.int64) + 128]
+        valid = (classes["lateral"] >= 0) & (classes["longitudinal"] >= 0)
+        for family in FAMILIES:
+            classes[family][~valid] = -1
+        horizon = np.broadcast_to(np.arange(n_hor), valid.shape)
+        counts["invalid"] += (~valid).sum(axis=0)
+
+        for family in FAMILIES:
+            cls_fam = classes[family]
+            n_cls = counts[family].shape[1]
+            counts[family] += np.bincount(
+                horizon[valid] * n_cls + cls_fam[valid], minlength=n_hor * n_cls
+            ).reshape(n_hor, n_cls)
+
+            # transitions between consecutive frames at the same horizon
+            prev, curr = cls_fam[:-1], cls_fam[1:]
+            both = (prev >= 0) & (curr >= 0)
+            flat_index = (horizon[1:][both] * n_cls + prev[both]) * n_cls + curr[both]
+            counts[f"transitions_{family}"] += np.bincount(
+                flat_index, minlength=n_hor * n_cls * n_cls
+            ).reshape(n_hor, n_cls, n_cls)
+            counts[f"runs_{family}"] += count_runs(cls_fam, n_cls, self.max_run_length)
+
+        n_lat, n_lon = counts["joint"].shape[1:]
+        flat_index = (
+            horizon[valid] * n_lat + classes["lateral"][valid]
+        ) * n_lon + classes["longitudinal"][valid]
+        counts["joint"] += np.bincount(
+            flat_index, minlength=n_hor * n_lat * n_lon
+        ).reshape(n_hor, n_lat, n_lon)
+
+    def add_records(self, records: Sequence[Dict]):
+        """Add the dataset frames of one agent, in frame order"""
+        n_hor = len(self.horizons)
+        for source in SOURCES:
+            labels = {
+                family: np.full((len(records), n_hor), ACTION_INVALID, dtype=np.int8)
+                for family in FAMILIES
+            }
+            for i_frame, ds_frame in enumerate(records):
+                actions = ds_frame[source]
+                for i_hor, horizon in enumerate(self.horizons):
+                    action = actions.get(horizon)
+                    if action is None:
+                        continue
+                    for family, ACTION in FAMILIES.items():
+                        labels[family][i_frame, i_hor] = int(ACTION[action[family]])
+            self.add_sequence(source, labels["lateral"], labels["longitudinal"])
+        self.n_sequences += 1
+        self.n_frames += len(records)
+
+    def update(self, records: Iterable[Dict]):
+        """Add a stream of dataset frames, e.g., an avlm.dataset.AVLMDataset
+
+        Consecutive frames of the same scene and agent form one sequence, so
+        only the frames of one agent are held at a time.
+        """
+        buffer, key_last = [], None
+        for ds_frame in records:
+            key = (ds_frame["scene"], str(ds_frame["agent"]))
+            if (key != key_last) and buffer:
+                self.add_records(buffer)
+                buffer = []
+            buffer.append(ds_frame)
+            key_last = key
+        if buffer:
+            self.add_records(buffer)
+
+    def update_from_scene(self, SD, config: GenerationConfig):
+        """Label the agents of a scene directly from their states and add them
+
+        This skips building the dataset frames, so a new label definition
+        can be evaluated from the agent states alone.
+        """
+        if get_action_horizons(config) != self.horizons:
+            raise ValueError("Config action horizons do not match the statistics")
+        for agent in SD.get_agent_set(frame=0):
+            label_inputs = get_label_inputs(SD, agent, config)
+            if label_inputs is None:
+                continue
+            from_ti, from_dt = compute_meta_action_labels(
+                label_inputs["quaternions"],
+                label_inputs["velocities"],
+                get_action_rows(label_inputs, config),
+            )
+            for source, (lateral, longitudinal) in zip(SOURCES, [from_ti, from_dt]):
+                self.add_sequence(source, lateral, longitudinal)
+            self.n_sequences += 1
+            self.n_frames += len(label_inputs["frames"])
+
+    def merge(self, other: "ActionStatistics"):
+        """Add the counts of another aggregate to this one"""
+        if (other.horizons != self.horizons) or (
+            other.max_run_length != self.max_run_length
+        ):
+            raise ValueError("Cannot merge statistics with different settings")
+        for source, counts in other.counts.items():
+            for name, values in counts.items():
+                self.counts[source][name] += values
+        self.n_sequences += other.n_sequences
+        self.n_frames += other.n_frames
+
+    def class_balance(self, source: str = SOURCES[0]) -> Dict:
+        """Fraction of each class among the valid labels, per horizon and family"""
+        balance = {}
+        for i_hor, horizon in enumerate(self.horizons):
+            balance[horizon] = {}
+            for family, names in _CLASS_NAMES.items():
+                hist = self.counts[source][family][i_hor]
+                total = max(int(hist.sum()), 1)
+                balance[horizon][family] = {
+                    name: int(n) / total for name, n in zip(names, hist)
+                }
+        return balance
+
+    def to_dict(self) -> Dict:
+        return {
+            "horizons": self.horizons,
+            "max_run_length": self.max_run_length,
+            "n_sequences": self.n_sequences,
+            "n_frames": self.n_frames,
+            "classes": _CLASS_NAMES,
+            "counts": {
+                source: {name: values.tolist() for name, values in counts.items()}
+                for source, counts in self.counts.items()
+            },
+            "class_balance": {source: self.class_balance(source) for source in SOURCES},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ActionStatistics":
+        if data["classes"] != _CLASS_NAMES:
+            raise ValueError("Statistics were computed with different action classes")
+        stats = cls(data["horizons"], max_run_length=data["max_run_length"])
+        stats.n_sequences = data["n_sequences"]
+        stats.n_frames = data["n_frames"]
+        for source, counts in data["counts"].items():
+            for name, values in counts.items():
+                stats.counts[source][name][...] = np.asarray(values, dtype=np.int64)
+        return stats
+
+    def save(self, file_out: str):
+        with open(file_out, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, file_in: str) -> "ActionStatistics":
+        with open(file_in, "r") as f:
+            return cls.from_dict(json.load(f))
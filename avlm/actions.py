@@ -1,11 +1,16 @@
 import math
 from enum import Enum
-from typing import List
+from typing import List, Sequence, Tuple
 
+import numpy as np
 from avstack.environment.objects import VehicleState
 from avstack.geometry.transformations import transform_orientation
 
 
+# integer fill value for labels where no future state is available
+ACTION_INVALID = -128
+
+
 def get_all_meta_actions(
     agent_current: VehicleState,
     agent_future: VehicleState,
@@ -13,6 +18,120 @@ def get_all_meta_actions(
     return [ACTION.evaluate(agent_current, agent_future) for ACTION in ACTIONS]
 
 
+def states_to_arrays(states: Sequence[VehicleState]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack the attitudes and velocities of states for the batch evaluators
+
+    Returns:
+        quaternions - (N, 4) array of (w, x, y, z) attitude quaternions
+        velocities - (N, 3) array of velocity vectors
+    """
+    quaternions = np.array(
+        [
+            [
+                state.attitude.q.w,
+                state.attitude.q.x,
+                state.attitude.q.y,
+                state.attitude.q.z,
+            ]
+            for state in states
+        ],
+        dtype=float,
+    ).reshape(-1, 4)
+    velocities = np.array([state.velocity.x for state in states], dtype=float).reshape(
+        -1, 3
+    )
+    return quaternions, velocities
+
+
+def relative_yaw(q_current: np.ndarray, q_future: np.ndarray) -> np.ndarray:
+    """Yaw angle of the future attitude relative to the current one in degrees
+
+    Vectorized equivalent of changing the future attitude into the reference
+    of the current attitude and taking the yaw of the resulting quaternion.
+
+    Args:
+        q_current - (..., 4) array of (w, x, y, z) quaternions
+        q_future - (..., 4) array of (w, x, y, z) quaternions
+    """
+    q_current = np.asarray(q_current, dtype=float)
+    q_future = np.asarray(q_future, dtype=float)
+    w1, x1, y1, z1 = np.moveaxis(q_future, -1, 0)
+    # conjugate of the current attitude
+    w2, x2, y2, z2 = np.moveaxis(q_current, -1, 0)
+    x2, y2, z2 = -x2, -y2, -z2
+
+    # hamilton product: q_future * conj(q_current)
+    w = w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2
+    x = w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2
+    y = w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2
+    z = w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2
+
+    # normalize then extract the yaw of the z-y-x euler sequence
+    norm2 = w**2 + x**2 + y**2 + z**2
+    yaw = np.arctan2(2 * (w * z + x * y), norm2 - 2 * (y**2 + z**2))
+    return 180 / math.pi * yaw
+
+
+def lookahead_indices(n_frames: int, offsets: Sequence[int]) -> np.ndarray:
+    """Build a (frames x offsets) index matrix for a trajectory
+
+    Entries that fall off the end of the trajectory are set to -1.
+    """
+    idx = np.arange(n_frames)[:, None] + np.asarray(offsets, dtype=int)[None, :]
+    idx[(idx < 0) | (idx >= n_frames)] = -1
+    return idx
+
+
+def get_all_meta_actions_batch(
+    quaternions: np.ndarray,
+    velocities: np.ndarray,
+    idx_future: np.ndarray,
+    idx_current: np.ndarray = None,
+) -> List[np.ndarray]:
+    """Evaluate all meta actions over a trajectory with index arrays
+
+    Args:
+        quaternions - (N, 4) array of (w, x, y, z) attitudes along the trajectory
+        velocities - (N, 3) array of velocities along the trajectory
+        idx_future - integer array of trajectory indices for the future state;
+            -1 denotes that no future state is available
+        idx_current - integer array of trajectory indices for the current
+            state with the same shape as idx_future; defaults to the row
+            index, i.e., idx_future is a (frames x horizons) matrix
+
+    Returns:
+        one int8 label array per entry in ACTIONS with the shape of idx_future,
+        filled with ACTION_INVALID where either index is -1
+    """
+    quaternions = np.asarray(quaternions, dtype=float)
+    velocities = np.asarray(velocities, dtype=float)
+    idx_future = np.asarray(idx_future, dtype=int)
+    if idx_current is None:
+        if idx_future.ndim == 1:
+            idx_current = np.arange(idx_future.shape[0])
+        else:
+            idx_current = np.broadcast_to(
+                np.arange(idx_future.shape[0])[:, None], idx_future.shape
+            )
+    idx_current = np.asarray(idx_current, dtype=int)
+    if idx_current.shape != idx_future.shape:
+        raise ValueError(
+            f"Index shapes must match, got {idx_current.shape} and {idx_future.shape}"
+        )
+
+    # evaluate on the valid pairs only
+    valid = (idx_current >= 0) & (idx_future >= 0)
+    i_cur = idx_current[valid]
+    i_fut = idx_future[valid]
+    lateral = np.full(idx_future.shape, ACTION_INVALID, dtype=np.int8)
+    lateral[valid] = Lateral.evaluate_batch(quaternions[i_cur], quaternions[i_fut])
+    longitudinal = np.full(idx_future.shape, ACTION_INVALID, dtype=np.int8)
+    longitudinal[valid] = Longitudinal.evaluate_batch(
+        velocities[i_cur], velocities[i_fut]
+    )
+    return [lateral, longitudinal]
+
+
 class Lateral(int, Enum):
 
     TURN_LEFT = -3
@@ -51,16 +170,52 @@ class Lateral(int, Enum):
         d_yaw = 180 / math.pi * transform_orientation(att_diff.q, "quat", "euler")[2]
         if not positive_is_left:
             d_yaw *= -1
-        if abs(d_yaw) >= thresh_turn:
-            action = Lateral.TURN_LEFT if d_yaw > 0 else Lateral.TURN_RIGHT
-        elif abs(d_yaw) >= thresh_veer:
-            action = Lateral.VEER_LEFT if d_yaw > 0 else Lateral.VEER_RIGHT
-        else:
-            action = Lateral.STRAIGHT
 
-        # TODO: we don't have change lanes yet
+        action = Lateral.classify(
+            d_yaw, thresh_veer=thresh_veer, thresh_turn=thresh_turn
+        )
+        return Lateral(int(action))
 
-        return action
+    @staticmethod
+    def evaluate_batch(
+        q_current: np.ndarray,
+        q_future: np.ndarray,
+        thresh_veer: float = 5,
+        thresh_turn: float = 20,
+        positive_is_left: bool = True,
+    ) -> np.ndarray:
+        """Vectorized version of evaluate over arrays of attitudes
+
+        Args:
+            q_current - (N, 4) array of (w, x, y, z) quaternions at t=now
+            q_future - (N, 4) array of (w, x, y, z) quaternions in the future
+            thresh_veer - threshold for defining a veer in degrees
+            thresh_turn - threshold for defining a turn in degrees
+            positive_is_left - if true, the positive delta yaw is a left turn
+        """
+        d_yaw = relative_yaw(q_current, q_future)
+        if not positive_is_left:
+            d_yaw = -d_yaw
+        return Lateral.classify(d_yaw, thresh_veer=thresh_veer, thresh_turn=thresh_turn)
+
+    @staticmethod
+    def classify(
+        d_yaw: np.ndarray,
+        thresh_veer: float = 5,
+        thresh_turn: float = 20,
+    ) -> np.ndarray:
+        """Map delta yaw angles in degrees (positive is left) to integer labels"""
+        d_yaw = np.asarray(d_yaw, dtype=float)
+        left = d_yaw > 0
+        # TODO: we don't have change lanes yet
+        return np.select(
+            [np.abs(d_yaw) >= thresh_turn, np.abs(d_yaw) >= thresh_veer],
+            [
+                np.where(left, Lateral.TURN_LEFT, Lateral.TURN_RIGHT),
+                np.where(left, Lateral.VEER_LEFT, Lateral.VEER_RIGHT),
+            ],
+            default=Lateral.STRAIGHT,
+        ).astype(np.int8)
 
 
 class Longitudinal(int, Enum):
@@ -89,22 +244,62 @@ class Longitudinal(int, Enum):
         """
 
         # just evaluate the velocity
-        speed_diff = agent_future.velocity.norm() - agent_current.velocity.norm()
+        action = Longitudinal.classify(
+            agent_current.velocity.norm(),
+            agent_future.velocity.norm(),
+            thresh_change=thresh_change,
+            thresh_stop=thresh_stop,
+        )
+        return Longitudinal(int(action))
+
+    @staticmethod
+    def evaluate_batch(
+        v_current: np.ndarray,
+        v_future: np.ndarray,
+        thresh_change: float = 0.25,
+        thresh_stop: float = 0.50,
+    ) -> np.ndarray:
+        """Vectorized version of evaluate over arrays of velocities
+
+        Args:
+            v_current - (N, 3) array of velocities at t=now
+            v_future - (N, 3) array of velocities in the future
+            thresh_change - threshold to determine a change in velocity
+            thresh_stop - threshold on velocity to call "stopped"
+        """
+        return Longitudinal.classify(
+            np.linalg.norm(np.asarray(v_current, dtype=float), axis=-1),
+            np.linalg.norm(np.asarray(v_future, dtype=float), axis=-1),
+            thresh_change=thresh_change,
+            thresh_stop=thresh_stop,
+        )
+
+    @staticmethod
+    def classify(
+        speed_current: np.ndarray,
+        speed_future: np.ndarray,
+        thresh_change: float = 0.25,
+        thresh_stop: float = 0.50,
+    ) -> np.ndarray:
+        """Map current and future speeds to integer labels"""
+        speed_future = np.asarray(speed_future, dtype=float)
+        speed_diff = speed_future - np.asarray(speed_current, dtype=float)
 
         # TODO: determine if we are reversing
 
         # test the resulting speed differential
-        if speed_diff >= thresh_change:
-            action = Longitudinal.ACCEL
-        elif speed_diff <= -thresh_change:
-            if agent_future.velocity.norm() <= thresh_stop:
-                action = Longitudinal.BRAKE_TO_STOP
-            else:
-                action = Longitudinal.DECEL
-        else:
-            action = Longitudinal.MAINTAIN
-
-        return action
+        return np.select(
+            [speed_diff >= thresh_change, speed_diff <= -thresh_change],
+            [
+                Longitudinal.ACCEL,
+                np.where(
+                    speed_future <= thresh_stop,
+                    Longitudinal.BRAKE_TO_STOP,
+                    Longitudinal.DECEL,
+                ),
+            ],
+            default=Longitudinal.MAINTAIN,
+        ).astype(np.int8)
 
 
 ACTIONS = [
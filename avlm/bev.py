@@ -0,0 +1,110 @@
+import math
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from avstack.geometry import Attitude
+from avstack.geometry.transformations import transform_orientation
+
+from avlm.actions import relative_yaw, states_to_arrays
+from avlm.waypoints import reference_affine
+
+
+# forward-facing camera axes (x right, y down, z forward) kept in BEV
+BEV_AXES = [0, 2]
+
+# rotation, translation, and reference attitude that leave states unchanged
+IDENTITY_TRANSFORM = (np.eye(3), np.zeros(3), np.array([1.0, 0.0, 0.0, 0.0]))
+
+
+def reference_transform(reference_from, reference_to) -> Tuple[np.ndarray, ...]:
+    """Get the transform of states from one reference frame to another
+
+    The map is probed from change_reference like reference_affine, with the
+    identity attitude for the rotation of the attitudes.
+
+    Returns:
+        rotation R (3, 3), translation t (3,), and the attitude (w, x, y, z)
+        of reference_to in reference_from, such that positions map to
+        R x + t, velocities to R v, and the yaw of an attitude q is its yaw
+        relative to the returned attitude (see relative_yaw)
+    """
+    R, t = reference_affine(reference_from, reference_to)
+    q_identity = transform_orientation(np.zeros(3), "euler", "quat")
+    q_inv = (
+        Attitude(q_identity, reference_from)
+        .change_reference(reference_to, inplace=False)
+        .q
+    )
+    q_reference = np.array([q_inv.w, -q_inv.x, -q_inv.y, -q_inv.z])
+    return R, t, q_reference
+
+
+def convert_arrays_to_bev(
+    positions: np.ndarray,
+    velocities: np.ndarray,
+    quaternions: np.ndarray,
+    transform: Tuple[np.ndarray, ...] = IDENTITY_TRANSFORM,
+) -> Dict[str, np.ndarray]:
+    """Batched version of convert_object_to_dictionary_bev on stacked states
+
+    Applies a static reference transform (see reference_transform) to all
+    states at once and keeps the BEV axes of the camera frame.
+
+    Arguments:
+        positions - (N, 3) positions in the source frame
+        velocities - (N, 3) velocities in the source frame
+        quaternions - (N, 4) attitudes as (w, x, y, z) in the source frame
+        transform - rotation, translation, and reference attitude
+
+    Returns:
+        columnar arrays of the (N, 2) BEV position and velocity, (N,) speed,
+        and (N,) angle in radians
+    """
+    R, t, q_reference = transform
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    velocities = np.asarray(velocities, dtype=float).reshape(-1, 3)
+    quaternions = np.asarray(quaternions, dtype=float).reshape(-1, 4)
+    angle = relative_yaw(np.broadcast_to(q_reference, quaternions.shape), quaternions)
+    return {
+        "position": (positions @ R.T + t)[:, BEV_AXES],
+        "velocity": (velocities @ R.T)[:, BEV_AXES],
+        "speed": np.linalg.norm(velocities, axis=1),
+        "angle": math.pi / 180 * angle,
+    }
+
+
+def bev_arrays_to_dictionaries(
+    arrays: Dict[str, np.ndarray], IDs: Sequence, classes: Sequence[str]
+) -> List[Dict]:
+    """Split columnar BEV arrays into the per-object dictionaries for JSON"""
+    positions = arrays["position"].tolist()
+    velocities = arrays["velocity"].tolist()
+    speeds = arrays["speed"].tolist()
+    angles = arrays["angle"].tolist()
+    return [
+        {
+            "ID": ID,
+            "class": obj_type,
+            "position": position,
+            "velocity": velocity,
+            "speed": speed,
+            "angle": angle,
+        }
+        for ID, obj_type, position, velocity, speed, angle in zip(
+            IDs, classes, positions, velocities, speeds, angles
+        )
+    ]
+
+
+def convert_states_to_bev(states: Sequence, transform=IDENTITY_TRANSFORM) -> Dict:
+    """Convert object states to columnar BEV arrays with their IDs and classes"""
+    quaternions, velocities = states_to_arrays(states)
+    arrays = convert_arrays_to_bev(
+        np.array([state.position.x for state in states], dtype=float),
+        velocities,
+        quaternions,
+        transform=transform,
+    )
+    arrays["ID"] = [state.ID for state in states]
+    arrays["class"] = [state.obj_type for state in states]
+    return arrays
@@ -0,0 +1,150 @@
+import hashlib
+import inspect
+import json
+import os
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from avlm import actions
+from avlm.generate import GenerationConfig, iter_scene, relabel_agent_frames
+from avlm.instrument import NULL_TIMER, StageTimer
+
+
+# settings that only change the meta action labels
+LABEL_FIELDS = ["dt_action", "int_action"]
+
+
+def _hash(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+def _to_json(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+class SceneCheckpoints:
+    """Per-scene checkpoints of generated frames on disk
+
+    A checkpoint is keyed by a hash of the scene name and the generation
+    settings that require the raw scene data. The settings that only affect
+    the meta action labels, along with the source of avlm.actions, are kept
+    in a separate label hash: a checkpoint with a stale label hash is
+    relabeled from its stored label inputs instead of being regenerated.
+    """
+
+    def __init__(self, folder: str, config: GenerationConfig):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        config_dict = asdict(config)
+        self.data_hash = _hash(
+            {k: v for k, v in config_dict.items() if k not in LABEL_FIELDS}
+        )
+        self.label_hash = _hash(
+            {
+                "config": {k: config_dict[k] for k in LABEL_FIELDS},
+                "actions": inspect.getsource(actions),
+            }
+        )
+
+    def get_path(self, scene: str) -> str:
+        scene_hash = _hash({"scene": scene, "config": self.data_hash})
+        return os.path.join(self.folder, f"{scene}_{scene_hash[:16]}.json")
+
+    def load(self, scene: str) -> Optional[Dict]:
+        """Load the checkpoint of a scene, None if there is no valid one"""
+        path = self.get_path(scene)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                checkpoint = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        if checkpoint.get("data_hash") != self.data_hash:
+            return None
+        return checkpoint
+
+    def save(self, scene: str, agents: List[Dict]):
+        """Save the agents of a scene atomically"""
+        checkpoint = {
+            "scene": scene,
+            "data_hash": self.data_hash,
+            "label_hash": self.label_hash,
+            "agents": agents,
+        }
+        path = self.get_path(scene)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(checkpoint, f, default=_to_json)
+        os.replace(f"{path}.tmp", path)
+
+
+def process_scene_checkpointed(
+    SM,
+    scene: str,
+    config: GenerationConfig,
+    checkpoints: SceneCheckpoints,
+    progress: bool = True,
+    timer: StageTimer = NULL_TIMER,
+) -> Tuple[Optional[List[Dict]], str]:
+    """Get the frames of a scene from its checkpoint or generate them
+
+    Arguments:
+        SM - scene manager
+        scene - name of the scene
+        config - generation settings
+        checkpoints - checkpoint store
+        progress - if true, show progress over frames
+        timer - records the time spent in each stage
+
+    Returns:
+        list of agent entries with "key" and "frames" fields (None if the
+        scene could not be loaded) and the status, one of "cached",
+        "relabeled", "generated", or "skipped"
+    """
+    with timer.stage("checkpoint_load"):
+        checkpoint = checkpoints.load(scene)
+
+    # -- valid checkpoint, or only the labels are stale
+    if checkpoint is not None:
+        agents = checkpoint["agents"]
+        if checkpoint["label_hash"] == checkpoints.label_hash:
+            return agents, "cached"
+        with timer.stage("relabel"):
+            for agent_entry in agents:
+                relabel_agent_frames(
+                    agent_entry["frames"], agent_entry["label_inputs"], config
+                )
+        with timer.stage("checkpoint_save"):
+            checkpoints.save(scene, agents)
+        return agents, "relabeled"
+
+    # -- generate from the raw scene data
+    try:
+        with timer.stage("scene_load"):
+            SD = SM.get_scene_dataset_by_name(scene)
+    except Exception:
+        timer.count("scene_load_failures")
+        return None, "skipped"
+    label_inputs = {}
+    agents = [
+        {"key": agent_key, "frames": list(frames)}
+        for agent_key, frames in iter_scene(
+            SD,
+            scene,
+            config,
+            progress=progress,
+            label_inputs=label_inputs,
+            timer=timer,
+        )
+    ]
+    for agent_entry in agents:
+        agent_entry["label_inputs"] = label_inputs[agent_entry["key"]]
+    with timer.stage("checkpoint_save"):
+        checkpoints.save(scene, agents)
+    return agents, "generated"
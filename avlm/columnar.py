@@ -0,0 +1,246 @@
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from avlm.shards import get_frame_token, iter_frames, load_sidecar
+
+
+EGO_VIEWS = ["global", "local", "diff"]
+EGO_FIELDS = ["position_x", "position_y", "velocity_x", "velocity_y", "speed", "angle"]
+ACTION_FAMILIES = ["Lateral", "Longitudinal"]
+ACTION_SOURCES = ["meta_actions_from_ti", "meta_actions_from_dt"]
+
+
+def get_columnar_path(prefix: str) -> str:
+    return f"{prefix}_columnar"
+
+
+def _column_specs(n_waypoints: int, n_actions: int) -> Dict:
+    """Dtype and per-row shape of each column"""
+    specs = {
+        "frame": ("int64", ()),
+        "timestamp": ("float64", ()),
+        "has_future_in_scene": ("bool", ()),
+        "waypoints_3d": ("float64", (n_waypoints, 3)),
+        "waypoints_3d_valid": ("bool", (n_waypoints,)),
+        "waypoints_pixel": ("float64", (n_waypoints, 2)),
+        "waypoints_pixel_valid": ("bool", (n_waypoints,)),
+        "ego_state": ("float64", (len(EGO_VIEWS), len(EGO_FIELDS))),
+    }
+    for source in ACTION_SOURCES:
+        specs[source] = ("int8", (n_actions, len(ACTION_FAMILIES)))
+        specs[f"{source}_valid"] = ("bool", (n_actions,))
+    return specs
+
+
+def _open_column(path: str, dtype: str, shape: tuple) -> np.ndarray:
+    if int(np.prod(shape)) == 0:
+        # memory maps cannot be empty
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+def write_columnar(prefix: str, path_out: str = None) -> str:
+    """Convert a sharded dataset to fixed-dtype columns for random access
+
+    Every numeric field is stored as an .npy array with one row per frame,
+    with a validity mask where a horizon may be null. Action labels are
+    stored as their integer values from the action table. A dense table over
+    the (scene, agent, frame) keys maps samples to rows in constant time. Tokens
+    are looked up by binary search over the sorted tokens, and the sorted
+    keys are kept for a binary search fallback.
+
+    Arguments:
+        prefix - prefix of the sharded dataset (see avlm.shards)
+        path_out - output folder, defaults to {prefix}_columnar
+
+    Returns:
+        the output folder
+    """
+    sidecar = load_sidecar(prefix)
+    action_table = sidecar["metadata"]["action_table"]
+    n_rows = sidecar["n_frames"]
+    if path_out is None:
+        path_out = get_columnar_path(prefix)
+    os.makedirs(path_out, exist_ok=True)
+
+    columns = None
+    scenes: Dict[str, int] = {}
+    agents: Dict[str, int] = {}
+    scene_ids = np.zeros(n_rows, dtype=np.int64)
+    agent_ids = np.zeros(n_rows, dtype=np.int64)
+    tokens: List[str] = []
+    for i_row, ds_frame in enumerate(iter_frames(prefix)):
+        # horizons are fixed at generation time, so take them from the first frame
+        if columns is None:
+            waypoint_horizons = list(ds_frame["waypoints_3d"].keys())
+            action_horizons = list(ds_frame[ACTION_SOURCES[0]].keys())
+            specs = _column_specs(len(waypoint_horizons), len(action_horizons))
+            columns = {
+                name: _open_column(
+                    os.path.join(path_out, f"{name}.npy"), dtype, (n_rows,) + shape
+                )
+                for name, (dtype, shape) in specs.items()
+            }
+
+        # index entries
+        scene_ids[i_row] = scenes.setdefault(ds_frame["scene"], len(scenes))
+        agent_ids[i_row] = agents.setdefault(str(ds_frame["agent"]), len(agents))
+        tokens.append(get_frame_token(ds_frame))
+
+        # scalar fields
+        columns["frame"][i_row] = ds_frame["frame"]
+        columns["timestamp"][i_row] = ds_frame["timestamp"]
+        columns["has_future_in_scene"][i_row] = ds_frame["has_future_in_scene"]
+
+        # waypoints with null horizons masked out
+        for field in ["waypoints_3d", "waypoints_pixel"]:
+            for i_hor, key in enumerate(waypoint_horizons):
+                point = ds_frame[field][key]
+                columns[f"{field}_valid"][i_row, i_hor] = point is not None
+                columns[field][i_row, i_hor] = point if point is not None else np.nan
+
+        # meta actions as integer labels
+        for source in ACTION_SOURCES:
+            for i_hor, key in enumerate(action_horizons):
+                action = ds_frame[source][key]
+                columns[f"{source}_valid"][i_row, i_hor] = action is not None
+                for i_fam, family in enumerate(ACTION_FAMILIES):
+                    columns[source][i_row, i_hor, i_fam] = (
+                        action_table[family][action[family.lower()]]
+                        if action is not None
+                        else 0
+                    )
+
+        # ego state views
+        for i_view, view in enumerate(EGO_VIEWS):
+            state = ds_frame["ego_state"][view]
+            columns["ego_state"][i_row, i_view] = [
+                *state["position"],
+                *state["velocity"],
+                state["speed"],
+                state["angle"],
+            ]
+
+    if columns is None:
+        raise ValueError(f"Dataset at {prefix} has no frames")
+    for name, column in columns.items():
+        if isinstance(column, np.memmap):
+            column.flush()
+        else:
+            np.save(os.path.join(path_out, f"{name}.npy"), column)
+
+    # sorted lookup from (scene, agent, frame) and from token to row
+    frame_stride = int(columns["frame"].max()) + 1
+    keys = (scene_ids * len(agents) + agent_ids) * frame_stride + columns["frame"]
+    key_order = np.argsort(keys, kind="stable")
+    token_array = np.array(tokens, dtype=np.bytes_)
+    token_order = np.argsort(token_array, kind="stable")
+    # keys are dense in [0, n_scenes * n_agents * frame_stride), so a direct
+    # table of rows makes lookups O(1) at one int64 per possible key
+    key_table = np.full(len(scenes) * len(agents) * frame_stride, -1, dtype=np.int64)
+    key_table[keys] = np.arange(n_rows)
+    index = {
+        "scene_id": scene_ids,
+        "agent_id": agent_ids,
+        "key_sorted": keys[key_order],
+        "key_order": key_order,
+        "key_table": key_table,
+        "token": token_array,
+        "token_sorted": token_array[token_order],
+        "token_order": token_order,
+    }
+    for name, array in index.items():
+        np.save(os.path.join(path_out, f"{name}.npy"), array)
+
+    # schema for the reader
+    schema = {
+        "n_rows": n_rows,
+        "scenes": list(scenes.keys()),
+        "agents": list(agents.keys()),
+        "frame_stride": frame_stride,
+        "waypoint_horizons": waypoint_horizons,
+        "action_horizons": action_horizons,
+        "action_families": ACTION_FAMILIES,
+        "ego_views": EGO_VIEWS,
+        "ego_fields": EGO_FIELDS,
+        "columns": list(columns.keys()),
+        "metadata": sidecar["metadata"],
+    }
+    with open(os.path.join(path_out, "schema.json"), "w") as f:
+        json.dump(schema, f)
+    return path_out
+
+
+class ColumnarDataset:
+    """Random access reader of a columnar dataset through memory maps
+
+    Columns are memory mapped on first access, so reading one sample only
+    touches the bytes of that row. Sample lookups read one entry of the
+    dense key table; datasets written without it fall back to a binary
+    search over the sorted keys. Token lookups are a binary search over the
+    sorted tokens.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "schema.json"), "r") as f:
+            self.schema = json.load(f)
+        self._scene_ids = {scene: i for i, scene in enumerate(self.schema["scenes"])}
+        self._agent_ids = {agent: i for i, agent in enumerate(self.schema["agents"])}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._has_key_table = os.path.exists(os.path.join(path, "key_table.npy"))
+
+    def __len__(self) -> int:
+        return self.schema["n_rows"]
+
+    def __getitem__(self, i_row: int) -> Dict:
+        if not (-len(self) <= i_row < len(self)):
+            raise IndexError(f"Row {i_row} out of range for {len(self)} rows")
+        sample = {name: self.column(name)[i_row] for name in self.schema["columns"]}
+        sample["scene"] = self.schema["scenes"][self.column("scene_id")[i_row]]
+        sample["agent"] = self.schema["agents"][self.column("agent_id")[i_row]]
+        sample["token"] = self.column("token")[i_row].decode()
+        return sample
+
+    def column(self, name: str) -> np.ndarray:
+        """Get a full column as a memory mapped array"""
+        if name not in self._arrays:
+            self._arrays[name] = np.load(
+                os.path.join(self.path, f"{name}.npy"), mmap_mode="r"
+            )
+        return self._arrays[name]
+
+    def row(self, scene: str, agent, frame: int) -> int:
+        """Get the row of a (scene, agent, frame) sample, -1 if not present"""
+        if (scene not in self._scene_ids) or (str(agent) not in self._agent_ids):
+            return -1
+        if not (0 <= frame < self.schema["frame_stride"]):
+            return -1
+        key = (
+            self._scene_ids[scene] * len(self._agent_ids) + self._agent_ids[str(agent)]
+        ) * self.schema["frame_stride"] + frame
+        if self._has_key_table:
+            return int(self.column("key_table")[key])
+        return self._search(self.column("key_sorted"), self.column("key_order"), key)
+
+    def row_by_token(self, token: str) -> int:
+        """Get the row of a sample by its token, -1 if not present"""
+        return self._search(
+            self.column("token_sorted"), self.column("token_order"), token.encode()
+        )
+
+    @staticmethod
+    def _search(values_sorted: np.ndarray, order: np.ndarray, value) -> int:
+        i_sorted = int(np.searchsorted(values_sorted, value))
+        if (i_sorted < len(values_sorted)) and (values_sorted[i_sorted] == value):
+            return int(order[i_sorted])
+        return -1
+
+    def get(self, scene: str, agent, frame: int) -> Dict:
+        i_row = self.row(scene, agent, frame)
+        if i_row < 0:
+            raise KeyError(f"No sample for scene {scene}, agent {agent}, frame {frame}")
+        return self[i_row]
@@ -0,0 +1,251 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from avlm.shards import get_sidecar_path, load_sidecar
+
+
+def load_image(path: str) -> np.ndarray:
+    """Decode an image file to an RGB array"""
+    import cv2
+
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image at {path}")
+    return img[..., ::-1]
+
+
+class _ShardSource:
+    """Random access to the frames of a sharded dataset by line offsets"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.sidecar = load_sidecar(prefix)
+        self._offsets = None
+        self._files = {}
+
+    def layout(self) -> List[Tuple[str, str]]:
+        """Scene name and agent key of every frame, in write order"""
+        return [
+            (scene_entry["name"], agent_entry["key"])
+            for scene_entry in self.sidecar["scenes"]
+            for agent_entry in scene_entry["agents"]
+            for _ in range(agent_entry["n_frames"])
+        ]
+
+    def _build_offsets(self):
+        folder = os.path.dirname(self.prefix)
+        shards, offsets = [], []
+        n_remaining = self.sidecar["n_frames"]
+        for i_shard, shard in enumerate(self.sidecar["shards"]):
+            with open(os.path.join(folder, shard), "rb") as f:
+                offset = 0
+                for line in f:
+                    if n_remaining <= 0:
+                        break
+                    shards.append(i_shard)
+                    offsets.append(offset)
+                    offset += len(line)
+                    n_remaining -= 1
+        self._offsets = (np.array(shards, dtype=int), np.array(offsets, dtype=int))
+
+    def get(self, position: int) -> Dict:
+        if self._offsets is None:
+            self._build_offsets()
+        i_shard = int(self._offsets[0][position])
+        if i_shard not in self._files:
+            shard = self.sidecar["shards"][i_shard]
+            self._files[i_shard] = open(
+                os.path.join(os.path.dirname(self.prefix), shard), "rb"
+            )
+        f = self._files[i_shard]
+        f.seek(int(self._offsets[1][position]))
+        return json.loads(f.readline())
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class _NestedSource:
+    """Frames of a nested JSON dataset, parsed on first access"""
+
+    def __init__(self, file: str):
+        self.file = file
+        self._frames = None
+
+    def _load(self):
+        with open(self.file, "r") as f:
+            dataset = json.load(f)["dataset"]
+        self._frames, self._agent_keys = [], []
+        for scene in dataset.values():
+            for agent_key, agent in scene.items():
+                self._frames.extend(agent.values())
+                self._agent_keys.extend([agent_key] * len(agent))
+
+    def layout(self) -> List[Tuple[str, str]]:
+        if self._frames is None:
+            self._load()
+        return [
+            (ds_frame["scene"], agent_key)
+            for ds_frame, agent_key in zip(self._frames, self._agent_keys)
+        ]
+
+    def get(self, position: int) -> Dict:
+        if self._frames is None:
+            self._load()
+        return self._frames[position]
+
+    def close(self):
+        pass
+
+
+def _agent_key(agent) -> str:
+    agent = str(agent)
+    return agent if agent.startswith("agent_") else f"agent_{agent}"
+
+
+class AVLMDataset:
+    """Lazy, indexed reader of the datasets written by make_dataset
+
+    Each split is read from its shards when available, otherwise from its
+    nested JSON. Shards are indexed by line offsets on first access, so
+    reading a sample parses only that line. Scene and agent filters are
+    resolved from the shard layout without parsing any frame; action
+    filters parse each frame of the selected scenes once.
+
+    Arguments:
+        output_prefix - output prefix passed to make_dataset
+        splits - splits to read, in order
+        scenes - if set, only keep frames from these scene names
+        agents - if set, only keep frames of these agents (e.g., 0 or "agent_0")
+        actions - if set, only keep frames whose meta action at action_horizon
+            matches, e.g., {"lateral": "TURN_LEFT"}
+        action_horizon - horizon key of the action filter
+        action_source - "meta_actions_from_ti" or "meta_actions_from_dt"
+        data_root - folder the image paths are relative to
+    """
+
+    def __init__(
+        self,
+        output_prefix: str,
+        splits: Sequence[str] = ("train",),
+        scenes: Sequence[str] = None,
+        agents: Sequence = None,
+        actions: Dict[str, str] = None,
+        action_horizon: str = "dt_1.00",
+        action_source: str = "meta_actions_from_ti",
+        data_root: str = None,
+    ):
+        self.output_prefix = output_prefix
+        self.splits = list(splits)
+        self.data_root = data_root
+        self._sources = []
+        for split in self.splits:
+            prefix = f"{output_prefix}_{split}"
+            if os.path.exists(get_sidecar_path(prefix)):
+                self._sources.append(_ShardSource(prefix))
+            elif os.path.exists(f"{prefix}.json"):
+                self._sources.append(_NestedSource(f"{prefix}.json"))
+            else:
+                raise FileNotFoundError(
+                    f"No dataset found for split {split} at {prefix}"
+                )
+
+        # index of (source, position) over the selected frames
+        scenes = set(scenes) if scenes is not None else None
+        agents = {_agent_key(agent) for agent in agents} if agents is not None else None
+        index = []
+        for i_source, source in enumerate(self._sources):
+            for position, (scene, agent_key) in enumerate(source.layout()):
+                if (scenes is not None) and (scene not in scenes):
+                    continue
+                if (agents is not None) and (agent_key not in agents):
+                    continue
+                index.append((i_source, position))
+        self._index = np.array(index, dtype=int).reshape(-1, 2)
+        if actions is not None:
+            keep = [
+                self._matches(self[i], actions, action_horizon, action_source)
+                for i in range(len(self))
+            ]
+            self._index = self._index[np.array(keep, dtype=bool)]
+
+    @staticmethod
+    def _matches(ds_frame: Dict, actions: Dict, horizon: str, source: str) -> bool:
+        action = ds_frame[source].get(horizon)
+        if action is None:
+            return False
+        return all(action[family] == label for family, label in actions.items())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, idx: int) -> Dict:
+        if not (-len(self) <= idx < len(self)):
+            raise IndexError(f"Index {idx} out of range for {len(self)} frames")
+        i_source, position = self._index[idx]
+        return self._sources[i_source].get(int(position))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        for source in self._sources:
+            source.close()
+
+    def get_image_paths(self, ds_frame: Dict, cameras: Sequence[str] = None) -> Dict:
+        """Get the image paths of a frame, relative to data_root if set"""
+        paths = ds_frame["image_paths"]
+        if cameras is not None:
+            paths = {camera: paths[camera] for camera in cameras}
+        if self.data_root is not None:
+            paths = {
+                camera: os.path.join(self.data_root, path)
+                for camera, path in paths.items()
+            }
+        return paths
+
+    def iter_with_images(
+        self,
+        prefetch: int = 4,
+        cameras: Sequence[str] = None,
+        loader: Callable[[str], np.ndarray] = load_image,
+        max_workers: int = 4,
+    ) -> Iterator[Tuple[Dict, Dict[str, np.ndarray]]]:
+        """Iterate over frames with their decoded camera images
+
+        The images of the next prefetch frames are decoded in a thread pool
+        while the current frame is consumed.
+
+        Arguments:
+            prefetch - number of frames to decode ahead of the consumer
+            cameras - if set, only decode these cameras
+            loader - function decoding an image file to an array
+            max_workers - number of decoding threads
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = deque()
+
+            def pop_result():
+                ds_frame, futures = pending.popleft()
+                return ds_frame, {
+                    camera: future.result() for camera, future in futures.items()
+                }
+
+            for ds_frame in self:
+                futures = {
+                    camera: pool.submit(loader, path)
+                    for camera, path in self.get_image_paths(ds_frame, cameras).items()
+                }
+                pending.append((ds_frame, futures))
+                if len(pending) > prefetch:
+                    yield pop_result()
+            while pending:
+                yield pop_result()
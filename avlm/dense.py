@@ -0,0 +1,546 @@
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from avstack.geometry import GlobalOrigin3D
+
+from avlm.actions import states_to_arrays
+from avlm.generate import (
+    GenerationConfig,
+    compute_meta_action_labels,
+    convert_meta_actions_to_dictionary,
+    convert_waypoints_to_dictionary,
+)
+from avlm.instrument import NULL_TIMER, StageTimer
+from avlm.shards import _write_json_atomic
+from avlm.timestamps import TimestampIndex
+from avlm.tracks import ObjectTrackIndex
+from avlm.trajectory import AgentTrajectory, frames_to_rows
+from avlm.waypoints import camera_matrix, reference_affine, stan_to_cam_matrix
+
+
+INDEX_FILE = "index.json"
+
+
+def get_dense_path(prefix: str) -> str:
+    return f"{prefix}_dense"
+
+
+def build_dense_agent(
+    SD, agent, config: GenerationConfig, timer: StageTimer = NULL_TIMER
+) -> Dict[str, np.ndarray]:
+    """Build the dense arrays of one agent over a scene
+
+    Everything the waypoints and meta actions at any horizon are derived
+    from is stored once per frame: the agent states, the affine map from
+    the global frame to the agent frame with camera axes, and the camera
+    matrices. Objects are stored once per observation in the global frame.
+
+    Returns:
+        dictionary of array name to array, empty if the agent has no frames
+    """
+    with timer.stage("load_states"):
+        agent_traj = AgentTrajectory.from_scene(SD, agent)
+    if len(agent_traj) == 0:
+        return {}
+    frames = agent_traj.frames.tolist()
+    with timer.stage("timestamps"):
+        timestamps_primary = np.array(
+            [
+                SD.get_timestamp(frame=frame, sensor=config.sensor_primary, agent=agent)
+                for frame in frames
+            ]
+        )
+
+    # per-frame transforms for the waypoints
+    cameras = SD.get_sensor_names_by_type(sensor_type="camera", agent=agent)
+    sensor_primary_name = SD.sensors[config.sensor_primary]
+    # the primary camera comes first, then the others, by name as in generation
+    cameras_projected = [sensor_primary_name]
+    if config.waypoints_all_cameras:
+        cameras_projected += [
+            camera for camera in cameras if camera != sensor_primary_name
+        ]
+    S = stan_to_cam_matrix()
+    waypoint_affine = np.zeros((len(frames), 3, 4))
+    camera_matrices = np.zeros((len(frames), len(cameras_projected), 3, 4))
+    image_paths = []
+    tokens = []
+    with timer.stage("reference_frames"):
+        for i_row, frame in enumerate(frames):
+            agent_reference = agent_traj.states[i_row].as_reference()
+            R, t = reference_affine(GlobalOrigin3D, agent_reference)
+            waypoint_affine[i_row, :, :3] = S @ R
+            waypoint_affine[i_row, :, 3] = S @ t
+            for i_cam, camera in enumerate(cameras_projected):
+                calib = SD.get_calibration(frame=frame, sensor=camera, agent=agent)
+                camera_matrices[i_row, i_cam] = camera_matrix(GlobalOrigin3D, calib)
+            image_paths.append(
+                [
+                    SD.get_sensor_data_filepath(frame=frame, sensor=camera, agent=agent)
+                    for camera in cameras
+                ]
+            )
+            tokens.append(SD._get_sensor_record(frame, sensor_primary_name))
+
+    # object observations once each, in the global frame
+    with timer.stage("objects"):
+        track_index = ObjectTrackIndex.from_scene(
+            SD,
+            frames,
+            timestamps_primary,
+            sensor=config.sensor_primary,
+            agent=agent,
+            reference=GlobalOrigin3D,
+        )
+        tracks = list(track_index.tracks.values())
+        states = [state for track in tracks for state in track.states]
+        object_quaternions, object_velocities = states_to_arrays(states)
+        visible = [
+            (frame, str(ID), distance)
+            for frame in frames
+            for ID, distance in zip(
+                track_index.frame_objects[frame], track_index.frame_distances[frame]
+            )
+        ]
+
+    return {
+        "agent": np.array(agent),
+        "frames": agent_traj.frames,
+        "timestamps": timestamps_primary,
+        "t_max": np.array(agent_traj.timestamps[-1]),
+        "positions": agent_traj.positions,
+        "box_positions": agent_traj.box_positions,
+        "quaternions": agent_traj.quaternions,
+        "velocities": agent_traj.velocities,
+        "box_hwl": agent_traj.box_hwl,
+        "waypoint_affine": waypoint_affine,
+        "camera_matrices": camera_matrices,
+        "cameras_projected": np.array(cameras_projected, dtype=str),
+        "cameras": np.array(cameras, dtype=str),
+        "image_paths": np.array(image_paths, dtype=str).reshape(
+            len(frames), len(cameras)
+        ),
+        "tokens": np.array([token["token"] for token in tokens], dtype=str),
+        "token_timestamps": np.array([token["timestamp"] for token in tokens]),
+        "object_ID": np.array(
+            [str(track.ID) for track in tracks for _ in range(len(track))], dtype=str
+        ),
+        "object_class": np.array([state.obj_type for state in states], dtype=str),
+        "object_frame": np.concatenate(
+            [track.frames for track in tracks] + [np.zeros(0, dtype=int)]
+        ),
+        "object_timestamp": np.concatenate(
+            [track.timestamps for track in tracks] + [np.zeros(0)]
+        ),
+        "object_position": np.array(
+            [state.position.x for state in states], dtype=float
+        ).reshape(-1, 3),
+        "object_velocity": object_velocities,
+        "object_quaternion": object_quaternions,
+        "object_hwl": np.array(
+            [[state.box.h, state.box.w, state.box.l] for state in states], dtype=float
+        ).reshape(-1, 3),
+        "visible_frame": np.array([v[0] for v in visible], dtype=int),
+        "visible_ID": np.array([v[1] for v in visible], dtype=str),
+        "visible_distance": np.array([v[2] for v in visible], dtype=float),
+    }
+
+
+def build_dense_scene(
+    SD, config: GenerationConfig, timer: StageTimer = NULL_TIMER
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """Build the dense arrays of all agents in a scene, keyed by agent key"""
+    with timer.stage("agent_set"):
+        agents = SD.get_agent_set(frame=0)
+    dense = {}
+    for agent in agents:
+        timer.count("agents")
+        arrays = build_dense_agent(SD, agent, config, timer=timer)
+        if arrays:
+            dense[f"agent_{agent}"] = arrays
+            timer.count("frames", len(arrays["frames"]))
+    return dense
+
+
+class DenseWriter:
+    """Writer of the dense trajectory store of one split
+
+    Each scene is one compressed .npz file holding the trajectories of its
+    agents and objects once, instead of one derived copy per frame and
+    horizon. An index file holds the metadata, the generation settings,
+    and the scene/agent layout, and is rewritten after every scene.
+
+    Files:
+        {prefix}_dense/index.json - index
+        {prefix}_dense/scene_00000.npz, ... - one file per scene
+    """
+
+    def __init__(self, prefix: str, metadata: Dict, config: GenerationConfig):
+        if len(prefix) == 0:
+            raise ValueError("Output prefix is empty, provide something like 'dataset'")
+        self.folder = get_dense_path(prefix)
+        os.makedirs(self.folder, exist_ok=True)
+        self.index = {
+            "metadata": metadata,
+            "config": asdict(config),
+            "scenes": [],
+            "complete": False,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+    def write_scene(
+        self, scene_key: str, scene: str, agents: Dict[str, Dict[str, np.ndarray]]
+    ) -> Tuple[int, int]:
+        """Write the dense arrays of a scene (see build_dense_scene)
+
+        Returns:
+            number of agents and number of frames written
+        """
+        file = f"scene_{len(self.index['scenes']):05d}.npz"
+        arrays = {
+            f"{agent_key}/{name}": values
+            for agent_key, agent_arrays in agents.items()
+            for name, values in agent_arrays.items()
+        }
+        path = os.path.join(self.folder, file)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(f"{path}.tmp", path)
+        scene_entry = {
+            "key": scene_key,
+            "name": scene,
+            "file": file,
+            "agents": [
+                {"key": agent_key, "n_frames": len(agent_arrays["frames"])}
+                for agent_key, agent_arrays in agents.items()
+            ],
+        }
+        self.index["scenes"].append(scene_entry)
+        _write_json_atomic(self.index, os.path.join(self.folder, INDEX_FILE))
+        n_frames = sum(entry["n_frames"] for entry in scene_entry["agents"])
+        return len(scene_entry["agents"]), n_frames
+
+    def close(self, complete: bool = True):
+        self.index["complete"] = complete
+        _write_json_atomic(self.index, os.path.join(self.folder, INDEX_FILE))
+
+
+def _horizon_key(dts: Sequence[float], dt_tolerance: float) -> Tuple:
+    return tuple(np.round(np.asarray(dts, dtype=float), 6).tolist()) + (dt_tolerance,)
+
+
+class DenseScene:
+    """Reader of one scene of the dense store with derivation on read
+
+    Waypoints, pixel waypoints, and meta actions are derived from the
+    stored trajectories for any horizons the caller asks for. The results
+    for the most recently requested horizons are memoized per agent, so
+    reading all frames of an agent derives them once.
+
+    Arguments:
+        path - path to the scene .npz file
+        cache_size - number of (agent, kind, horizons) results to keep
+    """
+
+    def __init__(self, path: str, cache_size: int = 8):
+        self.path = path
+        self.cache_size = cache_size
+        self._npz = np.load(path)
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._cache: "OrderedDict[Tuple, object]" = OrderedDict()
+        self.agents = list(
+            dict.fromkeys(name.split("/")[0] for name in self._npz.files)
+        )
+
+    def close(self):
+        self._npz.close()
+
+    def array(self, agent_key: str, name: str) -> np.ndarray:
+        """Get a stored array of an agent, decompressed once"""
+        key = f"{agent_key}/{name}"
+        if key not in self._arrays:
+            self._arrays[key] = self._npz[key]
+        return self._arrays[key]
+
+    def n_frames(self, agent_key: str) -> int:
+        return len(self.array(agent_key, "frames"))
+
+    def _memoized(self, key: Tuple, function):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        value = function()
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def get_rows(
+        self, agent_key: str, dts: Sequence[float], dt_tolerance: float = 0.5
+    ) -> np.ndarray:
+        """Get the (F, H) rows of the agent at each horizon, -1 if none"""
+
+        def compute():
+            frames = self.array(agent_key, "frames")
+            timestamps = self.array(agent_key, "timestamps")
+            ts_index = TimestampIndex(frames, timestamps)
+            frames_horizons = ts_index.horizon_matrix(
+                timestamps,
+                np.asarray(dts, dtype=float),
+                dt_tolerance=dt_tolerance,
+                t_max=float(self.array(agent_key, "t_max")),
+            )
+            return frames_to_rows(frames, frames_horizons)
+
+        key = ("rows", agent_key) + _horizon_key(dts, dt_tolerance)
+        return self._memoized(key, compute)
+
+    def get_waypoints(
+        self, agent_key: str, dts: Sequence[float], dt_tolerance: float = 0.5
+    ) -> Dict[str, np.ndarray]:
+        """Derive the waypoints of all frames of an agent at horizons dts
+
+        Returns:
+            dictionary of the (F, H) validity mask, the (F, H, 3) waypoints
+            in the agent frame with camera axes, and the (F, C, H, 2) pixel
+            waypoints in each projected camera; invalid entries are nan
+        """
+
+        def compute():
+            rows = self.get_rows(agent_key, dts, dt_tolerance)
+            valid = rows >= 0
+            box_positions = self.array(agent_key, "box_positions")[rows]
+            positions = self.array(agent_key, "positions")[rows]
+            box_positions[~valid] = np.nan
+            positions[~valid] = np.nan
+            affine = self.array(agent_key, "waypoint_affine")
+            waypoints_3d = (
+                np.einsum("fij,fhj->fhi", affine[:, :, :3], box_positions)
+                + affine[:, None, :, 3]
+            )
+            matrices = self.array(agent_key, "camera_matrices")
+            pixels = (
+                np.einsum("fcij,fhj->fchi", matrices[..., :3], positions)
+                + matrices[:, :, None, :, 3]
+            )
+            return {
+                "valid": valid,
+                "waypoints_3d": waypoints_3d,
+                "waypoints_pixel": pixels[..., :2] / pixels[..., 2:3],
+            }
+
+        key = ("waypoints", agent_key) + _horizon_key(dts, dt_tolerance)
+        return self._memoized(key, compute)
+
+    def get_meta_actions(
+        self, agent_key: str, dts: Sequence[float], dt_tolerance: float = 0.5
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Derive the meta action labels of all frames of an agent at horizons dts
+
+        Returns:
+            labels relative to t=now and relative to t=t-dt, each as a
+            [lateral, longitudinal] pair of (F, H) int8 arrays
+        """
+
+        def compute():
+            return compute_meta_action_labels(
+                self.array(agent_key, "quaternions"),
+                self.array(agent_key, "velocities"),
+                self.get_rows(agent_key, dts, dt_tolerance),
+            )
+
+        key = ("meta_actions", agent_key) + _horizon_key(dts, dt_tolerance)
+        return self._memoized(key, compute)
+
+    def get_visible_objects(self, agent_key: str, frame: int) -> Dict[str, np.ndarray]:
+        """Get the IDs and sensor distances of the objects observed at a frame"""
+        visible = self.array(agent_key, "visible_frame") == frame
+        return {
+            "ID": self.array(agent_key, "visible_ID")[visible],
+            "distance": self.array(agent_key, "visible_distance")[visible],
+        }
+
+    def get_object_observations(
+        self, agent_key: str, IDs: Sequence[str], t_start: float, t_end: float
+    ) -> Dict[str, np.ndarray]:
+        """Get the global-frame observations of objects within a time window"""
+        select = (
+            np.isin(self.array(agent_key, "object_ID"), np.asarray(IDs, dtype=str))
+            & (self.array(agent_key, "object_timestamp") >= t_start)
+            & (self.array(agent_key, "object_timestamp") <= t_end)
+        )
+        names = [
+            "ID",
+            "class",
+            "frame",
+            "timestamp",
+            "position",
+            "velocity",
+            "quaternion",
+            "hwl",
+        ]
+        return {name: self.array(agent_key, f"object_{name}")[select] for name in names}
+
+    def get_frame(
+        self,
+        agent_key: str,
+        i_row: int,
+        dts_waypoints: Sequence[float],
+        dts_action: Sequence[float],
+        dt_tolerance: float = 0.5,
+    ) -> Dict:
+        """Derive the dataset entry of one frame at the requested horizons
+
+        The entry has the same fields as the generated frames for the meta
+        actions, waypoints, image paths, and tokens.
+        """
+        waypoints = self.get_waypoints(agent_key, dts_waypoints, dt_tolerance)
+        from_ti, from_dt = self.get_meta_actions(agent_key, dts_action, dt_tolerance)
+        rows_action = self.get_rows(agent_key, dts_action, dt_tolerance)
+        valid = waypoints["valid"][i_row]
+        cameras_projected = self.array(agent_key, "cameras_projected").tolist()
+        pixels = {
+            camera: waypoints["waypoints_pixel"][i_row, i_cam][valid]
+            for i_cam, camera in enumerate(cameras_projected)
+        }
+        ds_frame = {
+            "token": {
+                "token": str(self.array(agent_key, "tokens")[i_row]),
+                "timestamp": int(self.array(agent_key, "token_timestamps")[i_row]),
+            },
+            "agent": self.array(agent_key, "agent").item(),
+            "frame": int(self.array(agent_key, "frames")[i_row]),
+            "timestamp": float(self.array(agent_key, "timestamps")[i_row]),
+            "image_paths": dict(
+                zip(
+                    self.array(agent_key, "cameras").tolist(),
+                    self.array(agent_key, "image_paths")[i_row].tolist(),
+                )
+            ),
+            "meta_actions_from_ti": convert_meta_actions_to_dictionary(
+                from_ti[0][i_row], from_ti[1][i_row], dts_action
+            ),
+            "meta_actions_from_dt": convert_meta_actions_to_dictionary(
+                from_dt[0][i_row], from_dt[1][i_row], dts_action
+            ),
+            "has_future_in_scene": bool(np.any(rows_action[i_row] >= 0)),
+            "waypoints_3d": convert_waypoints_to_dictionary(
+                waypoints["waypoints_3d"][i_row][valid], valid, dts_waypoints
+            ),
+            "waypoints_pixel": convert_waypoints_to_dictionary(
+                pixels[cameras_projected[0]], valid, dts_waypoints
+            ),
+        }
+        if len(cameras_projected) > 1:
+            ds_frame["waypoints_pixel_cameras"] = {
+                camera: convert_waypoints_to_dictionary(points, valid, dts_waypoints)
+                for camera, points in pixels.items()
+            }
+        return ds_frame
+
+
+class DenseDataset:
+    """Indexed reader of dense stores with frames derived on read
+
+    Horizons default to the ones of the generation settings but can be any
+    others, with no regeneration. Scene files are opened on first access
+    and kept open.
+
+    Arguments:
+        output_prefix - output prefix passed to make_dataset
+        splits - splits to read, in order
+        dts_waypoints - waypoint horizons in seconds
+        dts_action - meta action horizons in seconds
+        dt_tolerance - tolerance for matching a time to a frame in seconds
+        cache_size - number of memoized results per scene
+    """
+
+    def __init__(
+        self,
+        output_prefix: str,
+        splits: Sequence[str] = ("train",),
+        dts_waypoints: Sequence[float] = None,
+        dts_action: Sequence[float] = None,
+        dt_tolerance: float = None,
+        cache_size: int = 8,
+    ):
+        self.cache_size = cache_size
+        self._folders, self._scene_entries, index = [], [], []
+        config = None
+        for split in splits:
+            folder = get_dense_path(f"{output_prefix}_{split}")
+            path_index = os.path.join(folder, INDEX_FILE)
+            if not os.path.exists(path_index):
+                raise FileNotFoundError(
+                    f"No dense dataset found for split {split} at {folder}"
+                )
+            with open(path_index, "r") as f:
+                split_index = json.load(f)
+            config = GenerationConfig(**split_index["config"])
+            for scene_entry in split_index["scenes"]:
+                i_scene = len(self._scene_entries)
+                self._folders.append(folder)
+                self._scene_entries.append(scene_entry)
+                for i_agent, agent_entry in enumerate(scene_entry["agents"]):
+                    for i_row in range(agent_entry["n_frames"]):
+                        index.append((i_scene, i_agent, i_row))
+        self._index = np.array(index, dtype=int).reshape(-1, 3)
+        config = config if config is not None else GenerationConfig()
+        self.dts_waypoints = (
+            np.asarray(dts_waypoints, dtype=float)
+            if dts_waypoints is not None
+            else config.dts_waypoints
+        )
+        self.dts_action = (
+            np.asarray(dts_action, dtype=float)
+            if dts_action is not None
+            else config.dts_action
+        )
+        self.dt_tolerance = (
+            dt_tolerance if dt_tolerance is not None else config.dt_tolerance
+        )
+        self._scenes: Dict[int, DenseScene] = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def scene(self, i_scene: int) -> DenseScene:
+        if i_scene not in self._scenes:
+            path = os.path.join(
+                self._folders[i_scene], self._scene_entries[i_scene]["file"]
+            )
+            self._scenes[i_scene] = DenseScene(path, cache_size=self.cache_size)
+        return self._scenes[i_scene]
+
+    def __getitem__(self, idx: int) -> Dict:
+        if not (-len(self) <= idx < len(self)):
+            raise IndexError(f"Index {idx} out of range for {len(self)} frames")
+        i_scene, i_agent, i_row = (int(i) for i in self._index[idx])
+        scene_entry = self._scene_entries[i_scene]
+        ds_frame = self.scene(i_scene).get_frame(
+            scene_entry["agents"][i_agent]["key"],
+            i_row,
+            self.dts_waypoints,
+            self.dts_action,
+            dt_tolerance=self.dt_tolerance,
+        )
+        ds_frame["scene"] = scene_entry["name"]
+        return ds_frame
+
+    def __iter__(self) -> Iterator[Dict]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        for scene in self._scenes.values():
+            scene.close()
+        self._scenes = {}
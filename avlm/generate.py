@@ -0,0 +1,652 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+import numpy as np
+from avstack.geometry import GlobalOrigin3D
+from avstack.geometry.transformations import transform_orientation
+from tqdm import tqdm
+
+from avlm.actions import (
+    ACTION_INVALID,
+    ACTIONS,
+    Lateral,
+    Longitudinal,
+    get_all_meta_actions_batch,
+)
+from avlm.bev import (
+    BEV_AXES,
+    IDENTITY_TRANSFORM,
+    bev_arrays_to_dictionaries,
+    convert_arrays_to_bev,
+    reference_transform,
+)
+from avlm.instrument import NULL_TIMER, StageTimer
+from avlm.timestamps import TimestampIndex
+from avlm.tracks import ObjectTrackIndex
+from avlm.trajectory import AgentTrajectory, frames_to_rows
+from avlm.waypoints import compute_waypoints
+
+
+if TYPE_CHECKING:
+    from avstack.environment import ObjectState
+
+
+def convert_object_to_dictionary_bev(obj: "ObjectState") -> Dict:
+    """Converts object to dictionary for JSON storage
+
+    Assumes input data is in forward-facing camera reference frame with coordinates:
+    X: +right
+    Y: +down
+    Z: +forward
+
+    Puts all the data in the BEV reference frame with the coordinates:
+    X: +right
+    Y: +forward
+    Z: marginalized out (was +up)
+    """
+    obj_dict = {
+        "ID": obj.ID,
+        "class": obj.obj_type,
+        "position": list(obj.position.x[[0, 2]]),
+        "velocity": list(obj.velocity.x[[0, 2]]),
+        "speed": obj.velocity.norm(),
+        "angle": transform_orientation(obj.attitude.q, "quat", "euler")[2],
+    }
+    return obj_dict
+
+
+def convert_meta_actions_to_dictionary(
+    lateral: np.ndarray, longitudinal: np.ndarray, dts: np.ndarray
+) -> Dict:
+    """Converts batch meta action labels to dictionary for JSON storage
+
+    Labels equal to ACTION_INVALID (no future state) are stored as null
+    """
+    return {
+        f"dt_{dt:.2f}": (
+            {
+                "lateral": str(Lateral(int(lat))),
+                "longitudinal": str(Longitudinal(int(lon))),
+            }
+            if (lat != ACTION_INVALID) and (lon != ACTION_INVALID)
+            else None
+        )
+        for lat, lon, dt in zip(lateral, longitudinal, dts)
+    }
+
+
+def convert_waypoints_to_dictionary(
+    points: np.ndarray, valid: np.ndarray, dts: np.ndarray
+) -> Dict:
+    """Converts the waypoints at the valid horizons to dictionary for JSON storage
+
+    Horizons without a future state are stored as null
+    """
+    points_iter = iter(points.tolist())
+    return {
+        f"dt_{dt:.2f}": next(points_iter) if is_valid else None
+        for dt, is_valid in zip(dts, valid)
+    }
+
+
+@dataclass(frozen=True)
+class GenerationConfig:
+    """Settings for dataset generation
+
+    Attributes:
+        sensor_primary - sensor for timestamps (assume all cameras are nearly synched)
+        dt_tolerance - tolerance for matching a time to a frame in seconds
+        dt_waypoints - spacing between waypoints in seconds
+        int_waypoints - total time interval of the waypoints in seconds
+        dt_action - spacing between meta actions in seconds
+        int_action - total time interval of the meta actions in seconds
+        dt_traj - spacing between object trajectory points in seconds
+        int_traj - total time interval of the object trajectories in seconds
+        d_key_thresh - threshold for distance to determine if an object is key
+        waypoints_all_cameras - if true, also project the waypoints into every camera
+    """
+
+    sensor_primary: str = "main_camera"
+    dt_tolerance: float = 0.5
+    dt_waypoints: float = 0.5
+    int_waypoints: float = 3
+    dt_action: float = 1
+    int_action: float = 3
+    dt_traj: float = 0.5
+    int_traj: float = 3
+    d_key_thresh: float = 15
+    waypoints_all_cameras: bool = False
+
+    @property
+    def dts_waypoints(self) -> np.ndarray:
+        return np.arange(
+            self.dt_waypoints, self.dt_waypoints + self.int_waypoints, self.dt_waypoints
+        )
+
+    @property
+    def dts_action(self) -> np.ndarray:
+        return np.arange(
+            self.dt_action, self.dt_action + self.int_action, self.dt_action
+        )
+
+    @property
+    def dt_range(self) -> np.ndarray:
+        dt_range = np.arange(-self.dt_traj, self.dt_traj + self.int_traj, self.dt_traj)
+        if 0 not in dt_range:
+            raise RuntimeError("We need to include dt=0 for the current states")
+        return dt_range
+
+
+def build_metadata(dataset: str) -> Dict:
+    """Build the metadata stored alongside the dataset"""
+    return {
+        "action_table": {
+            action.__name__: {str(state): int(state) for state in action}
+            for action in ACTIONS
+        },
+        "reverse_action_table": {
+            action.__name__: {int(state): str(state) for state in action}
+            for action in ACTIONS
+        },
+        "dataset": dataset,
+        "waypoints_3d_reference": "camera",
+    }
+
+
+def get_previous_rows(rows_action: np.ndarray) -> np.ndarray:
+    """Rows at the previous action horizon (t=t-dt), the current row for the first"""
+    rows_now = np.arange(rows_action.shape[0])[:, None]
+    return np.concatenate([rows_now, rows_action[:, :-1]], axis=1)
+
+
+def compute_meta_action_labels(
+    quaternions: np.ndarray,
+    velocities: np.ndarray,
+    rows_action: np.ndarray,
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Get the integer meta action labels for all frames of an agent
+
+    Arguments:
+        quaternions - (N, 4) attitudes of the agent trajectory
+        velocities - (N, 3) velocities of the agent trajectory
+        rows_action - (N, H) trajectory rows at each action horizon, -1 if none
+
+    Returns:
+        labels relative to t=now and relative to t=t-dt, each as one (N, H)
+        int8 array per entry in ACTIONS
+    """
+    from_ti = get_all_meta_actions_batch(quaternions, velocities, rows_action)
+    from_dt = get_all_meta_actions_batch(
+        quaternions, velocities, rows_action, idx_current=get_previous_rows(rows_action)
+    )
+    return from_ti, from_dt
+
+
+def compute_meta_actions(
+    quaternions: np.ndarray,
+    velocities: np.ndarray,
+    rows_action: np.ndarray,
+    dts_action: np.ndarray,
+) -> Tuple[List[Dict], List[Dict]]:
+    """Get the meta action dictionaries for all frames of an agent
+
+    Arguments:
+        quaternions - (N, 4) attitudes of the agent trajectory
+        velocities - (N, 3) velocities of the agent trajectory
+        rows_action - (N, H) trajectory rows at each action horizon, -1 if none
+        dts_action - (H,) action horizons in seconds
+
+    Returns:
+        meta actions relative to t=now and relative to t=t-dt for each frame
+    """
+    from_ti, from_dt = compute_meta_action_labels(quaternions, velocities, rows_action)
+    return (
+        [convert_meta_actions_to_dictionary(*row, dts_action) for row in zip(*from_ti)],
+        [convert_meta_actions_to_dictionary(*row, dts_action) for row in zip(*from_dt)],
+    )
+
+
+def get_label_inputs(SD, agent, config: GenerationConfig) -> Dict:
+    """Load the arrays the meta actions of an agent are computed from
+
+    Only the agent states and timestamps are loaded, so this is much
+    cheaper than generating the frames. Returns None if the agent has no
+    frames.
+    """
+    agent_traj = AgentTrajectory.from_scene(SD, agent)
+    if len(agent_traj) == 0:
+        return None
+    timestamps_primary = np.array(
+        [
+            SD.get_timestamp(frame=frame, sensor=config.sensor_primary, agent=agent)
+            for frame in agent_traj.frames.tolist()
+        ]
+    )
+    return {
+        "frames": agent_traj.frames,
+        "timestamps": timestamps_primary,
+        "t_max": agent_traj.timestamps[-1],
+        "quaternions": agent_traj.quaternions,
+        "velocities": agent_traj.velocities,
+    }
+
+
+def get_action_rows(label_inputs: Dict, config: GenerationConfig) -> np.ndarray:
+    """Get the (N, H) rows of the label inputs at each action horizon, -1 if none"""
+    ts_index = TimestampIndex(label_inputs["frames"], label_inputs["timestamps"])
+    frames_action = ts_index.horizon_matrix(
+        label_inputs["timestamps"],
+        config.dts_action,
+        dt_tolerance=config.dt_tolerance,
+        t_max=label_inputs["t_max"],
+    )
+    return frames_to_rows(label_inputs["frames"], frames_action)
+
+
+def relabel_agent_frames(
+    frames: List[Dict], label_inputs: Dict, config: GenerationConfig
+) -> List[Dict]:
+    """Recompute the meta actions of generated frames in place
+
+    Only the arrays stored in label_inputs by iter_agent_frames are needed,
+    so labels can be regenerated without loading the raw scene data.
+    """
+    if len(frames) == 0:
+        return frames
+    rows_action = get_action_rows(label_inputs, config)
+    from_ti, from_dt = compute_meta_actions(
+        np.asarray(label_inputs["quaternions"], dtype=float),
+        np.asarray(label_inputs["velocities"], dtype=float),
+        rows_action,
+        config.dts_action,
+    )
+    for ds_frame, ti, dt, rows in zip(frames, from_ti, from_dt, rows_action):
+        ds_frame["meta_actions_from_ti"] = ti
+        ds_frame["meta_actions_from_dt"] = dt
+        ds_frame["has_future_in_scene"] = bool(np.any(rows >= 0))
+    return frames
+
+
+def iter_agent_frames(
+    SD,
+    scene: str,
+    agent,
+    config: GenerationConfig,
+    progress: bool = True,
+    label_inputs: Dict = None,
+    timer: StageTimer = NULL_TIMER,
+) -> Iterator[Dict]:
+    """Generate the dataset entries for one agent frame by frame
+
+    Arguments:
+        SD - scene dataset
+        scene - name of the scene
+        agent - agent identifier in the scene
+        config - generation settings
+        progress - if true, show progress over frames
+        label_inputs - if a dictionary, it is filled with the arrays the meta
+            actions are computed from (see relabel_agent_frames)
+        timer - records the time spent in each stage of generation
+    """
+    sensor_primary = config.sensor_primary
+    sensor_primary_name = SD.sensors[sensor_primary]
+    dt_tolerance = config.dt_tolerance
+    dts_waypoints = config.dts_waypoints
+    dts_action = config.dts_action
+    dt_range = config.dt_range
+    offsets_all = np.unique(np.concatenate([dts_waypoints, dts_action, dt_range]))
+    cols_waypoints = np.searchsorted(offsets_all, dts_waypoints)
+    cols_action = np.searchsorted(offsets_all, dts_action)
+    cols_traj = np.searchsorted(offsets_all, dt_range)
+
+    agent_state_last = None
+
+    # load all states of this agent once for the scene
+    with timer.stage("load_states"):
+        agent_traj = AgentTrajectory.from_scene(SD, agent)
+    if len(agent_traj) == 0:
+        return
+
+    timestamps_all = agent_traj.timestamps
+    frames_all = agent_traj.frames.tolist()
+
+    # resolve the frames at all horizons for all frames at once
+    with timer.stage("timestamps"):
+        timestamps_primary = np.array(
+            [
+                SD.get_timestamp(frame=frame, sensor=sensor_primary, agent=agent)
+                for frame in frames_all
+            ]
+        )
+        ts_index = TimestampIndex(frames_all, timestamps_primary)
+        frames_horizons = ts_index.horizon_matrix(
+            timestamps_primary,
+            offsets_all,
+            dt_tolerance=dt_tolerance,
+            t_max=timestamps_all[-1],
+        )
+        frames_waypoints = frames_horizons[:, cols_waypoints]
+        rows_waypoints_all = agent_traj.rows(frames_waypoints)
+        frames_action = frames_horizons[:, cols_action]
+        rows_action_all = agent_traj.rows(frames_action)
+        frames_traj = frames_horizons[:, cols_traj]
+        # object trajectories also exclude times at or before the start
+        t_traj = timestamps_primary[:, None] + dt_range[None, :]
+        frames_traj[t_traj <= timestamps_all[0]] = -1
+        i_traj_current = int(np.flatnonzero(dt_range == 0)[0])
+        i_traj_future = i_traj_current + 1
+
+    # load the objects at all frames once, in a common static frame
+    with timer.stage("objects"):
+        track_index = ObjectTrackIndex.from_scene(
+            SD,
+            frames_all,
+            timestamps_primary,
+            sensor=sensor_primary,
+            agent=agent,
+            reference=GlobalOrigin3D,
+        )
+
+    # get the meta actions for all frames at once
+    with timer.stage("actions"):
+        meta_actions_from_ti_all, meta_actions_from_dt_all = compute_meta_actions(
+            agent_traj.quaternions, agent_traj.velocities, rows_action_all, dts_action
+        )
+    if label_inputs is not None:
+        label_inputs.update(
+            {
+                "frames": agent_traj.frames,
+                "timestamps": timestamps_primary,
+                "t_max": timestamps_all[-1],
+                "quaternions": agent_traj.quaternions,
+                "velocities": agent_traj.velocities,
+            }
+        )
+
+    # convert the ego to the global and static local views for all frames at once
+    with timer.stage("reference_frames"):
+        # -- global frame is with world origin
+        ego_IDs = [state.ID for state in agent_traj.states]
+        ego_classes = [state.obj_type for state in agent_traj.states]
+        ego_global_all = bev_arrays_to_dictionaries(
+            convert_arrays_to_bev(
+                agent_traj.positions,
+                agent_traj.velocities,
+                agent_traj.quaternions,
+                IDENTITY_TRANSFORM,
+            ),
+            ego_IDs,
+            ego_classes,
+        )
+
+        # -- static local frame is with t=0 origin
+        agent_reference_init = (
+            agent_traj.states[0].as_reference().get_static_reference()
+        )
+        ego_local_all = bev_arrays_to_dictionaries(
+            convert_arrays_to_bev(
+                agent_traj.positions,
+                agent_traj.velocities,
+                agent_traj.quaternions,
+                reference_transform(GlobalOrigin3D, agent_reference_init),
+            ),
+            ego_IDs,
+            ego_classes,
+        )
+
+    # loop over frames
+    for i_row, frame in enumerate(tqdm(frames_all, disable=not progress)):
+        #########################################################
+        # NOTE: I am not 100% sure that changing frames
+        # correctly accounts for the velocity and acceleration
+        # fields yet, so this is something to watch out for
+        #########################################################
+
+        # get agent information
+        timestamp = float(timestamps_primary[i_row])
+        with timer.stage("calibration"):
+            cam_calib = SD.get_calibration(
+                frame=frame, sensor=sensor_primary, agent=agent
+            )
+
+        with timer.stage("reference_frames"):
+            agent_state_global = agent_traj.states[i_row]
+            agent_state_reference = agent_state_global.as_reference()
+
+            # -- diff frame is differential from last (TODO: fix this)
+            if agent_state_last is None:
+                agent_state_diff = agent_state_global.change_reference(
+                    agent_state_global.as_reference(),  # change with itself, so should be 0's
+                    inplace=False,
+                )
+            else:
+                agent_state_diff = agent_state_global.change_reference(
+                    agent_state_last.as_reference(),
+                    inplace=False,
+                )
+                agent_state_last = agent_state_global
+
+        # get camera images
+        with timer.stage("image_paths"):
+            camera_sensors = SD.get_sensor_names_by_type(
+                sensor_type="camera", agent=agent
+            )
+            camera_image_paths = {
+                sensor: SD.get_sensor_data_filepath(
+                    frame=frame, sensor=sensor, agent=agent
+                )
+                for sensor in camera_sensors
+            }
+
+        # get future waypoints for all horizons (and cameras) at once
+        with timer.stage("waypoints"):
+            rows_waypoints = rows_waypoints_all[i_row]
+            valid_waypoints = rows_waypoints >= 0
+            # calibrations by camera name, so the primary camera appears once
+            calibs = {sensor_primary_name: cam_calib}
+            if config.waypoints_all_cameras:
+                for sensor in camera_sensors:
+                    if sensor not in calibs:
+                        calibs[sensor] = SD.get_calibration(
+                            frame=frame, sensor=sensor, agent=agent
+                        )
+            waypoints_3d_valid, waypoints_pixel_valid = compute_waypoints(
+                box_positions=agent_traj.box_positions[rows_waypoints[valid_waypoints]],
+                positions=agent_traj.positions[rows_waypoints[valid_waypoints]],
+                reference_from=GlobalOrigin3D,
+                agent_reference=agent_state_reference,
+                calibs=calibs,
+            )
+            waypoints_3d = convert_waypoints_to_dictionary(
+                waypoints_3d_valid, valid_waypoints, dts_waypoints
+            )
+            waypoints_pixel = convert_waypoints_to_dictionary(
+                waypoints_pixel_valid[sensor_primary_name],
+                valid_waypoints,
+                dts_waypoints,
+            )
+
+            # get static camera reference frame (no velocity)
+            static_cam_reference = cam_calib.reference.get_static_reference()
+            cam_transform = reference_transform(GlobalOrigin3D, static_cam_reference)
+
+            # ego path from now through the valid waypoints, in the camera BEV
+            R_cam, t_cam, _ = cam_transform
+            rows_path = np.concatenate([[i_row], rows_waypoints[valid_waypoints]])
+            ego_path_bev = (agent_traj.positions[rows_path] @ R_cam.T + t_cam)[
+                :, BEV_AXES
+            ]
+
+        # get future meta actions -- only where the future is in the dataset
+        meta_actions_from_ti = meta_actions_from_ti_all[i_row]
+        meta_actions_from_dt = meta_actions_from_dt_all[i_row]
+        has_future_in_scene = bool(np.any(rows_action_all[i_row] >= 0))
+
+        # get the objects visible at this frame
+        with timer.stage("object_trajectories"):
+            obj_IDs = track_index.frame_objects[frame]
+
+            # gather the observed states of all objects over the trajectory window
+            tracks = [track_index[ID] for ID in obj_IDs]
+            rows_obj = [track.rows(frames_traj[i_row]) for track in tracks]
+            observed = [
+                track.states[row]
+                for track, rows in zip(tracks, rows_obj)
+                for row in rows.tolist()
+                if row >= 0
+            ]
+
+            # change reference frame of all at once -- static so velocity is absolute
+            states_obj = []
+            if len(observed) > 0:
+                arrays_obj = {
+                    key: np.concatenate(
+                        [
+                            track.arrays()[key][rows[rows >= 0]]
+                            for track, rows in zip(tracks, rows_obj)
+                        ]
+                    )
+                    for key in ["position", "velocity", "quaternion"]
+                }
+                states_obj = bev_arrays_to_dictionaries(
+                    convert_arrays_to_bev(
+                        arrays_obj["position"],
+                        arrays_obj["velocity"],
+                        arrays_obj["quaternion"],
+                        cam_transform,
+                    ),
+                    [state.ID for state in observed],
+                    [state.obj_type for state in observed],
+                )
+            states_obj = iter(states_obj)
+
+            # get the trajectories of all objects from their tracks -- in camera coordinates
+            obj_trajectories = {"previous": {}, "current": {}, "future": {}}
+            for ID, track, rows in zip(obj_IDs, tracks, rows_obj):
+                entries = [
+                    (
+                        None
+                        if row < 0
+                        else {
+                            "frame": int(track.frames[row]),
+                            "timestamp": float(track.timestamps[row]),
+                            "state": next(states_obj),
+                        }
+                    )
+                    for row in rows.tolist()
+                ]
+                obj_trajectories["previous"][ID] = [
+                    entry for entry in entries[:i_traj_current] if entry is not None
+                ]
+                obj_trajectories["current"][ID] = entries[i_traj_current]
+                obj_trajectories["future"][ID] = [
+                    entry for entry in entries[i_traj_future:] if entry is not None
+                ]
+
+            # denote the set of "key" objects
+            key_objects = [
+                ID
+                for ID, distance in zip(obj_IDs, track_index.frame_distances[frame])
+                if distance < config.d_key_thresh
+            ]
+
+        # store all data for this frame
+        with timer.stage("assembly"):
+            token = SD._get_sensor_record(frame, sensor_primary_name)
+            ds_frame = {
+                "token": token,
+                "scene": scene,
+                "agent": agent,
+                "frame": frame,
+                "timestamp": timestamp,
+                "image_paths": camera_image_paths,
+                "meta_actions_from_ti": meta_actions_from_ti,
+                "meta_actions_from_dt": meta_actions_from_dt,
+                "has_future_in_scene": has_future_in_scene,
+                "waypoints_3d": waypoints_3d,
+                "waypoints_pixel": waypoints_pixel,
+                "ego_path_bev": ego_path_bev.tolist(),
+                "object_states": {
+                    "key_objects": key_objects,
+                    "trajectoriers": obj_trajectories,
+                },
+                "ego_state": {
+                    "global": ego_global_all[i_row],
+                    "local": ego_local_all[i_row],
+                    "diff": convert_object_to_dictionary_bev(agent_state_diff),
+                },
+            }
+            if config.waypoints_all_cameras:
+                ds_frame["waypoints_pixel_cameras"] = {
+                    sensor: convert_waypoints_to_dictionary(
+                        pixels, valid_waypoints, dts_waypoints
+                    )
+                    for sensor, pixels in waypoints_pixel_valid.items()
+                }
+
+        timer.count("frames")
+        yield ds_frame
+
+
+def iter_scene(
+    SD,
+    scene: str,
+    config: GenerationConfig,
+    progress: bool = True,
+    label_inputs: Dict = None,
+    timer: StageTimer = NULL_TIMER,
+) -> Iterator[Tuple[str, Iterator[Dict]]]:
+    """Generate the dataset entries for all agents in one scene
+
+    Yields the agent key and a generator over the frames of that agent, so
+    that each frame can be consumed as soon as it is built. The frames of an
+    agent must be consumed before advancing to the next agent. If
+    label_inputs is a dictionary, the label inputs of each agent are stored
+    under its agent key.
+    """
+    with timer.stage("agent_set"):
+        agents = SD.get_agent_set(frame=0)
+    for i_agent, agent in enumerate(agents):
+        if progress:
+            print(f"Processing agent {i_agent+1}/{len(agents)}")
+        agent_key = f"agent_{agent}"
+        agent_inputs = None
+        if label_inputs is not None:
+            agent_inputs = label_inputs.setdefault(agent_key, {})
+        timer.count("agents")
+        yield agent_key, iter_agent_frames(
+            SD,
+            scene,
+            agent,
+            config,
+            progress=progress,
+            label_inputs=agent_inputs,
+            timer=timer,
+        )
+
+
+def process_scene(
+    SD,
+    scene: str,
+    config: GenerationConfig,
+    progress: bool = True,
+    timer: StageTimer = NULL_TIMER,
+) -> Dict:
+    """Generate the dataset entries for all agents in one scene
+
+    Arguments:
+        SD - scene dataset
+        scene - name of the scene
+        config - generation settings
+        progress - if true, show progress over frames
+        timer - records the time spent in each stage of generation
+
+    Returns:
+        dictionary of agent key to the dictionary of frame key to frame data
+    """
+    return {
+        agent_key: {f"frame_{ds_frame['frame']}": ds_frame for ds_frame in frames}
+        for agent_key, frames in iter_scene(
+            SD, scene, config, progress=progress, timer=timer
+        )
+    }
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from avlm.dataset import AVLMDataset
+from avlm.shards import get_frame_token
+
+
+INDEX_FILE = "index.json"
+
+
+@dataclass(frozen=True)
+class ImageCacheConfig:
+    """Settings for the preprocessed image cache
+
+    Attributes:
+        height - height of the cached images in pixels
+        width - width of the cached images in pixels
+        cameras - if set, only cache these cameras
+        shard_size - number of images per memory-mapped shard
+    """
+
+    height: int = 224
+    width: int = 224
+    cameras: Tuple[str, ...] = None
+    shard_size: int = 1024
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (self.height, self.width, 3)
+
+    @property
+    def resize_hash(self) -> str:
+        """Hash of the settings that change the cached pixels"""
+        resize = {"height": self.height, "width": self.width}
+        return hashlib.sha1(json.dumps(resize, sort_keys=True).encode()).hexdigest()
+
+
+def get_source_fingerprint(path: str) -> str:
+    """Fingerprint of a source image file from its size and modification time"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def decode_and_resize(path: str, height: int, width: int) -> np.ndarray:
+    """Decode an image to RGB and resize it to (height, width, 3) uint8"""
+    import cv2
+
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image at {path}")
+    img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(img[..., ::-1])
+
+
+def _decode_to_slots(
+    jobs: List[Tuple[str, str, int]], shape: Tuple[int, int, int]
+) -> int:
+    """Decode images straight into their slots of the shard files"""
+    shards = {}
+    for path, shard_file, slot in jobs:
+        if shard_file not in shards:
+            shards[shard_file] = np.load(shard_file, mmap_mode="r+")
+        shards[shard_file][slot] = decode_and_resize(path, shape[0], shape[1])
+    for shard in shards.values():
+        shard.flush()
+    return len(jobs)
+
+
+def _load_index(cache_dir: str) -> Dict:
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def build_image_cache(
+    datasets: Sequence[AVLMDataset],
+    cache_dir: str,
+    config: ImageCacheConfig = ImageCacheConfig(),
+    workers: int = 4,
+    chunk_size: int = 64,
+) -> Dict:
+    """Decode, resize, and store the camera images of datasets in a cache
+
+    Images are stored as fixed-shape uint8 arrays in .npy shards that are
+    read back through memory maps. An image already in the cache is reused
+    while its source file is unchanged; the whole cache is rebuilt if the
+    resize settings change. Stale images are dropped from the index, and the
+    live images of shards with stale slots are copied to new shards, so
+    that no shard file outlives its images. Decoding runs in a process pool
+    where each worker writes directly into the shards.
+
+    Arguments:
+        datasets - datasets to cache the images of (see avlm.dataset)
+        cache_dir - folder of the cache
+        config - cache settings
+        workers - number of decoding processes
+        chunk_size - number of images per task sent to a worker
+
+    Returns:
+        statistics of the number of images reused, decoded, and copied out
+        of compacted shards
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index = _load_index(cache_dir)
+    if (index is None) or (index["resize_hash"] != config.resize_hash):
+        # new shard names never reuse the names of the files still on disk
+        n_shards_created = index.get("n_shards_created", 0) if index else 0
+        index = {"shards": [], "sources": {}, "n_shards_created": n_shards_created}
+    index.update(
+        {
+            "config": asdict(config),
+            "resize_hash": config.resize_hash,
+            "shape": list(config.shape),
+            "tokens": {},
+        }
+    )
+
+    # map tokens to their image files and find the images to decode
+    sources = {}
+    to_decode = []
+    for dataset in datasets:
+        for ds_frame in dataset:
+            paths = dataset.get_image_paths(ds_frame, cameras=config.cameras)
+            index["tokens"][get_frame_token(ds_frame)] = paths
+            for path in paths.values():
+                if path in sources:
+                    continue
+                fingerprint = get_source_fingerprint(path)
+                entry = index["sources"].get(path)
+                if (entry is not None) and (entry[2] == fingerprint):
+                    sources[path] = entry
+                else:
+                    sources[path] = None
+                    to_decode.append((path, fingerprint))
+    n_reused = len(sources) - len(to_decode)
+
+    # shards are kept only if all their slots are live, the live images of
+    # the others are copied to new shards
+    live = {}
+    for path, entry in sources.items():
+        if entry is not None:
+            live.setdefault(entry[0], []).append(path)
+    shards_old = index["shards"]
+    shards = []
+    i_shard_new = {}
+    to_copy = []
+    for i_shard, paths in sorted(live.items()):
+        shard_file = os.path.join(cache_dir, shards_old[i_shard])
+        if len(paths) == np.load(shard_file, mmap_mode="r").shape[0]:
+            i_shard_new[i_shard] = len(shards)
+            shards.append(shards_old[i_shard])
+        else:
+            to_copy.extend(paths)
+    for path, entry in sources.items():
+        if (entry is not None) and (entry[0] in i_shard_new):
+            sources[path] = [i_shard_new[entry[0]], entry[1], entry[2]]
+
+    # allocate new shards for the images to copy and to decode
+    jobs = []
+    copies = []
+    to_write = [(path, None) for path in to_copy] + to_decode
+    n_shards_created = index.get("n_shards_created", len(shards_old))
+    for i_start in range(0, len(to_write), config.shard_size):
+        i_end = i_start + config.shard_size
+        batch = to_write[i_start:i_end]
+        shard = f"images_{n_shards_created:05d}.npy"
+        n_shards_created += 1
+        shard_file = os.path.join(cache_dir, shard)
+        np.lib.format.open_memmap(
+            shard_file, mode="w+", dtype=np.uint8, shape=(len(batch),) + config.shape
+        ).flush()
+        i_shard = len(shards)
+        shards.append(shard)
+        for slot, (path, fingerprint) in enumerate(batch):
+            if fingerprint is None:
+                i_shard_old, slot_old, fingerprint = sources[path]
+                file_old = os.path.join(cache_dir, shards_old[i_shard_old])
+                copies.append((file_old, slot_old, shard_file, slot))
+            else:
+                jobs.append((path, shard_file, slot))
+            sources[path] = [i_shard, slot, fingerprint]
+
+    # copy the live images of compacted shards
+    opened = {}
+    for file_old, slot_old, shard_file, slot in copies:
+        for file in [file_old, shard_file]:
+            if file not in opened:
+                opened[file] = np.load(file, mmap_mode="r+")
+        opened[shard_file][slot] = opened[file_old][slot_old]
+    for shard in opened.values():
+        shard.flush()
+    opened.clear()
+
+    # decode in parallel, each worker writes into the memory maps
+    chunks = []
+    for i_start in range(0, len(jobs), chunk_size):
+        i_end = i_start + chunk_size
+        chunks.append(jobs[i_start:i_end])
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(_decode_to_slots, chunks, [config.shape] * len(chunks)):
+                pass
+    else:
+        for chunk in chunks:
+            _decode_to_slots(chunk, config.shape)
+
+    # commit the index only once all images are written
+    index["sources"] = sources
+    index["shards"] = shards
+    index["n_shards_created"] = n_shards_created
+    path_index = os.path.join(cache_dir, INDEX_FILE)
+    with open(f"{path_index}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{path_index}.tmp", path_index)
+
+    # then delete the shards the index no longer references
+    for file in os.listdir(cache_dir):
+        if file.startswith("images_") and file.endswith(".npy"):
+            if file not in shards:
+                os.remove(os.path.join(cache_dir, file))
+    return {
+        "images_reused": n_reused,
+        "images_decoded": len(to_decode),
+        "images_compacted": len(to_copy),
+    }
+
+
+class ImageCache:
+    """Reader of the preprocessed image cache through memory maps
+
+    Reading an image is a slice of a memory-mapped shard, with no decoding.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.index = _load_index(cache_dir)
+        if self.index is None:
+            raise FileNotFoundError(f"No image cache at {cache_dir}")
+        self._shards: Dict[int, np.ndarray] = {}
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.index["tokens"]
+
+    def _shard(self, i_shard: int) -> np.ndarray:
+        if i_shard not in self._shards:
+            self._shards[i_shard] = np.load(
+                os.path.join(self.cache_dir, self.index["shards"][i_shard]),
+                mmap_mode="r",
+            )
+        return self._shards[i_shard]
+
+    def get(self, token: str, camera: str) -> np.ndarray:
+        """Get the (height, width, 3) uint8 image of a camera at a frame"""
+        path = self.index["tokens"][token][camera]
+        i_shard, slot, _ = self.index["sources"][path]
+        return self._shard(i_shard)[slot]
+
+    def get_frame(self, ds_frame: Dict) -> Dict[str, np.ndarray]:
+        """Get the images of all cached cameras of a frame"""
+        token = get_frame_token(ds_frame)
+        return {
+            camera: self.get(token, camera) for camera in self.index["tokens"][token]
+        }
@@ -0,0 +1,108 @@
+import json
+import time
+from array import array
+from typing import Dict
+
+import numpy as np
+
+
+class _Stage:
+    """Context manager that appends its elapsed wall time to a buffer"""
+
+    __slots__ = ("durations", "t_start")
+
+    def __init__(self, durations: array):
+        self.durations = durations
+
+    def __enter__(self):
+        self.t_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.durations.append(time.perf_counter() - self.t_start)
+
+
+class StageTimer:
+    """Per-stage wall time and event counters for a generation run
+
+    Every pass through a stage appends its duration to a compact buffer of
+    doubles, so cumulative time, call counts, and latency percentiles can
+    be reported at the end. Timers from worker processes are combined with
+    merge.
+
+    Usage:
+        with timer.stage("load_states"):
+            ...
+        timer.count("scenes_skipped")
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.durations: Dict[str, array] = {}
+        self.counters: Dict[str, int] = {}
+
+    def stage(self, name: str) -> _Stage:
+        if name not in self.durations:
+            self.durations[name] = array("d")
+        return _Stage(self.durations[name])
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other: "StageTimer"):
+        """Add the stages and counters of another timer to this one"""
+        for name, durations in other.durations.items():
+            self.durations.setdefault(name, array("d")).extend(durations)
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def summary(self) -> Dict:
+        """Summarize each stage with its count, total, and latency percentiles"""
+        stages = {}
+        for name, durations in self.durations.items():
+            values = np.frombuffer(durations, dtype=float)
+            stages[name] = {"count": len(values), "total_s": float(values.sum())}
+            if len(values) > 0:
+                p50, p99 = np.percentile(values, [50, 99])
+                stages[name]["mean_ms"] = 1e3 * float(values.mean())
+                stages[name]["p50_ms"] = 1e3 * float(p50)
+                stages[name]["p99_ms"] = 1e3 * float(p99)
+        return {"stages": stages, "counters": dict(self.counters)}
+
+
+class NullTimer(StageTimer):
+    """Timer that records nothing, for runs without instrumentation"""
+
+    enabled = False
+
+    def stage(self, name: str):
+        return _NULL_STAGE
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+    def merge(self, other: StageTimer):
+        pass
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+_NULL_STAGE = _NullStage()
+NULL_TIMER = NullTimer()
+
+
+def write_run_report(file_out: str, timer: StageTimer, **fields):
+    """Write the timer summary and any extra fields to a JSON run report"""
+    report = dict(fields)
+    report.update(timer.summary())
+    with open(file_out, "w") as f:
+        json.dump(report, f, indent=2)
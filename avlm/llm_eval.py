@@ -0,0 +1,427 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from avlm.prompts import PromptTemplate
+
+
+CACHE_FILE = "responses.jsonl"
+
+
+def get_response_key(model: str, prompt: str) -> str:
+    """Cache key of a model response from the model name and the prompt"""
+    return hashlib.sha1(f"{model}\n{prompt}".encode()).hexdigest()
+
+
+class ResponseCache:
+    """Model responses on disk, keyed by the hash of model and prompt
+
+    Responses are appended to a JSON Lines file as each request completes,
+    so an interrupted run loses at most the requests in flight. A partly
+    written last line is ignored on load.
+
+    Arguments:
+        cache_dir - folder of the cache file
+    """
+
+    def __init__(self, cache_dir: str):
+        self.file = os.path.join(cache_dir, CACHE_FILE)
+        self.entries = {}
+        if os.path.exists(self.file):
+            with open(self.file, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry["key"]] = entry["response"]
+        self._f = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, model: str, prompt: str) -> str:
+        return self.entries.get(get_response_key(model, prompt))
+
+    def add(self, model: str, prompts: Sequence[str], responses: Sequence[str]):
+        """Append the responses of a completed request"""
+        if self._f is None:
+            os.makedirs(os.path.dirname(self.file) or ".", exist_ok=True)
+            self._f = open(self.file, "a")
+        for prompt, response in zip(prompts, responses):
+            key = get_response_key(model, prompt)
+            self._f.write(json.dumps({"key": key, "response": response}) + "\n")
+            self.entries[key] = response
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class RetryableError(Exception):
+    """Failure of a request that may succeed when sent again"""
+
+
+class CompletionClient:
+    """Client of an OpenAI-style /v1/completions endpoint
+
+    A request carries a list of prompts, so micro-batches are sent as one
+    call. Blocking HTTP calls run in a thread pool sized to max_connections.
+
+    Arguments:
+        url - base url of the server, e.g., "http://localhost:8000"
+        model - model name sent with each request and used in cache keys
+        max_tokens - maximum number of generated tokens per prompt
+        temperature - sampling temperature
+        api_key - if set, sent as a bearer token
+        timeout - seconds before a request is abandoned
+        max_connections - number of concurrent HTTP calls
+    """
+
+    def __init__(
+        self,
+        url: str,
+        model: str,
+        max_tokens: int = 64,
+        temperature: float = 0.0,
+        api_key: str = None,
+        timeout: float = 60.0,
+        max_connections: int = 32,
+    ):
+        self.url = url.rstrip("/") + "/v1/completions"
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.api_key = api_key
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_connections)
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+    def _post(self, prompts: List[str]) -> List[str]:
+        payload = {
+            "model": self.model,
+            "prompt": prompts,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+        headers = {"Content-Type": "application/json"}
+        if self.api_key is not None:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(), headers=headers
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as err:
+            if (err.code == 429) or (err.code >= 500):
+                raise RetryableError(f"HTTP {err.code} from {self.url}") from err
+            raise
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as err:
+            raise RetryableError(str(err)) from err
+        choices = sorted(body["choices"], key=lambda choice: choice["index"])
+        return [choice["text"] for choice in choices]
+
+    async def complete(self, prompts: List[str]) -> List[str]:
+        """Get the completion of each prompt"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._post, prompts)
+
+
+class EvalStats:
+    """Throughput, latency, and cache statistics of an evaluation run
+
+    The errors of the failed prompts are kept by prompt in errors.
+    """
+
+    def __init__(self):
+        self.n_prompts = 0
+        self.n_cached = 0
+        self.n_failed = 0
+        self.n_requests = 0
+        self.n_retries = 0
+        self.latencies = []
+        self.duration = 0.0
+        self.errors = {}
+
+    def summary(self) -> Dict:
+        latencies = np.asarray(self.latencies, dtype=float)
+        percentiles = (
+            np.percentile(latencies, [50, 90, 99]).tolist()
+            if len(latencies) > 0
+            else [None] * 3
+        )
+        return {
+            "n_prompts": self.n_prompts,
+            "n_cached": self.n_cached,
+            "n_failed": self.n_failed,
+            "n_requests": self.n_requests,
+            "n_retries": self.n_retries,
+            "duration": self.duration,
+            "prompts_per_second": self.n_prompts / max(self.duration, 1e-9),
+            "cache_hit_rate": self.n_cached / max(self.n_prompts, 1),
+            "latency_p50": percentiles[0],
+            "latency_p90": percentiles[1],
+            "latency_p99": percentiles[2],
+        }
+
+
+async def complete_prompts(
+    prompts: Sequence[str],
+    client: CompletionClient,
+    cache: ResponseCache = None,
+    concurrency: int = 16,
+    batch_size: int = 1,
+    max_retries: int = 4,
+    backoff: float = 0.5,
+    stats: EvalStats = None,
+) -> List[str]:
+    """Get the responses to prompts, calling the model only on cache misses
+
+    Distinct uncached prompts are sent in micro-batches of batch_size, with
+    at most concurrency requests in flight. Retryable failures, including a
+    response with the wrong number of completions, are sent again after an
+    exponential backoff with jitter. A non-retryable failure only fails the
+    prompts of its micro-batch, like retries running out: their responses
+    are None and their errors are kept in stats.errors.
+
+    Arguments:
+        prompts - prompts to complete
+        client - model client with an async complete(prompts) method
+        cache - if set, responses are read from and written to it
+        concurrency - maximum number of requests in flight
+        batch_size - number of prompts per request
+        max_retries - number of times a failed request is sent again
+        backoff - seconds before the first retry, doubled at each retry
+        stats - if set, filled with the statistics of the run
+
+    Returns:
+        response of each prompt, None where the request failed
+    """
+    stats = stats if stats is not None else EvalStats()
+    t_start = time.perf_counter()
+    responses = {}
+    pending = []
+    for prompt in dict.fromkeys(prompts):
+        response = cache.get(client.model, prompt) if cache is not None else None
+        if response is not None:
+            responses[prompt] = response
+        else:
+            pending.append(prompt)
+    starts = list(range(0, len(pending), batch_size))
+    stops = starts[1:] + [len(pending)]
+    batches = [pending[start:stop] for start, stop in zip(starts, stops)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_batch(batch: List[str]):
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                stats.n_requests += 1
+                t_request = time.perf_counter()
+                try:
+                    texts = await client.complete(batch)
+                    if len(texts) != len(batch):
+                        raise RetryableError(
+                            f"{len(texts)} completions for {len(batch)} prompts"
+                        )
+                except RetryableError as err:
+                    if attempt == max_retries:
+                        stats.errors.update(dict.fromkeys(batch, str(err)))
+                        return
+                    stats.n_retries += 1
+                    await asyncio.sleep(backoff * 2**attempt * (1 + random.random()))
+                    continue
+                stats.latencies.append(time.perf_counter() - t_request)
+                responses.update(zip(batch, texts))
+                if cache is not None:
+                    cache.add(client.model, batch, texts)
+                return
+
+    outcomes = await asyncio.gather(
+        *[run_batch(batch) for batch in batches], return_exceptions=True
+    )
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, Exception):
+            stats.errors.update(dict.fromkeys(batch, repr(outcome)))
+        elif isinstance(outcome, BaseException):
+            raise outcome
+
+    results = [responses.get(prompt) for prompt in prompts]
+    stats.n_prompts += len(prompts)
+    pending = set(pending)
+    stats.n_cached += sum(prompt not in pending for prompt in prompts)
+    stats.n_failed += sum(result is None for result in results)
+    stats.duration += time.perf_counter() - t_start
+    return results
+
+
+def evaluate_prompt_file(
+    file_prompts: str,
+    file_out: str,
+    template: PromptTemplate,
+    client: CompletionClient,
+    cache_dir: str = None,
+    **kwargs,
+) -> EvalStats:
+    """Get and parse the model responses to a file of prompt records
+
+    Arguments:
+        file_prompts - JSON Lines of prompt records (see render_dataset)
+        file_out - JSON Lines of predictions with the frame token, response,
+            and the fields parsed by the template
+        template - template the prompts were rendered with
+        client - model client
+        cache_dir - if set, responses are cached here (see ResponseCache)
+        kwargs - settings of complete_prompts
+
+    Returns:
+        the statistics of the run
+    """
+    with open(file_prompts, "r") as f:
+        records = [json.loads(line) for line in f]
+    stats = EvalStats()
+    cache = ResponseCache(cache_dir) if cache_dir is not None else None
+    try:
+        responses = asyncio.run(
+            complete_prompts(
+                [record["prompt"] for record in records],
+                client,
+                cache=cache,
+                stats=stats,
+                **kwargs,
+            )
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    folder = os.path.dirname(file_out)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(file_out, "w") as f:
+        for record, response in zip(records, responses):
+            prediction = {"token": record["token"], "response": response}
+            if response is not None:
+                prediction.update(template.parse(response))
+            f.write(json.dumps(prediction) + "\n")
+    return stats
+
+
+class FakeCompletionServer:
+    """Local stand-in for a completions endpoint, for tests and offline runs
+
+    Serves the /v1/completions format of CompletionClient from a background
+    thread on a free port.
+
+    Arguments:
+        respond - function of a prompt to its completion, or a dictionary of
+            prompts to completions with default for the others
+        default - completion of prompts without a response
+        latency - seconds of delay per request
+        failure_rate - fraction of requests answered with HTTP 503
+        seed - seed of the failures
+    """
+
+    def __init__(
+        self,
+        respond: Callable[[str], str] = None,
+        default: str = "",
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        if not callable(respond):
+            responses = respond if respond is not None else {}
+
+            def respond(prompt: str) -> str:
+                return responses.get(prompt, default)
+
+        self.respond = respond
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.n_requests = 0
+        self.n_prompts = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompts = body["prompt"]
+                prompts = [prompts] if isinstance(prompts, str) else prompts
+                with server._lock:
+                    server.n_requests += 1
+                    fail = server._rng.random() < server.failure_rate
+                    if not fail:
+                        server.n_prompts += len(prompts)
+                time.sleep(server.latency)
+                if fail:
+                    self.send_error(503)
+                    return
+                choices = [
+                    {"index": i, "text": server.respond(prompt)}
+                    for i, prompt in enumerate(prompts)
+                ]
+                data = json.dumps({"model": body["model"], "choices": choices}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self) -> "FakeCompletionServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def get_oracle_responses(file_prompts: str) -> Dict[str, str]:
+    """Map each prompt of a prompt file to its target, for a fake server"""
+    with open(file_prompts, "r") as f:
+        records = [json.loads(line) for line in f]
+    return {record["prompt"]: record["target"] for record in records}
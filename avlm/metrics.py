@@ -0,0 +1,432 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from avlm.columnar import (
+    ACTION_FAMILIES,
+    ACTION_SOURCES,
+    EGO_FIELDS,
+    EGO_VIEWS,
+    ColumnarDataset,
+)
+
+
+# waypoint fields of the predictions and the ground truth column they match
+WAYPOINT_FIELDS = {
+    "waypoints_3d": ("waypoints_3d", [0, 1, 2]),
+    "waypoints_bev": ("waypoints_3d", [0, 2]),
+    "waypoints_pixel": ("waypoints_pixel", [0, 1]),
+}
+
+# edges of the ego speed buckets in m/s
+SPEED_EDGES = (2.0, 5.0, 10.0, 15.0)
+
+
+class GroundTruth:
+    """Ground truth of one or more columnar datasets as aligned arrays
+
+    The columns are read once, so predictions of many files are aligned to
+    the same arrays by a sorted token index (see rows).
+
+    Arguments:
+        paths - folders of columnar datasets (see avlm.columnar), e.g., one
+            per split, with the same horizons
+    """
+
+    def __init__(self, paths: Sequence[str]):
+        if len(paths) == 0:
+            raise ValueError("No columnar datasets given for the ground truth")
+        datasets = [ColumnarDataset(path) for path in paths]
+        schema = datasets[0].schema
+        for dataset in datasets[1:]:
+            for key in ["waypoint_horizons", "action_horizons"]:
+                if dataset.schema[key] != schema[key]:
+                    raise ValueError(f"Columnar datasets differ in their {key}")
+        self.waypoint_horizons = schema["waypoint_horizons"]
+        self.action_horizons = schema["action_horizons"]
+
+        # classes of each action family, ordered by their label value
+        action_table = schema["metadata"]["action_table"]
+        self.class_names = {}
+        self.class_values = {}
+        for family in ACTION_FAMILIES:
+            names = sorted(action_table[family], key=action_table[family].get)
+            self.class_names[family] = names
+            self.class_values[family] = np.array(
+                [action_table[family][name] for name in names]
+            )
+
+        def concatenate(name: str) -> np.ndarray:
+            return np.concatenate([np.asarray(ds.column(name)) for ds in datasets])
+
+        self.tokens = concatenate("token")
+        self.scenes = np.concatenate(
+            [
+                np.asarray(ds.schema["scenes"])[np.asarray(ds.column("scene_id"))]
+                for ds in datasets
+            ]
+        )
+        i_view, i_speed = EGO_VIEWS.index("global"), EGO_FIELDS.index("speed")
+        self.speed = concatenate("ego_state")[:, i_view, i_speed]
+        self.waypoints = {}
+        for field in ["waypoints_3d", "waypoints_pixel"]:
+            self.waypoints[field] = concatenate(field)
+            self.waypoints[f"{field}_valid"] = concatenate(f"{field}_valid")
+        self.actions = {}
+        for source in ACTION_SOURCES:
+            labels = concatenate(source)
+            valid = concatenate(f"{source}_valid")
+            self.actions[source] = {
+                family: np.where(
+                    valid,
+                    self._to_class_index(family, labels[..., i_family]),
+                    -1,
+                )
+                for i_family, family in enumerate(ACTION_FAMILIES)
+            }
+        self._token_order = np.argsort(self.tokens, kind="stable")
+        self._tokens_sorted = self.tokens[self._token_order]
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def _to_class_index(self, family: str, values: np.ndarray) -> np.ndarray:
+        values_sorted = self.class_values[family]
+        index = np.searchsorted(values_sorted, values)
+        index = np.minimum(index, len(values_sorted) - 1)
+        return np.where(values_sorted[index] == values, index, -1)
+
+    def rows(self, tokens: Sequence[str]) -> np.ndarray:
+        """Get the rows of frame tokens, -1 where a token is not present"""
+        tokens = np.array([str(token).encode() for token in tokens], dtype=np.bytes_)
+        if len(tokens) == 0:
+            return np.zeros(0, dtype=int)
+        i_sorted = np.searchsorted(self._tokens_sorted, tokens)
+        i_sorted = np.minimum(i_sorted, len(self) - 1)
+        found = self._tokens_sorted[i_sorted] == tokens
+        return np.where(found, self._token_order[i_sorted], -1)
+
+
+def load_predictions(file: str, gt: GroundTruth) -> Dict:
+    """Load a prediction file into arrays aligned with the ground truth
+
+    Each line is a JSON object with the frame "token" and any of the fields
+    "meta_actions" (horizon to lateral and longitudinal names), and
+    "waypoints_3d", "waypoints_bev", or "waypoints_pixel" (horizon to
+    point), as written by avlm.llm_eval. Missing horizons and points are NaN,
+    missing or unknown actions are the class index n_classes.
+
+    Returns:
+        the ground truth rows, the number of unmatched predictions, and the
+        prediction arrays of the fields and horizons present in the file
+    """
+    with open(file, "r") as f:
+        predictions = [json.loads(line) for line in f if line.strip()]
+    rows = gt.rows([prediction["token"] for prediction in predictions])
+    matched = rows >= 0
+    predictions = [p for p, keep in zip(predictions, matched.tolist()) if keep]
+    n_pred = len(predictions)
+    arrays = {"rows": rows[matched], "n_unmatched": int((~matched).sum())}
+
+    # waypoints, NaN where missing
+    i_waypoint = {horizon: i for i, horizon in enumerate(gt.waypoint_horizons)}
+    for field, (_, dims) in WAYPOINT_FIELDS.items():
+        if not any(field in prediction for prediction in predictions):
+            continue
+        points = np.full((n_pred, len(gt.waypoint_horizons), len(dims)), np.nan)
+        for i_pred, prediction in enumerate(predictions):
+            for horizon, point in prediction.get(field, {}).items():
+                if (horizon in i_waypoint) and (point is not None):
+                    points[i_pred, i_waypoint[horizon]] = point
+        arrays[field] = points
+
+    # meta actions, n_classes where missing or unknown
+    if any("meta_actions" in prediction for prediction in predictions):
+        i_action = {horizon: i for i, horizon in enumerate(gt.action_horizons)}
+        class_index = {
+            family: {name: i for i, name in enumerate(names)}
+            for family, names in gt.class_names.items()
+        }
+        has_horizon = np.zeros(len(gt.action_horizons), dtype=bool)
+        actions = {
+            family: np.full(
+                (n_pred, len(gt.action_horizons)), len(gt.class_names[family])
+            )
+            for family in ACTION_FAMILIES
+        }
+        for i_pred, prediction in enumerate(predictions):
+            for horizon, action in prediction.get("meta_actions", {}).items():
+                if horizon not in i_action:
+                    continue
+                has_horizon[i_action[horizon]] = True
+                if action is None:
+                    continue
+                for family in ACTION_FAMILIES:
+                    actions[family][i_pred, i_action[horizon]] = class_index[
+                        family
+                    ].get(action.get(family.lower()), len(gt.class_names[family]))
+        arrays["meta_actions"] = actions
+        arrays["action_horizons"] = np.flatnonzero(has_horizon)
+    return arrays
+
+
+def get_slices(
+    gt: GroundTruth,
+    rows: np.ndarray,
+    speed_edges: Sequence[float] = SPEED_EDGES,
+    action_source: str = ACTION_SOURCES[0],
+    action_horizon: int = 0,
+) -> Dict[str, Tuple[np.ndarray, List[str]]]:
+    """Group ids and names of the predictions for each slicing
+
+    Slices are all predictions, the scene, the ego speed bucket, and the
+    ground truth class of each action family at one horizon. Predictions
+    without a ground truth action are left out of the action slices.
+
+    Returns:
+        slicing name to (group id of each prediction, -1 if left out, and
+        the group names)
+    """
+    slices = {"all": (np.zeros(len(rows), dtype=int), ["all"])}
+    scene_names, scene_ids = np.unique(gt.scenes[rows], return_inverse=True)
+    slices["scene"] = (scene_ids.reshape(-1), scene_names.tolist())
+    edges = [0.0, *speed_edges, np.inf]
+    slices["speed"] = (
+        np.digitize(gt.speed[rows], speed_edges),
+        [f"{lo:g}-{hi:g}" for lo, hi in zip(edges[:-1], edges[1:])],
+    )
+    for family in ACTION_FAMILIES:
+        slices[family.lower()] = (
+            gt.actions[action_source][family][rows, action_horizon],
+            gt.class_names[family],
+        )
+    return slices
+
+
+def _waypoint_metrics(
+    errors: np.ndarray, gt_valid: np.ndarray, groups: np.ndarray, n_groups: int
+) -> Dict[str, np.ndarray]:
+    """Counts, ADE, and FDE per horizon and group from (N, H) errors
+
+    The count is of the frames with a ground truth waypoint, and missing of
+    those without a predicted one (NaN error), which are left out of the
+    errors. FDE at a horizon averages the error at that horizon. ADE at a
+    horizon averages the mean error up to that horizon, over the predictions
+    valid at all horizons up to it.
+    """
+    keep = groups >= 0
+    errors, gt_valid, groups = errors[keep], gt_valid[keep], groups[keep]
+    valid = gt_valid & np.isfinite(errors)
+    errors = np.where(valid, errors, 0.0)
+    n_horizons = errors.shape[1]
+    valid_prefix = np.cumprod(valid, axis=1).astype(bool)
+    mean_prefix = np.cumsum(errors, axis=1) / np.arange(1, n_horizons + 1)
+
+    def grouped_sum(values: np.ndarray) -> np.ndarray:
+        sums = np.zeros((n_groups, n_horizons))
+        np.add.at(sums, groups, values)
+        return sums
+
+    count = grouped_sum(gt_valid.astype(float))
+    count_fde = grouped_sum(valid.astype(float))
+    count_ade = grouped_sum(valid_prefix.astype(float))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fde = grouped_sum(errors) / count_fde
+        ade = grouped_sum(np.where(valid_prefix, mean_prefix, 0.0)) / count_ade
+    return {"count": count, "missing": count - count_fde, "ade": ade, "fde": fde}
+
+
+def _action_metrics(
+    gt_classes: Dict[str, np.ndarray],
+    pred_classes: Dict[str, np.ndarray],
+    groups: np.ndarray,
+    n_groups: int,
+    n_classes: Dict[str, int],
+) -> Dict[str, np.ndarray]:
+    """Confusion matrices and joint accuracy per group at one horizon
+
+    Confusion matrices have one column more than classes, for predictions
+    that are missing or unknown. Frames without a ground truth action are
+    left out. Missing counts the frames where any family is missing or
+    unknown.
+    """
+    keep = (groups >= 0) & (gt_classes[ACTION_FAMILIES[0]] >= 0)
+    groups = groups[keep]
+    metrics = {}
+    correct_all = np.ones(len(groups), dtype=bool)
+    missing = np.zeros(len(groups), dtype=bool)
+    for family in ACTION_FAMILIES:
+        gt, pred = gt_classes[family][keep], pred_classes[family][keep]
+        n_rows, n_cols = n_classes[family], n_classes[family] + 1
+        cells = (groups * n_rows + gt) * n_cols + pred
+        metrics[family] = np.bincount(
+            cells, minlength=n_groups * n_rows * n_cols
+        ).reshape(n_groups, n_rows, n_cols)
+        correct_all &= gt == pred
+        missing |= pred == n_classes[family]
+    metrics["count"] = np.bincount(groups, minlength=n_groups)
+    metrics["missing"] = np.bincount(groups, weights=missing, minlength=n_groups)
+    metrics["joint_correct"] = np.bincount(
+        groups, weights=correct_all, minlength=n_groups
+    )
+    return metrics
+
+
+def _summarize_confusion(confusion: np.ndarray, names: List[str]) -> Dict:
+    n_classes = len(names)
+    count = confusion.sum(axis=1)
+    correct = np.diag(confusion[:, :n_classes])
+    return {
+        "accuracy": float(correct.sum() / max(count.sum(), 1)),
+        "per_class_accuracy": {
+            name: float(correct[i] / count[i]) if count[i] > 0 else None
+            for i, name in enumerate(names)
+        },
+        "confusion": confusion.tolist(),
+    }
+
+
+def _to_list(values: np.ndarray) -> List:
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def compute_metrics(
+    gt: GroundTruth,
+    arrays: Dict,
+    speed_edges: Sequence[float] = SPEED_EDGES,
+    slice_source: str = ACTION_SOURCES[0],
+    slice_horizon: int = 0,
+) -> Dict:
+    """Compute the metrics of aligned predictions for every slice
+
+    Arguments:
+        gt - ground truth arrays
+        arrays - aligned predictions (see load_predictions)
+        speed_edges - edges of the ego speed buckets in m/s
+        slice_source - action source of the action class slices
+        slice_horizon - index of the action horizon of the action class slices
+
+    Returns:
+        slicing name to group name to the metrics of the group: per
+        waypoint field, the count, missing count, ADE, and FDE per horizon
+        (pixels for waypoints_pixel); per action source and horizon, the
+        count, missing count, accuracy, per-class accuracy, and confusion
+        matrix (rows are the ground truth, the last column is a missing
+        prediction) of each family, and the joint accuracy of both families.
+        Counts are of the frames with a ground truth and missing of those
+        without a prediction. Missing actions count as wrong, while missing
+        waypoints are left out of ADE and FDE, which have no error for them.
+    """
+    rows = arrays["rows"]
+    slices = get_slices(gt, rows, speed_edges, slice_source, slice_horizon)
+    results = {
+        slicing: {name: {} for name in names} for slicing, (_, names) in slices.items()
+    }
+
+    for field, (gt_field, dims) in WAYPOINT_FIELDS.items():
+        if field not in arrays:
+            continue
+        target = gt.waypoints[gt_field][rows][..., dims]
+        errors = np.linalg.norm(arrays[field] - target, axis=2)
+        gt_valid = gt.waypoints[f"{gt_field}_valid"][rows]
+        for slicing, (groups, names) in slices.items():
+            metrics = _waypoint_metrics(errors, gt_valid, groups, len(names))
+            for i_group, name in enumerate(names):
+                results[slicing][name][field] = {
+                    "horizons": gt.waypoint_horizons,
+                    "count": metrics["count"][i_group].astype(int).tolist(),
+                    "missing": metrics["missing"][i_group].astype(int).tolist(),
+                    "ade": _to_list(metrics["ade"][i_group]),
+                    "fde": _to_list(metrics["fde"][i_group]),
+                }
+
+    if "meta_actions" in arrays:
+        n_classes = {family: len(names) for family, names in gt.class_names.items()}
+        for source in ACTION_SOURCES:
+            for i_hor in arrays["action_horizons"].tolist():
+                horizon = gt.action_horizons[i_hor]
+                gt_classes = {
+                    family: labels[rows, i_hor]
+                    for family, labels in gt.actions[source].items()
+                }
+                pred_classes = {
+                    family: labels[:, i_hor]
+                    for family, labels in arrays["meta_actions"].items()
+                }
+                for slicing, (groups, names) in slices.items():
+                    metrics = _action_metrics(
+                        gt_classes, pred_classes, groups, len(names), n_classes
+                    )
+                    for i_group, name in enumerate(names):
+                        count = int(metrics["count"][i_group])
+                        entry = {
+                            "count": count,
+                            "missing": int(metrics["missing"][i_group]),
+                            "joint_accuracy": (
+                                float(metrics["joint_correct"][i_group] / count)
+                                if count > 0
+                                else None
+                            ),
+                        }
+                        for family in ACTION_FAMILIES:
+                            entry[family.lower()] = _summarize_confusion(
+                                metrics[family][i_group], gt.class_names[family]
+                            )
+                        results[slicing][name].setdefault(source, {})[horizon] = entry
+    return results
+
+
+def evaluate_file(file: str, gt: GroundTruth, **kwargs) -> Dict:
+    """Load a prediction file and compute its metrics (see compute_metrics)"""
+    arrays = load_predictions(file, gt)
+    return {
+        "n_predictions": len(arrays["rows"]) + arrays["n_unmatched"],
+        "n_unmatched": arrays["n_unmatched"],
+        "metrics": compute_metrics(gt, arrays, **kwargs),
+    }
+
+
+# ground truth of each worker process, loaded once by the initializer
+_WORKER_GT = None
+
+
+def _init_worker(paths: Sequence[str]):
+    global _WORKER_GT
+    _WORKER_GT = GroundTruth(paths)
+
+
+def _evaluate_worker(file: str, kwargs: Dict) -> Dict:
+    return evaluate_file(file, _WORKER_GT, **kwargs)
+
+
+def evaluate_files(
+    files: Sequence[str], paths: Sequence[str], workers: int = 1, **kwargs
+) -> Dict[str, Dict]:
+    """Evaluate many prediction files against the same ground truth
+
+    Each worker process reads the ground truth columns once and evaluates
+    whole files.
+
+    Arguments:
+        files - prediction files
+        paths - folders of the columnar ground truth
+        workers - number of processes, 1 runs serially
+        kwargs - settings of compute_metrics
+
+    Returns:
+        file to its evaluation (see evaluate_file)
+    """
+    if (workers > 1) and (len(files) > 1):
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(files)),
+            initializer=_init_worker,
+            initargs=(list(paths),),
+        ) as pool:
+            futures = {
+                file: pool.submit(_evaluate_worker, file, kwargs) for file in files
+            }
+            return {file: future.result() for file, future in futures.items()}
+    gt = GroundTruth(paths)
+    return {file: evaluate_file(file, gt, **kwargs) for file in files}
@@ -0,0 +1,512 @@
+import abc
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Callable, ClassVar, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from avlm.dataset import AVLMDataset
+from avlm.shards import get_frame_token
+
+
+# registered prompt templates by name (see register_template)
+TEMPLATES = {}
+
+
+def register_template(cls):
+    """Class decorator adding a prompt template to TEMPLATES under its name"""
+    if cls.name in TEMPLATES:
+        raise ValueError(f"A prompt template named {cls.name} already exists")
+    TEMPLATES[cls.name] = cls
+    return cls
+
+
+def get_template(name: str, **kwargs) -> "PromptTemplate":
+    """Build a registered template, ignoring settings it does not have"""
+    cls = TEMPLATES[name]
+    names = {field.name for field in fields(cls)}
+    return cls(**{key: value for key, value in kwargs.items() if key in names})
+
+
+def get_frame_hash(ds_frame: Dict, frame_fields: Sequence[str] = None) -> str:
+    """Hash of the content of a frame, or of only some of its fields"""
+    if frame_fields is not None:
+        ds_frame = {field: ds_frame.get(field) for field in frame_fields}
+    return hashlib.sha1(
+        json.dumps(ds_frame, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def get_prompt_key(template: "PromptTemplate", ds_frame: Dict) -> str:
+    """Cache key of a rendered prompt from the template and the frame fields
+    it reads"""
+    frame_hash = get_frame_hash(ds_frame, template.frame_fields)
+    key = f"{template.fingerprint}:{frame_hash}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class PromptTemplate(abc.ABC):
+    """Base of the templates turning a dataset frame into a prompt and target
+
+    Subclasses set a unique name, add their settings as fields with defaults,
+    implement render, parse, and frame_fields, and are registered with
+    register_template. Bump the version whenever render changes so that
+    cached prompts are not reused. Only the frame fields read by render are
+    hashed in the cache keys, so render must not read any other field.
+
+    Attributes:
+        cameras - cameras whose image paths go with the prompt
+    """
+
+    name: ClassVar[str] = "base"
+    version: ClassVar[int] = 1
+    cameras: Tuple[str, ...] = ("CAM_FRONT",)
+
+    @property
+    @abc.abstractmethod
+    def frame_fields(self) -> Tuple[str, ...]:
+        """Top-level fields of the frame read by render"""
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of the template name, version, settings, and frame fields"""
+        settings = {
+            "name": self.name,
+            "version": self.version,
+            "frame_fields": list(self.frame_fields),
+            **asdict(self),
+        }
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    @abc.abstractmethod
+    def render(self, ds_frame: Dict) -> Dict[str, str]:
+        """Render a frame to a "prompt" and "target", or None to skip it"""
+
+    @abc.abstractmethod
+    def parse(self, text: str) -> Dict:
+        """Parse a model answer into prediction fields, empty if unparseable
+
+        Fields follow the ground truth of the frames, keyed by horizon, e.g.,
+        {"meta_actions": {"dt_1.00": {"lateral": ..., "longitudinal": ...}}}
+        """
+
+
+def describe_ego(ds_frame: Dict) -> str:
+    """Describe the ego speed and heading from its global state"""
+    ego = ds_frame["ego_state"]["global"]
+    return (
+        f"The ego vehicle is driving at {ego['speed']:.1f} m/s"
+        f" with heading {np.degrees(ego['angle']):.0f} degrees."
+    )
+
+
+def get_key_object_states(ds_frame: Dict, max_objects: int = None) -> List[Dict]:
+    """Current BEV states of the key objects of a frame, nearest first"""
+    current = ds_frame["object_states"]["trajectoriers"]["current"]
+    states = []
+    for ID in ds_frame["object_states"]["key_objects"]:
+        # object IDs are string keys once the frame went through JSON
+        entry = current.get(str(ID), current.get(ID))
+        if entry is not None:
+            states.append(entry["state"])
+    states.sort(key=lambda state: float(np.linalg.norm(state["position"])))
+    return states[:max_objects] if max_objects is not None else states
+
+
+def describe_objects(ds_frame: Dict, max_objects: int = None) -> str:
+    """Describe the key objects in the BEV frame of the front camera"""
+    states = get_key_object_states(ds_frame, max_objects)
+    if len(states) == 0:
+        return "There are no nearby objects."
+    lines = ["Nearby objects (x to the right, y forward, in meters):"]
+    for state in states:
+        x, y = state["position"]
+        lines.append(
+            f"- {state['class']} at ({x:.1f}, {y:.1f}) moving at"
+            f" {state['speed']:.1f} m/s"
+        )
+    return "\n".join(lines)
+
+
+@register_template
+@dataclass(frozen=True)
+class MetaActionTemplate(PromptTemplate):
+    """Ask for the meta action of the ego at one horizon
+
+    Attributes:
+        horizon - horizon key of the target action, e.g., "dt_1.00"
+        source - "meta_actions_from_ti" or "meta_actions_from_dt"
+        max_objects - at most this many key objects are described
+    """
+
+    name: ClassVar[str] = "meta_action"
+    horizon: str = "dt_1.00"
+    source: str = "meta_actions_from_ti"
+    max_objects: int = 10
+
+    @property
+    def frame_fields(self) -> Tuple[str, ...]:
+        return ("ego_state", "object_states", self.source)
+
+    def render(self, ds_frame: Dict) -> Dict[str, str]:
+        action = ds_frame[self.source].get(self.horizon)
+        if action is None:
+            return None
+        seconds = float(self.horizon.split("_")[1])
+        prompt = "\n".join(
+            [
+                describe_ego(ds_frame),
+                describe_objects(ds_frame, self.max_objects),
+                f"What will the ego do over the next {seconds:g} seconds?"
+                " Answer with a lateral and a longitudinal action.",
+            ]
+        )
+        target = f"lateral: {action['lateral']}, longitudinal: {action['longitudinal']}"
+        return {"prompt": prompt, "target": target}
+
+    def parse(self, text: str) -> Dict:
+        lateral = re.search(r"lateral:\s*([A-Za-z_]+)", text)
+        longitudinal = re.search(r"longitudinal:\s*([A-Za-z_]+)", text)
+        if (lateral is None) or (longitudinal is None):
+            return {}
+        action = {
+            "lateral": lateral.group(1).upper(),
+            "longitudinal": longitudinal.group(1).upper(),
+        }
+        return {"meta_actions": {self.horizon: action}}
+
+
+@register_template
+@dataclass(frozen=True)
+class WaypointTemplate(PromptTemplate):
+    """Ask for the future BEV waypoints of the ego
+
+    Frames are skipped unless all horizons have a waypoint.
+
+    Attributes:
+        horizons - horizon keys of the target waypoints
+        max_objects - at most this many key objects are described
+    """
+
+    name: ClassVar[str] = "waypoints"
+    horizons: Tuple[str, ...] = ("dt_1.00", "dt_2.00", "dt_3.00")
+    max_objects: int = 10
+
+    @property
+    def frame_fields(self) -> Tuple[str, ...]:
+        return ("ego_state", "object_states", "waypoints_3d")
+
+    def render(self, ds_frame: Dict) -> Dict[str, str]:
+        waypoints = [ds_frame["waypoints_3d"].get(horizon) for horizon in self.horizons]
+        if any(waypoint is None for waypoint in waypoints):
+            return None
+        seconds = ", ".join(
+            f"{float(horizon.split('_')[1]):g}" for horizon in self.horizons
+        )
+        prompt = "\n".join(
+            [
+                describe_ego(ds_frame),
+                describe_objects(ds_frame, self.max_objects),
+                f"Where will the ego be in {seconds} seconds?"
+                " Answer with one (x, y) position in meters per time.",
+            ]
+        )
+        target = " ".join(
+            f"({waypoint[0]:.1f}, {waypoint[2]:.1f})" for waypoint in waypoints
+        )
+        return {"prompt": prompt, "target": target}
+
+    def parse(self, text: str) -> Dict:
+        number = r"(-?\d+(?:\.\d*)?)"
+        points = re.findall(rf"\(\s*{number}\s*,\s*{number}\s*\)", text)
+        if len(points) != len(self.horizons):
+            return {}
+        return {
+            "waypoints_bev": {
+                horizon: [float(x), float(y)]
+                for horizon, (x, y) in zip(self.horizons, points)
+            }
+        }
+
+
+def load_token_counter(tokenizer: str) -> Callable[[str], int]:
+    """Load a local tokenizer as a function counting the tokens of a text
+
+    Only tokenizers already on disk are used (no downloads).
+
+    Returns:
+        the counting function, or None if transformers or the tokenizer is
+        not available
+    """
+    if tokenizer is None:
+        return None
+    try:
+        from transformers import AutoTokenizer
+
+        tok = AutoTokenizer.from_pretrained(tokenizer, local_files_only=True)
+    except (ImportError, OSError, ValueError):
+        return None
+    return lambda text: len(tok.encode(text, add_special_tokens=False))
+
+
+class PromptCache:
+    """Rendered prompts on disk, keyed by the hash of template and frame
+
+    Entries of a template are appended to one JSON Lines file named by its
+    fingerprint, so changing a template or a frame leads to new keys.
+
+    Arguments:
+        cache_dir - folder of the cache files
+        template - template whose entries are read and written
+    """
+
+    def __init__(self, cache_dir: str, template: PromptTemplate):
+        self.file = os.path.join(cache_dir, f"{template.fingerprint}.jsonl")
+        self.entries = {}
+        if os.path.exists(self.file):
+            with open(self.file, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]] = entry["rendered"]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def add(self, entries: Dict[str, Dict]):
+        """Append new rendered prompts by key"""
+        if len(entries) == 0:
+            return
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        with open(self.file, "a") as f:
+            for key, rendered in entries.items():
+                if key not in self.entries:
+                    f.write(json.dumps({"key": key, "rendered": rendered}) + "\n")
+                    self.entries[key] = rendered
+
+
+class PromptStats:
+    """Mergeable length statistics of the rendered prompts and targets
+
+    Lengths are kept in characters and words, and in tokens when a token
+    counter is given to add.
+    """
+
+    FIELDS = ("prompt", "target")
+
+    def __init__(self):
+        self.n_frames = 0
+        self.n_skipped = 0
+        self.n_cached = 0
+        self.lengths = {
+            field: {"chars": [], "words": [], "tokens": []} for field in self.FIELDS
+        }
+
+    def add(self, rendered: Dict[str, str], count_tokens: Callable = None):
+        for field in self.FIELDS:
+            text = rendered[field]
+            self.lengths[field]["chars"].append(len(text))
+            self.lengths[field]["words"].append(len(text.split()))
+            if count_tokens is not None:
+                self.lengths[field]["tokens"].append(count_tokens(text))
+
+    def merge(self, other: "PromptStats"):
+        self.n_frames += other.n_frames
+        self.n_skipped += other.n_skipped
+        self.n_cached += other.n_cached
+        for field in self.FIELDS:
+            for unit, lengths in other.lengths[field].items():
+                self.lengths[field][unit].extend(lengths)
+
+    def summary(self) -> Dict:
+        """Count, mean, percentiles, and max of each length"""
+        summary = {
+            "n_frames": self.n_frames,
+            "n_rendered": self.n_frames - self.n_skipped,
+            "n_skipped": self.n_skipped,
+            "cache_hit_rate": self.n_cached / max(self.n_frames - self.n_skipped, 1),
+        }
+        for field in self.FIELDS:
+            summary[field] = {}
+            for unit, lengths in self.lengths[field].items():
+                if len(lengths) == 0:
+                    continue
+                lengths = np.asarray(lengths)
+                summary[field][unit] = {
+                    "mean": float(lengths.mean()),
+                    "p50": float(np.percentile(lengths, 50)),
+                    "p95": float(np.percentile(lengths, 95)),
+                    "max": int(lengths.max()),
+                    "total": int(lengths.sum()),
+                }
+        return summary
+
+
+def render_frames(
+    frames: Iterable[Dict],
+    template: PromptTemplate,
+    cache: Dict[str, Dict] = None,
+    count_tokens: Callable[[str], int] = None,
+    stats: PromptStats = None,
+    new_entries: Dict[str, Dict] = None,
+) -> Iterator[Dict]:
+    """Render frames to prompt records, reusing cached prompts
+
+    Arguments:
+        frames - dataset frames
+        template - template rendering each frame
+        cache - rendered prompts by key (see get_prompt_key), or a PromptCache
+        count_tokens - if set, token counts are added to the statistics
+        stats - if set, filled with the length statistics
+        new_entries - if set, filled with the prompts rendered on a cache miss
+
+    Yields:
+        records with the frame token, scene, agent, frame, image paths of the
+        template cameras, prompt, and target
+    """
+    for ds_frame in frames:
+        if stats is not None:
+            stats.n_frames += 1
+        key = get_prompt_key(template, ds_frame)
+        rendered = cache.get(key) if cache is not None else None
+        if rendered is not None:
+            if stats is not None:
+                stats.n_cached += 1
+        else:
+            rendered = template.render(ds_frame)
+            if new_entries is not None:
+                new_entries[key] = rendered
+        if rendered is None:
+            if stats is not None:
+                stats.n_skipped += 1
+            continue
+        if stats is not None:
+            stats.add(rendered, count_tokens)
+        yield {
+            "token": get_frame_token(ds_frame),
+            "scene": ds_frame["scene"],
+            "agent": ds_frame["agent"],
+            "frame": ds_frame["frame"],
+            "image_paths": {
+                camera: ds_frame["image_paths"][camera]
+                for camera in template.cameras
+                if camera in ds_frame["image_paths"]
+            },
+            **rendered,
+        }
+
+
+# dataset, template, cache, and token counter for each worker process
+_WORKER_STATE = None
+
+
+def _init_worker(
+    output_prefix: str,
+    splits: Sequence[str],
+    dataset_kwargs: Dict,
+    template: PromptTemplate,
+    cache_dir: str,
+    tokenizer: str,
+):
+    global _WORKER_STATE
+    _WORKER_STATE = {
+        "dataset": AVLMDataset(output_prefix, splits=splits, **dataset_kwargs),
+        "template": template,
+        "cache": PromptCache(cache_dir, template) if cache_dir is not None else None,
+        "count_tokens": load_token_counter(tokenizer),
+    }
+
+
+def _render_chunk(start: int, stop: int) -> Tuple[List[str], Dict, PromptStats]:
+    """Render a range of frames to JSON lines in a worker"""
+    dataset = _WORKER_STATE["dataset"]
+    stats = PromptStats()
+    new_entries = {}
+    lines = [
+        json.dumps(record)
+        for record in render_frames(
+            (dataset[idx] for idx in range(start, stop)),
+            _WORKER_STATE["template"],
+            cache=_WORKER_STATE["cache"],
+            count_tokens=_WORKER_STATE["count_tokens"],
+            stats=stats,
+            new_entries=new_entries,
+        )
+    ]
+    return lines, new_entries, stats
+
+
+def render_dataset(
+    output_prefix: str,
+    template: PromptTemplate,
+    file_out: str,
+    splits: Sequence[str] = ("train",),
+    cache_dir: str = None,
+    tokenizer: str = None,
+    workers: int = 1,
+    chunk_size: int = 1024,
+    dataset_kwargs: Dict = None,
+) -> PromptStats:
+    """Render the frames of a dataset to prompt records in JSON Lines
+
+    Frames are split into chunks of consecutive indices, each rendered by a
+    worker process that reads its frames from the dataset directly. Records
+    are written in dataset order.
+
+    Arguments:
+        output_prefix - output prefix passed to make_dataset
+        template - template rendering each frame
+        file_out - JSON Lines file of the prompt records
+        splits - splits to render, in order
+        cache_dir - if set, rendered prompts are cached here (see PromptCache)
+        tokenizer - if set, name or path of a local tokenizer for token counts
+        workers - number of processes, 1 runs serially
+        chunk_size - number of frames per task
+        dataset_kwargs - filters passed to AVLMDataset (e.g., scenes, agents)
+
+    Returns:
+        the length statistics of the rendered prompts
+    """
+    dataset_kwargs = dataset_kwargs or {}
+    initargs = (output_prefix, splits, dataset_kwargs, template, cache_dir, tokenizer)
+    dataset = AVLMDataset(output_prefix, splits=splits, **dataset_kwargs)
+    n_frames = len(dataset)
+    dataset.close()
+    starts = list(range(0, n_frames, chunk_size))
+    stops = [min(start + chunk_size, n_frames) for start in starts]
+
+    stats = PromptStats()
+    new_entries = {}
+    folder = os.path.dirname(file_out)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(file_out, "w") as f:
+        if workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=initargs
+            ) as pool:
+                results = pool.map(_render_chunk, starts, stops)
+                for lines, entries, chunk_stats in results:
+                    f.writelines(line + "\n" for line in lines)
+                    new_entries.update(entries)
+                    stats.merge(chunk_stats)
+        else:
+            _init_worker(*initargs)
+            for start, stop in zip(starts, stops):
+                lines, entries, chunk_stats = _render_chunk(start, stop)
+                f.writelines(line + "\n" for line in lines)
+                new_entries.update(entries)
+                stats.merge(chunk_stats)
+            _WORKER_STATE["dataset"].close()
+    if cache_dir is not None:
+        PromptCache(cache_dir, template).add(
+            {key: rendered for key, rendered in new_entries.items() if rendered}
+        )
+    return stats
@@ -0,0 +1,50 @@
+from argparse import ArgumentParser, Namespace
+
+from avapi.nuscenes import nuScenesManager
+
+from avlm.synthetic import SyntheticManager
+
+
+def build_scene_manager(dataset: str, dataset_path: str, version: str):
+    """Build the scene manager for a dataset"""
+    if dataset.lower() == "nuscenes":
+        SM = nuScenesManager(
+            data_dir=dataset_path,
+            split=version,
+        )
+    elif dataset.lower() == "synthetic":
+        SM = SyntheticManager()
+    elif dataset.lower() == "carla":
+        raise NotImplementedError
+    else:
+        raise NotImplementedError(dataset.lower())
+    return SM
+
+
+def check_scene_arguments(parser: ArgumentParser, args: Namespace):
+    """Exit with a usage error if the dataset path or version are missing
+
+    Only nuScenes needs them, synthetic scenes are built in memory.
+    """
+    if args.dataset.lower() != "nuscenes":
+        return
+    missing = [
+        name for name in ["dataset_path", "version"] if getattr(args, name) is None
+    ]
+    if missing:
+        parser.error(f"{' and '.join(missing)} required with --dataset nuscenes")
+
+
+# scene manager of each worker process, built once by init_worker_scene_manager
+_WORKER_SM = None
+
+
+def init_worker_scene_manager(dataset: str, dataset_path: str, version: str):
+    """Pool initializer building the scene manager of a worker process once"""
+    global _WORKER_SM
+    _WORKER_SM = build_scene_manager(dataset, dataset_path, version)
+
+
+def get_worker_scene_manager():
+    """Get the scene manager of this process (see init_worker_scene_manager)"""
+    return _WORKER_SM
@@ -0,0 +1,190 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, Tuple
+
+from avlm.instrument import NULL_TIMER, StageTimer
+
+
+def get_sidecar_path(prefix: str) -> str:
+    return f"{prefix}_metadata.json"
+
+
+def get_shard_path(prefix: str, i_shard: int) -> str:
+    return f"{prefix}_{i_shard:05d}.jsonl"
+
+
+def get_frame_token(ds_frame: Dict) -> str:
+    """Get the token string of a frame
+
+    The token may be stored as the full sensor record with a "token" field
+    """
+    token = ds_frame["token"]
+    if isinstance(token, dict):
+        token = token["token"]
+    return str(token)
+
+
+def _write_json_atomic(obj, file_out: str):
+    file_tmp = f"{file_out}.tmp"
+    with open(file_tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(file_tmp, file_out)
+
+
+class DatasetWriter:
+    """Streaming writer of dataset frames to JSON Lines shards
+
+    Each frame is written as one line as soon as it is built, so memory
+    does not grow with the number of scenes. Shards are rolled over once
+    they exceed max_shard_bytes. A small sidecar file holds the metadata,
+    the shard list, and the scene/agent layout so that the nested JSON
+    format can be reassembled from the shards. The sidecar is rewritten
+    after every scene; frames beyond its count belong to an unfinished
+    scene and are ignored by the readers.
+
+    Files:
+        {prefix}_metadata.json - sidecar
+        {prefix}_00000.jsonl, ... - shards with one frame per line
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        metadata: Dict,
+        max_shard_bytes: int = 2**28,
+        timer: StageTimer = NULL_TIMER,
+    ):
+        if len(prefix) == 0:
+            raise ValueError("Output prefix is empty, provide something like 'dataset'")
+        if len(os.path.dirname(prefix)) > 0:
+            os.makedirs(os.path.dirname(prefix), exist_ok=True)
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.timer = timer
+        self.sidecar = {
+            "metadata": metadata,
+            "shards": [],
+            "scenes": [],
+            "n_frames": 0,
+            "complete": False,
+        }
+        self._n_frames_written = 0
+        self._file = None
+        self._shard_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+    def _open_shard(self):
+        if self._file is not None:
+            self._file.close()
+        shard = get_shard_path(self.prefix, len(self.sidecar["shards"]))
+        self._file = open(shard, "w")
+        self._shard_bytes = 0
+        self.sidecar["shards"].append(os.path.basename(shard))
+
+    def _write_frame(self, ds_frame: Dict):
+        with self.timer.stage("serialize"):
+            line = json.dumps(ds_frame) + "\n"
+        if (self._file is None) or (
+            self.max_shard_bytes and (self._shard_bytes >= self.max_shard_bytes)
+        ):
+            self._open_shard()
+        with self.timer.stage("write"):
+            self._file.write(line)
+        self._shard_bytes += len(line)
+        self._n_frames_written += 1
+
+    def write_scene(
+        self,
+        scene_key: str,
+        scene: str,
+        agents: Iterable[Tuple[str, Iterable[Dict]]],
+    ) -> Tuple[int, int]:
+        """Write all frames of a scene
+
+        Arguments:
+            scene_key - key of the scene in the nested format (e.g., "scene_0")
+            scene - name of the scene
+            agents - iterable of agent key and iterable of frames of that agent
+
+        Returns:
+            number of agents and number of frames written
+        """
+        scene_entry = {"key": scene_key, "name": scene, "agents": []}
+        n_frames = 0
+        for agent_key, frames in agents:
+            agent_entry = {"key": agent_key, "n_frames": 0}
+            for ds_frame in frames:
+                self._write_frame(ds_frame)
+                agent_entry["n_frames"] += 1
+            scene_entry["agents"].append(agent_entry)
+            n_frames += agent_entry["n_frames"]
+
+        # commit the scene to the sidecar
+        if self._file is not None:
+            self._file.flush()
+        self.sidecar["scenes"].append(scene_entry)
+        self.sidecar["n_frames"] = self._n_frames_written
+        _write_json_atomic(self.sidecar, get_sidecar_path(self.prefix))
+        return len(scene_entry["agents"]), n_frames
+
+    def close(self, complete: bool = True):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.sidecar["complete"] = complete
+        _write_json_atomic(self.sidecar, get_sidecar_path(self.prefix))
+
+
+def load_sidecar(prefix: str) -> Dict:
+    with open(get_sidecar_path(prefix), "r") as f:
+        return json.load(f)
+
+
+def iter_frames(prefix: str) -> Iterator[Dict]:
+    """Iterate over the frames of a sharded dataset in write order"""
+    sidecar = load_sidecar(prefix)
+    folder = os.path.dirname(prefix)
+    n_remaining = sidecar["n_frames"]
+    for shard in sidecar["shards"]:
+        with open(os.path.join(folder, shard), "r") as f:
+            for line in f:
+                if n_remaining <= 0:
+                    return
+                yield json.loads(line)
+                n_remaining -= 1
+
+
+def assemble_nested_json(prefix: str, file_out: str):
+    """Assemble the nested scene -> agent -> frame JSON from the shards
+
+    The output is identical to json.dump of the nested dictionary but is
+    streamed so that memory does not grow with the size of the dataset.
+    """
+    sidecar = load_sidecar(prefix)
+    frames = iter_frames(prefix)
+    with open(file_out, "w") as f:
+        f.write('{"dataset": {')
+        for i_scene, scene_entry in enumerate(sidecar["scenes"]):
+            if i_scene > 0:
+                f.write(", ")
+            f.write(json.dumps(scene_entry["key"]) + ": {")
+            for i_agent, agent_entry in enumerate(scene_entry["agents"]):
+                if i_agent > 0:
+                    f.write(", ")
+                f.write(json.dumps(agent_entry["key"]) + ": {")
+                for i_frame in range(agent_entry["n_frames"]):
+                    ds_frame = next(frames)
+                    if i_frame > 0:
+                        f.write(", ")
+                    f.write(json.dumps(f"frame_{ds_frame['frame']}") + ": ")
+                    json.dump(ds_frame, f)
+                f.write("}")
+            f.write("}")
+        f.write('}, "metadata": ')
+        json.dump(sidecar["metadata"], f)
+        f.write("}")
@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+@dataclass(frozen=True)
+class KeyObjectCriterion:
+    """Rule for selecting key objects from the objects of a frame
+
+    All set fields must hold for an object to be selected. Selected objects
+    are ordered by their distance to the ego.
+
+    Attributes:
+        radius - only objects closer than this to the ego in meters
+        k - at most this many objects, the nearest first
+        classes - only objects of these classes
+        corridor - only objects within this distance in meters of the ego
+            path (see BEVIndex.path)
+    """
+
+    radius: float = None
+    k: int = None
+    classes: Tuple[str, ...] = None
+    corridor: float = None
+
+
+def distance_to_path(points: np.ndarray, path: np.ndarray) -> np.ndarray:
+    """Distance of each point to a polyline
+
+    Arguments:
+        points - (N, 2) positions
+        path - (P, 2) vertices of the polyline, P >= 1
+
+    Returns:
+        (N,) distance of each point to its closest segment
+    """
+    path = np.asarray(path, dtype=float).reshape(-1, 2)
+    if len(path) == 1:
+        return np.linalg.norm(points - path[0], axis=1)
+    start, direction = path[:-1], np.diff(path, axis=0)
+    length2 = np.maximum((direction**2).sum(axis=1), 1e-12)
+    offsets = points[:, None, :] - start[None, :, :]
+    t = np.clip((offsets * direction[None]).sum(axis=2) / length2, 0.0, 1.0)
+    closest = start[None] + t[..., None] * direction[None]
+    return np.linalg.norm(points[:, None, :] - closest, axis=2).min(axis=1)
+
+
+class BEVIndex:
+    """KD-tree over the BEV positions of the objects in a frame
+
+    Positions follow the BEV convention of convert_object_to_dictionary_bev
+    (x to the right, y forward, ego at the origin). Queries are batched over
+    centers or radii so that many selections share one tree.
+
+    Arguments:
+        positions - (N, 2) BEV positions of the objects
+        IDs - (N,) object identifiers, defaults to the row index
+        classes - (N,) object classes
+        path - (P, 2) BEV positions of the ego path for corridor queries,
+            e.g., the future waypoints, starting at the ego
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        IDs: Sequence = None,
+        classes: Sequence[str] = None,
+        path: np.ndarray = None,
+    ):
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        n_objects = len(self.positions)
+        self.IDs = list(IDs) if IDs is not None else list(range(n_objects))
+        self.classes = np.asarray(
+            classes if classes is not None else [""] * n_objects, dtype=str
+        )
+        self.path = (
+            np.asarray(path, dtype=float).reshape(-1, 2)
+            if path is not None
+            else np.zeros((1, 2))
+        )
+        self.tree = cKDTree(self.positions)
+        self.distances = np.linalg.norm(self.positions, axis=1)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @classmethod
+    def from_frame(cls, ds_frame: Dict, path: np.ndarray = None) -> "BEVIndex":
+        """Build the index of the current objects of a dataset frame
+
+        The objects are in the BEV of the static primary camera frame, and
+        so is the ego path of the frame ("ego_path_bev"), the default path.
+        The waypoints of a frame are in the agent frame, so a path given
+        instead must be converted to the camera BEV first. Frames without an
+        ego path default to the camera origin.
+        """
+        current = ds_frame["object_states"]["trajectoriers"]["current"]
+        states = [entry["state"] for entry in current.values() if entry is not None]
+        if path is None:
+            path = ds_frame.get("ego_path_bev")
+        return cls(
+            positions=[state["position"] for state in states],
+            IDs=[state["ID"] for state in states],
+            classes=[state["class"] for state in states],
+            path=path,
+        )
+
+    def query_radius(self, centers: np.ndarray, radius: float) -> List[np.ndarray]:
+        """Get the objects within a radius of each center, nearest first
+
+        Returns:
+            one array of row indices per center
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        results = []
+        for center, rows in zip(centers, self.tree.query_ball_point(centers, radius)):
+            rows = np.asarray(rows, dtype=int)
+            distances = np.linalg.norm(self.positions[rows] - center, axis=1)
+            results.append(rows[np.argsort(distances, kind="stable")])
+        return results
+
+    def query_radii(self, radii: Sequence[float]) -> List[np.ndarray]:
+        """Get the objects within each of several radii of the ego in one pass"""
+        order = np.argsort(self.distances, kind="stable")
+        counts = np.searchsorted(self.distances[order], radii, side="left")
+        return [order[:count] for count in counts]
+
+    def query_knn(self, centers: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the k nearest objects of each center
+
+        Returns:
+            (Q, k) distances and row indices, inf and -1 where there are
+            fewer than k objects
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        if len(self) == 0:
+            return np.full((len(centers), k), np.inf), np.full((len(centers), k), -1)
+        distances, rows = self.tree.query(centers, k=k)
+        distances = np.asarray(distances, dtype=float).reshape(len(centers), k)
+        rows = np.asarray(rows, dtype=int).reshape(len(centers), k)
+        rows[rows >= len(self)] = -1
+        return distances, rows
+
+    def query_corridor(self, width: float, path: np.ndarray = None) -> np.ndarray:
+        """Get the objects within width of the ego path, nearest to the ego first"""
+        path = self.path if path is None else np.asarray(path, dtype=float)
+        candidates = self._corridor_candidates(width, path)
+        rows = candidates[distance_to_path(self.positions[candidates], path) <= width]
+        return rows[np.argsort(self.distances[rows], kind="stable")]
+
+    def _corridor_candidates(self, width: float, path: np.ndarray) -> np.ndarray:
+        """Objects near any path vertex, a superset of those near the path"""
+        path = path.reshape(-1, 2)
+        segment_length = (
+            np.linalg.norm(np.diff(path, axis=0), axis=1).max() if len(path) > 1 else 0
+        )
+        candidates = self.tree.query_ball_point(path, width + segment_length / 2)
+        candidates = np.unique(
+            np.concatenate(
+                [np.zeros(0, dtype=int)]
+                + [np.asarray(rows, dtype=int) for rows in candidates]
+            )
+        )
+        return candidates
+
+    def select(self, criteria: Dict[str, KeyObjectCriterion]) -> Dict[str, List]:
+        """Get the key objects for many criteria in one pass
+
+        The distances to the ego, the class masks, and the distances to the
+        path are computed once and shared by all criteria.
+
+        Returns:
+            dictionary of criterion name to the selected object IDs, nearest
+            first
+        """
+        order = np.argsort(self.distances, kind="stable")
+        corridor_distances = None
+        if any(criterion.corridor is not None for criterion in criteria.values()):
+            width_max = max(
+                criterion.corridor
+                for criterion in criteria.values()
+                if criterion.corridor is not None
+            )
+            corridor_distances = np.full(len(self), np.inf)
+            candidates = self._corridor_candidates(width_max, self.path)
+            corridor_distances[candidates] = distance_to_path(
+                self.positions[candidates], self.path
+            )
+        class_masks = {}
+        selected = {}
+        for name, criterion in criteria.items():
+            mask = np.ones(len(self), dtype=bool)
+            if criterion.radius is not None:
+                mask &= self.distances < criterion.radius
+            if criterion.classes is not None:
+                classes = tuple(criterion.classes)
+                if classes not in class_masks:
+                    class_masks[classes] = np.isin(self.classes, classes)
+                mask &= class_masks[classes]
+            if criterion.corridor is not None:
+                mask &= corridor_distances <= criterion.corridor
+            rows = order[mask[order]]
+            if criterion.k is not None:
+                k = criterion.k
+                rows = rows[:k]
+            selected[name] = [self.IDs[row] for row in rows]
+        return selected
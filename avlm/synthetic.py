@@ -0,0 +1,282 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from avstack.calibration import CameraCalibration
+from avstack.environment.objects import ObjectState, VehicleState
+from avstack.geometry import (
+    Attitude,
+    Box3D,
+    GlobalOrigin3D,
+    Position,
+    ReferenceFrame,
+    Velocity,
+    q_stan_to_cam,
+)
+from avstack.geometry.transformations import transform_orientation
+
+from avlm.timestamps import TimestampIndex
+
+
+# yaw rate in degrees per second and acceleration in meters per second squared
+MANEUVERS = {
+    "straight": (0.0, 0.0),
+    "veer_left": (7.0, 0.0),
+    "veer_right": (-7.0, 0.0),
+    "turn_left": (25.0, 0.0),
+    "turn_right": (-25.0, 0.0),
+    "accelerate": (0.0, 1.5),
+    "decelerate": (0.0, -1.5),
+    "stop": (0.0, -4.0),
+}
+
+OBJECT_TYPES = ["car", "truck", "pedestrian", "bicycle"]
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    """Settings for the synthetic scene datasets
+
+    Attributes:
+        n_scenes - number of scenes over all splits
+        n_frames - number of frames per scene
+        n_objects - number of objects per scene
+        n_cameras - number of cameras evenly spaced around the agent
+        dt - time between frames in seconds
+        frames_per_maneuver - number of frames each scripted maneuver lasts
+        maneuvers - names of the scripted maneuvers (see MANEUVERS), cycled
+            through and shifted by one for each scene
+        speed_init - initial agent speed in meters per second
+        max_range - maximum distance of objects returned by get_objects
+        seed - seed for the object placement
+    """
+
+    n_scenes: int = 10
+    n_frames: int = 40
+    n_objects: int = 20
+    n_cameras: int = 6
+    dt: float = 0.5
+    frames_per_maneuver: int = 8
+    maneuvers: Tuple[str, ...] = tuple(MANEUVERS.keys())
+    speed_init: float = 8.0
+    max_range: float = 60.0
+    seed: int = 0
+
+
+def simulate_maneuvers(
+    maneuvers: Sequence[str],
+    n_frames: int,
+    dt: float,
+    frames_per_maneuver: int,
+    speed_init: float,
+) -> Dict[str, np.ndarray]:
+    """Integrate a planar trajectory through a sequence of scripted maneuvers
+
+    Returns:
+        dictionary of timestamps (N,), positions (N, 3), yaws (N,) in
+        radians, and speeds (N,)
+    """
+    timestamps = dt * np.arange(n_frames)
+    positions = np.zeros((n_frames, 3))
+    yaws = np.zeros(n_frames)
+    speeds = np.zeros(n_frames)
+    speeds[0] = speed_init
+    for i in range(1, n_frames):
+        maneuver = maneuvers[((i - 1) // frames_per_maneuver) % len(maneuvers)]
+        yaw_rate, accel = MANEUVERS[maneuver]
+        yaws[i] = yaws[i - 1] + np.pi / 180 * yaw_rate * dt
+        speeds[i] = max(0.0, speeds[i - 1] + accel * dt)
+        heading = np.array([np.cos(yaws[i]), np.sin(yaws[i]), 0.0])
+        positions[i] = positions[i - 1] + speeds[i] * dt * heading
+    return {
+        "timestamps": timestamps,
+        "positions": positions,
+        "yaws": yaws,
+        "speeds": speeds,
+    }
+
+
+def _make_state(
+    cls, obj_type: str, ID: int, t: float, position, yaw: float, speed: float, hwl
+):
+    q = transform_orientation(np.array([0, 0, yaw]), "euler", "quat")
+    position = Position(np.asarray(position, dtype=float), GlobalOrigin3D)
+    attitude = Attitude(q, GlobalOrigin3D)
+    velocity = Velocity(
+        speed * np.array([np.cos(yaw), np.sin(yaw), 0.0]), GlobalOrigin3D
+    )
+    box = Box3D(position=position, attitude=attitude, hwl=hwl)
+    state = cls(obj_type=obj_type, ID=ID)
+    state.set(t=t, position=position, box=box, velocity=velocity, attitude=attitude)
+    return state
+
+
+class SyntheticSceneDataset:
+    """In-memory stand-in for a scene dataset with scripted agent maneuvers
+
+    Implements the part of the scene dataset interface used for dataset
+    generation. The ego agent follows the scripted maneuvers and the
+    objects move at constant velocity. States are built on every call, as
+    a real dataset would load them, so the loader cost is part of any
+    measurement.
+    """
+
+    def __init__(self, scene: str, config: SyntheticConfig, maneuvers: Sequence[str]):
+        self.scene = scene
+        self.config = config
+        self.maneuvers = list(maneuvers)
+        self.frames = list(range(config.n_frames))
+        self.trajectory = simulate_maneuvers(
+            self.maneuvers,
+            n_frames=config.n_frames,
+            dt=config.dt,
+            frames_per_maneuver=config.frames_per_maneuver,
+            speed_init=config.speed_init,
+        )
+        self._ts_index = TimestampIndex(self.frames, self.trajectory["timestamps"])
+
+        # cameras evenly spaced around the agent, the first is the main camera
+        self.cameras = [f"CAM_{i}" for i in range(config.n_cameras)]
+        self.camera_yaws = 2 * np.pi * np.arange(config.n_cameras) / config.n_cameras
+        self.sensors = {camera: camera for camera in self.cameras}
+        self.sensors["main_camera"] = self.cameras[0]
+        self.P = np.array(
+            [[800.0, 0.0, 800.0, 0.0], [0.0, 800.0, 450.0, 0.0], [0.0, 0.0, 1.0, 0.0]]
+        )
+        self.img_shape = (900, 1600)
+
+        # objects placed around the start of the agent path
+        rng = np.random.default_rng(
+            [config.seed, int.from_bytes(scene.encode(), "little") % 2**32]
+        )
+        n_obj = config.n_objects
+        self.object_types = rng.choice(OBJECT_TYPES, size=n_obj)
+        self.object_positions = np.zeros((n_obj, 3))
+        self.object_positions[:, 0] = rng.uniform(-20, 60, size=n_obj)
+        self.object_positions[:, 1] = rng.uniform(-15, 15, size=n_obj)
+        self.object_yaws = rng.uniform(-np.pi, np.pi, size=n_obj)
+        self.object_speeds = rng.uniform(0, 10, size=n_obj)
+
+    def _sensor_name(self, sensor: str) -> str:
+        return self.sensors[sensor] if sensor is not None else self.cameras[0]
+
+    def get_agent_set(self, frame: int) -> List[int]:
+        return [0]
+
+    def get_frames(self, sensor: str, agent: int) -> List[int]:
+        return list(self.frames)
+
+    def get_timestamps(
+        self, sensor: str, agent: int, utime: bool = False
+    ) -> List[float]:
+        return self.trajectory["timestamps"].tolist()
+
+    def get_timestamp(self, frame: int, sensor: str, agent: int) -> float:
+        return float(self.trajectory["timestamps"][frame])
+
+    def get_frame_at_timestamp(
+        self,
+        timestamp: float,
+        sensor: str,
+        agent: int,
+        utime: bool = False,
+        dt_tolerance: float = 0.5,
+    ) -> int:
+        frame = int(self._ts_index.lookup(timestamp, dt_tolerance=dt_tolerance))
+        if frame < 0:
+            raise IndexError(f"No frame within {dt_tolerance} s of {timestamp}")
+        return frame
+
+    def get_agent(self, frame: int, agent: int) -> VehicleState:
+        return _make_state(
+            VehicleState,
+            obj_type="car",
+            ID=agent,
+            t=float(self.trajectory["timestamps"][frame]),
+            position=self.trajectory["positions"][frame],
+            yaw=float(self.trajectory["yaws"][frame]),
+            speed=float(self.trajectory["speeds"][frame]),
+            hwl=[1.5, 1.8, 4.0],
+        )
+
+    def get_calibration(self, frame: int, sensor: str, agent: int) -> CameraCalibration:
+        camera = self._sensor_name(sensor)
+        yaw = self.camera_yaws[self.cameras.index(camera)]
+        q_yaw = transform_orientation(np.array([0, 0, yaw]), "euler", "quat")
+        reference = ReferenceFrame(
+            x=np.array([1.5, 0.0, 1.6]),
+            q=q_stan_to_cam * q_yaw,
+            reference=self.get_agent(frame, agent).as_reference(),
+        )
+        return CameraCalibration(reference, self.P, self.img_shape)
+
+    def get_sensor_names_by_type(self, sensor_type: str, agent: int) -> List[str]:
+        return list(self.cameras) if sensor_type == "camera" else []
+
+    def get_sensor_data_filepath(self, frame: int, sensor: str, agent: int) -> str:
+        return f"synthetic/{self.scene}/{self._sensor_name(sensor)}/{frame:06d}.jpg"
+
+    def _get_sensor_record(self, frame: int, sensor: str) -> Dict:
+        return {
+            "token": f"{self.scene}_{sensor}_{frame:06d}",
+            "timestamp": int(1e6 * self.trajectory["timestamps"][frame]),
+        }
+
+    def get_objects(self, frame: int, sensor: str, agent: int) -> List[ObjectState]:
+        """Get the objects in front of a camera within range, in camera coordinates"""
+        t = float(self.trajectory["timestamps"][frame])
+        headings = np.stack(
+            [
+                np.cos(self.object_yaws),
+                np.sin(self.object_yaws),
+                np.zeros(len(self.object_yaws)),
+            ],
+            axis=1,
+        )
+        positions = self.object_positions + t * self.object_speeds[:, None] * headings
+        calib = self.get_calibration(frame, sensor, agent)
+        objs = []
+        for ID in range(len(positions)):
+            obj = _make_state(
+                ObjectState,
+                obj_type=str(self.object_types[ID]),
+                ID=ID,
+                t=t,
+                position=positions[ID],
+                yaw=float(self.object_yaws[ID]),
+                speed=float(self.object_speeds[ID]),
+                hwl=[1.5, 1.8, 4.0],
+            )
+            obj.change_reference(calib.reference, inplace=True)
+            if (obj.position.x[2] > 0) and (
+                obj.position.norm() < self.config.max_range
+            ):
+                objs.append(obj)
+        return objs
+
+
+class SyntheticManager:
+    """Scene manager over synthetic scenes
+
+    Scenes are split 3:1:1 between train, val, and test. Each scene cycles
+    through the configured maneuvers starting one further than the last.
+    """
+
+    def __init__(self, config: SyntheticConfig = SyntheticConfig()):
+        self.config = config
+        self.scenes = [f"synthetic-{i:04d}" for i in range(config.n_scenes)]
+        self.splits_scenes = {"train": [], "val": [], "test": []}
+        for i_scene, scene in enumerate(self.scenes):
+            split = ["train", "train", "train", "val", "test"][i_scene % 5]
+            self.splits_scenes[split].append(scene)
+
+    def get_scene_dataset_by_name(self, scene: str) -> SyntheticSceneDataset:
+        if scene not in self.scenes:
+            raise KeyError(f"Unknown scene {scene}")
+        i_scene = self.scenes.index(scene)
+        n_maneuvers = len(self.config.maneuvers)
+        maneuvers = [
+            self.config.maneuvers[(i_scene + i) % n_maneuvers]
+            for i in range(n_maneuvers)
+        ]
+        return SyntheticSceneDataset(scene, self.config, maneuvers)
@@ -0,0 +1,217 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from avlm.actions import Lateral, Longitudinal, relative_yaw
+from avlm.generate import (
+    GenerationConfig,
+    get_action_rows,
+    get_label_inputs,
+    get_previous_rows,
+)
+
+
+SOURCES = ("meta_actions_from_ti", "meta_actions_from_dt")
+
+
+class ActionDeltas:
+    """Yaw and speed changes of every (frame, horizon) pair, computed once
+
+    The meta action labels are a threshold on these values, so they can be
+    relabeled for any number of thresholds without reloading the agent
+    states. Only pairs with a future state are kept.
+
+    Arguments:
+        horizons - horizon keys of the pairs, e.g., ["dt_1.00", "dt_2.00"]
+        source - "meta_actions_from_ti" to compare against t=now or
+            "meta_actions_from_dt" to compare against the previous horizon
+    """
+
+    def __init__(self, horizons: Sequence[str], source: str = SOURCES[0]):
+        if source not in SOURCES:
+            raise ValueError(f"Unknown label source {source}")
+        self.horizons = list(horizons)
+        self.source = source
+        self._parts: Dict[str, List[np.ndarray]] = {
+            "d_yaw": [],
+            "speed_current": [],
+            "speed_future": [],
+            "horizon": [],
+        }
+
+    @classmethod
+    def from_config(
+        cls, config: GenerationConfig, source: str = SOURCES[0]
+    ) -> "ActionDeltas":
+        return cls([f"dt_{dt:.2f}" for dt in config.dts_action], source=source)
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self._parts["horizon"])
+
+    def add(
+        self,
+        quaternions: np.ndarray,
+        velocities: np.ndarray,
+        idx_future: np.ndarray,
+        idx_current: np.ndarray = None,
+    ):
+        """Add the pairs of one trajectory
+
+        Arguments:
+            quaternions - (N, 4) array of (w, x, y, z) attitudes
+            velocities - (N, 3) array of velocities
+            idx_future - (F, H) rows of the future states, -1 if none
+            idx_current - (F, H) rows of the current states, defaults to the
+                row index
+        """
+        idx_future = np.asarray(idx_future, dtype=int)
+        if idx_current is None:
+            idx_current = np.broadcast_to(
+                np.arange(idx_future.shape[0])[:, None], idx_future.shape
+            )
+        valid = (idx_current >= 0) & (idx_future >= 0)
+        i_cur, i_fut = idx_current[valid], idx_future[valid]
+        quaternions = np.asarray(quaternions, dtype=float)
+        speeds = np.linalg.norm(np.asarray(velocities, dtype=float), axis=-1)
+        self._parts["d_yaw"].append(
+            relative_yaw(quaternions[i_cur], quaternions[i_fut])
+        )
+        self._parts["speed_current"].append(speeds[i_cur])
+        self._parts["speed_future"].append(speeds[i_fut])
+        self._parts["horizon"].append(np.nonzero(valid)[1].astype(np.int16))
+
+    def add_scene(self, SD, config: GenerationConfig):
+        """Add the pairs of all agents of a scene from their states"""
+        for agent in SD.get_agent_set(frame=0):
+            label_inputs = get_label_inputs(SD, agent, config)
+            if label_inputs is None:
+                continue
+            rows_action = get_action_rows(label_inputs, config)
+            rows_current = None
+            if self.source == "meta_actions_from_dt":
+                rows_current = get_previous_rows(rows_action)
+            self.add(
+                label_inputs["quaternions"],
+                label_inputs["velocities"],
+                rows_action,
+                idx_current=rows_current,
+            )
+
+    def merge(self, other: "ActionDeltas"):
+        """Add the pairs of another set of deltas to this one"""
+        if (other.horizons != self.horizons) or (other.source != self.source):
+            raise ValueError("Cannot merge deltas with different settings")
+        for name, parts in other._parts.items():
+            self._parts[name].extend(parts)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Concatenated (P,) arrays of all pairs"""
+        dtypes = {"horizon": np.int16}
+        arrays = {}
+        for name, parts in self._parts.items():
+            if len(parts) != 1:
+                parts = [np.concatenate(parts)] if parts else [np.zeros(0)]
+                self._parts[name] = parts
+            arrays[name] = parts[0].astype(dtypes.get(name, float), copy=False)
+        return arrays
+
+
+def _count_grid(
+    labels: np.ndarray, horizon: np.ndarray, n_horizons: int, classes: np.ndarray
+) -> np.ndarray:
+    """Count the classes of (A, B, P) labels per setting and horizon"""
+    n_a, n_b, _ = labels.shape
+    n_cls = len(classes)
+    setting = np.arange(n_a * n_b).reshape(n_a, n_b, 1)
+    flat_index = (
+        setting * n_horizons + horizon[None, None, :]
+    ) * n_cls + np.searchsorted(classes, labels)
+    return np.bincount(
+        flat_index.ravel(), minlength=n_a * n_b * n_horizons * n_cls
+    ).reshape(n_a, n_b, n_horizons, n_cls)
+
+
+def _count_flips(labels: np.ndarray) -> List[np.ndarray]:
+    """Count label changes between neighboring settings along each grid axis"""
+    return [
+        (labels[1:] != labels[:-1]).sum(axis=-1),
+        (labels[:, 1:] != labels[:, :-1]).sum(axis=-1),
+    ]
+
+
+def sweep_thresholds(
+    deltas: ActionDeltas,
+    thresh_veer: Sequence[float] = (5,),
+    thresh_turn: Sequence[float] = (20,),
+    thresh_change: Sequence[float] = (0.25,),
+    thresh_stop: Sequence[float] = (0.50,),
+    chunk_size: int = 2**16,
+) -> Dict:
+    """Label all pairs for a grid of thresholds and summarize each setting
+
+    The labels of each action family are computed for the full grid of its
+    two thresholds by broadcasting the thresholds against the precomputed
+    deltas. Pairs are processed in chunks to bound the size of the label
+    tables.
+
+    Returns:
+        for each action family, the threshold values, the class names, the
+        (A, B, H, C) class counts of each setting and horizon, and the number
+        of labels that flip between neighboring settings along each threshold,
+        with shapes (A-1, B) and (A, B-1)
+    """
+    arrays = deltas.arrays()
+    n_hor = len(deltas.horizons)
+    grids = {
+        "lateral": (Lateral, {"thresh_veer": thresh_veer, "thresh_turn": thresh_turn}),
+        "longitudinal": (
+            Longitudinal,
+            {"thresh_change": thresh_change, "thresh_stop": thresh_stop},
+        ),
+    }
+    results = {"n_pairs": len(arrays["horizon"]), "horizons": deltas.horizons}
+    for family, (ACTION, thresholds) in grids.items():
+        classes = np.array(sorted(int(label) for label in ACTION))
+        (name_a, values_a), (name_b, values_b) = thresholds.items()
+        grid_a = np.asarray(values_a, dtype=float)[:, None, None]
+        grid_b = np.asarray(values_b, dtype=float)[None, :, None]
+        counts = np.zeros((len(values_a), len(values_b), n_hor, len(classes)), int)
+        flips = [
+            np.zeros((len(values_a) - 1, len(values_b)), int),
+            np.zeros((len(values_a), len(values_b) - 1), int),
+        ]
+        for i_start in range(0, results["n_pairs"], chunk_size):
+            i_end = i_start + chunk_size
+            if family == "lateral":
+                labels = Lateral.classify(
+                    arrays["d_yaw"][i_start:i_end],
+                    thresh_veer=grid_a,
+                    thresh_turn=grid_b,
+                )
+            else:
+                labels = Longitudinal.classify(
+                    arrays["speed_current"][i_start:i_end],
+                    arrays["speed_future"][i_start:i_end],
+                    thresh_change=grid_a,
+                    thresh_stop=grid_b,
+                )
+            counts += _count_grid(
+                labels, arrays["horizon"][i_start:i_end], n_hor, classes
+            )
+            for flip, flip_chunk in zip(flips, _count_flips(labels)):
+                flip += flip_chunk
+        results[family] = {
+            name_a: [float(value) for value in values_a],
+            name_b: [float(value) for value in values_b],
+            "classes": [str(ACTION(int(label))) for label in classes],
+            "counts": counts.tolist(),
+            f"flips_{name_a}": flips[0].tolist(),
+            f"flips_{name_b}": flips[1].tolist(),
+        }
+    return results
+
+
+def get_class_balance(results: Dict, family: str) -> np.ndarray:
+    """(A, B, C) fraction of each class per setting over all horizons"""
+    counts = np.asarray(results[family]["counts"]).sum(axis=2)
+    return counts / np.maximum(counts.sum(axis=-1, keepdims=True), 1)
@@ -0,0 +1,78 @@
+from typing import Sequence
+
+import numpy as np
+
+
+class TimestampIndex:
+    """Sorted index for vectorized frame lookup by timestamp
+
+    Vectorized equivalent of repeated calls to a scene dataset's
+    get_frame_at_timestamp: every query is resolved to the frame with the
+    nearest timestamp, and queries with no frame within the tolerance
+    resolve to -1.
+    """
+
+    def __init__(self, frames: Sequence[int], timestamps: Sequence[float]):
+        if len(frames) != len(timestamps):
+            raise ValueError(
+                f"Inconsistent lengths: {len(frames)} frames, "
+                f"{len(timestamps)} timestamps"
+            )
+        if len(frames) == 0:
+            raise ValueError("Cannot build a timestamp index without frames")
+        order = np.argsort(np.asarray(timestamps, dtype=float), kind="stable")
+        self.timestamps = np.asarray(timestamps, dtype=float)[order]
+        self.frames = np.asarray(frames, dtype=int)[order]
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def lookup(self, timestamps: np.ndarray, dt_tolerance: float) -> np.ndarray:
+        """Get the nearest frame for an array of timestamps
+
+        Ties are resolved to the earlier frame. Returns an integer array of
+        frames with the shape of the input, -1 where the nearest frame is
+        further than dt_tolerance away.
+        """
+        query = np.asarray(timestamps, dtype=float)
+        i_right = np.searchsorted(self.timestamps, query, side="left")
+        i_right = np.clip(i_right, 0, len(self.timestamps) - 1)
+        i_left = np.clip(i_right - 1, 0, len(self.timestamps) - 1)
+        dt_left = np.abs(query - self.timestamps[i_left])
+        dt_right = np.abs(self.timestamps[i_right] - query)
+        use_left = dt_left <= dt_right
+        i_near = np.where(use_left, i_left, i_right)
+        dt_near = np.where(use_left, dt_left, dt_right)
+        return np.where(dt_near <= dt_tolerance, self.frames[i_near], -1)
+
+    def horizon_matrix(
+        self,
+        timestamps: np.ndarray,
+        offsets: Sequence[float],
+        dt_tolerance: float,
+        t_min: float = None,
+        t_max: float = None,
+    ) -> np.ndarray:
+        """Resolve every (timestamp, offset) pair to a frame at once
+
+        Args:
+            timestamps - (F,) timestamps of the current frames
+            offsets - (H,) time offsets in seconds
+            dt_tolerance - maximum distance to the nearest frame in seconds
+            t_min - if set, offset times must be strictly after this time
+            t_max - if set, offset times must be at or before this time
+
+        Returns:
+            (F, H) integer matrix of frames, -1 where no frame matches or
+            the offset time is out of bounds
+        """
+        query = (
+            np.asarray(timestamps, dtype=float)[:, None]
+            + np.asarray(offsets, dtype=float)[None, :]
+        )
+        frames = self.lookup(query, dt_tolerance=dt_tolerance)
+        if t_min is not None:
+            frames[query <= t_min] = -1
+        if t_max is not None:
+            frames[query > t_max] = -1
+        return frames
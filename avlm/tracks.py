@@ -0,0 +1,131 @@
+from typing import TYPE_CHECKING, Dict, List, Sequence
+
+import numpy as np
+
+from avlm.actions import states_to_arrays
+from avlm.trajectory import frames_to_rows
+
+
+if TYPE_CHECKING:
+    from avstack.environment.objects import ObjectState
+
+
+class ObjectTrack:
+    """Observations of one object over a scene, sorted by time
+
+    Attributes:
+        ID - object identifier
+        frames - (N,) frames the object was observed at
+        timestamps - (N,) timestamps of the observations in seconds
+        states - (N,) object states in the common static reference frame
+    """
+
+    def __init__(
+        self,
+        ID,
+        frames: Sequence[int],
+        timestamps: Sequence[float],
+        states: Sequence["ObjectState"],
+    ):
+        order = np.argsort(np.asarray(timestamps, dtype=float), kind="stable")
+        self.ID = ID
+        self.frames = np.asarray(frames, dtype=int)[order]
+        self.timestamps = np.asarray(timestamps, dtype=float)[order]
+        self.states = [states[i] for i in order]
+        self._arrays = None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def rows(self, frames: np.ndarray) -> np.ndarray:
+        """Map frames to rows of the track, -1 where the object was not observed"""
+        return frames_to_rows(self.frames, frames)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Stacked positions, velocities, and attitudes of the states
+
+        Built on first use for the batched conversions (see avlm.bev)
+        """
+        if self._arrays is None:
+            quaternions, velocities = states_to_arrays(self.states)
+            self._arrays = {
+                "position": np.array(
+                    [state.position.x for state in self.states], dtype=float
+                ).reshape(-1, 3),
+                "velocity": velocities,
+                "quaternion": quaternions,
+            }
+        return self._arrays
+
+
+class ObjectTrackIndex:
+    """Scene-level index from object ID to its track
+
+    Every frame's objects are loaded from the scene dataset exactly once and
+    moved to a common static reference frame, so the previous, current, and
+    future observations of an object at any frame are lookups into its
+    track instead of repeated loads and reference changes.
+
+    Attributes:
+        tracks - object ID to ObjectTrack
+        frame_objects - frame to the IDs of the objects observed at that frame
+        frame_distances - frame to the distance of each of those objects from
+            the sensor at the time of observation
+    """
+
+    def __init__(
+        self,
+        tracks: Dict[int, ObjectTrack],
+        frame_objects: Dict[int, List],
+        frame_distances: Dict[int, np.ndarray],
+    ):
+        self.tracks = tracks
+        self.frame_objects = frame_objects
+        self.frame_distances = frame_distances
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def __getitem__(self, ID) -> ObjectTrack:
+        return self.tracks[ID]
+
+    @classmethod
+    def from_scene(
+        cls,
+        SD,
+        frames: Sequence[int],
+        timestamps: Sequence[float],
+        sensor: str,
+        agent,
+        reference,
+    ) -> "ObjectTrackIndex":
+        """Load the objects seen by a sensor at all frames once
+
+        Arguments:
+            SD - scene dataset
+            frames - frames to load objects at
+            timestamps - timestamps of the frames in seconds
+            sensor - sensor the objects are observed by
+            agent - agent the sensor belongs to
+            reference - static reference frame all states are moved to
+        """
+        observations: Dict[int, Dict[str, list]] = {}
+        frame_objects = {}
+        frame_distances = {}
+        for frame, timestamp in zip(frames, timestamps):
+            frame = int(frame)
+            objs = SD.get_objects(frame=frame, sensor=sensor, agent=agent)
+            frame_objects[frame] = [obj.ID for obj in objs]
+            frame_distances[frame] = np.array(
+                [obj.position.norm() for obj in objs], dtype=float
+            )
+            for obj in objs:
+                obj.change_reference(reference, inplace=True)
+                track = observations.setdefault(
+                    obj.ID, {"frames": [], "timestamps": [], "states": []}
+                )
+                track["frames"].append(frame)
+                track["timestamps"].append(timestamp)
+                track["states"].append(obj)
+        tracks = {ID: ObjectTrack(ID, **track) for ID, track in observations.items()}
+        return cls(tracks, frame_objects, frame_distances)
@@ -0,0 +1,88 @@
+from typing import TYPE_CHECKING, Sequence
+
+import numpy as np
+
+from avlm.actions import states_to_arrays
+
+
+if TYPE_CHECKING:
+    from avstack.environment.objects import VehicleState
+
+
+def frames_to_rows(frames_table: np.ndarray, frames: np.ndarray) -> np.ndarray:
+    """Map frames to their rows in a table of frames, -1 if not present"""
+    frames_table = np.asarray(frames_table, dtype=int)
+    frames = np.asarray(frames, dtype=int)
+    if len(frames_table) == 0:
+        return np.full(frames.shape, -1, dtype=int)
+    order = np.argsort(frames_table, kind="stable")
+    i_sorted = np.clip(
+        np.searchsorted(frames_table[order], frames), 0, len(frames_table) - 1
+    )
+    found = (frames_table[order][i_sorted] == frames) & (frames >= 0)
+    return np.where(found, order[i_sorted], -1)
+
+
+class AgentTrajectory:
+    """Array-backed table of the states of one agent over a scene
+
+    Each state is loaded from the scene dataset exactly once. The numeric
+    fields are stacked into arrays for vectorized consumers (e.g., the batch
+    meta action evaluators) while the state objects are kept for the
+    operations that need them (e.g., reference frame changes).
+
+    Attributes:
+        frames - (N,) frame indices
+        timestamps - (N,) timestamps in seconds
+        positions - (N, 3) positions in the global frame
+        box_positions - (N, 3) bounding box positions in the global frame
+        velocities - (N, 3) velocities in the global frame
+        quaternions - (N, 4) attitudes as (w, x, y, z) in the global frame
+        box_hwl - (N, 3) bounding box height, width, length
+    """
+
+    def __init__(
+        self,
+        frames: Sequence[int],
+        timestamps: Sequence[float],
+        states: Sequence["VehicleState"],
+    ):
+        if not (len(frames) == len(timestamps) == len(states)):
+            raise ValueError(
+                f"Inconsistent lengths: {len(frames)} frames, "
+                f"{len(timestamps)} timestamps, {len(states)} states"
+            )
+        self.frames = np.asarray(frames, dtype=int)
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.states = list(states)
+        self.positions = np.array(
+            [state.position.x for state in states], dtype=float
+        ).reshape(-1, 3)
+        self.box_positions = np.array(
+            [state.box.position.x for state in states], dtype=float
+        ).reshape(-1, 3)
+        self.quaternions, self.velocities = states_to_arrays(states)
+        self.box_hwl = np.array(
+            [[state.box.h, state.box.w, state.box.l] for state in states],
+            dtype=float,
+        ).reshape(-1, 3)
+        self._rows = {int(frame): i for i, frame in enumerate(self.frames)}
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @classmethod
+    def from_scene(cls, SD, agent) -> "AgentTrajectory":
+        """Load all states of an agent in a scene dataset once"""
+        frames = SD.get_frames(sensor=None, agent=agent)
+        timestamps = SD.get_timestamps(sensor=None, agent=agent, utime=False)
+        states = [SD.get_agent(frame=frame, agent=agent) for frame in frames]
+        return cls(frames, timestamps, states)
+
+    def row(self, frame: int) -> int:
+        """Get the row in the table for a frame, -1 if it is not present"""
+        return self._rows.get(int(frame), -1)
+
+    def rows(self, frames: np.ndarray) -> np.ndarray:
+        """Vectorized version of row; frames of -1 map to -1"""
+        return frames_to_rows(self.frames, frames)
@@ -0,0 +1,99 @@
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import numpy as np
+from avstack.geometry import Position, q_mult_vec, q_stan_to_cam
+
+
+def reference_affine(reference_from, reference_to) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the affine map of positions from one reference frame to another
+
+    The map is probed from change_reference with the origin and the unit
+    axes, so the batched transform follows the same convention as the
+    per-point transform.
+
+    Returns:
+        rotation R (3, 3) and translation t (3,) such that x_to = R x_from + t
+    """
+    origin = Position(np.zeros(3), reference_from)
+    t = origin.change_reference(reference_to, inplace=False).x
+    R = np.stack(
+        [
+            Position(axis, reference_from)
+            .change_reference(reference_to, inplace=False)
+            .x
+            - t
+            for axis in np.eye(3)
+        ],
+        axis=1,
+    )
+    return R, t
+
+
+@lru_cache(maxsize=1)
+def stan_to_cam_matrix() -> np.ndarray:
+    """Rotation matrix from standard (x forward) to camera (z forward) axes"""
+    return np.stack([q_mult_vec(q_stan_to_cam, axis) for axis in np.eye(3)], axis=1)
+
+
+def camera_matrix(reference_from, calib) -> np.ndarray:
+    """Get the (3, 4) matrix taking homogeneous positions to image coordinates
+
+    Combines the extrinsics from reference_from to the camera with the
+    projection matrix of the calibration.
+    """
+    R, t = reference_affine(reference_from, calib.reference)
+    extrinsics = np.eye(4)
+    extrinsics[:3, :3] = R
+    extrinsics[:3, 3] = t
+    return calib.P @ extrinsics
+
+
+def project_points(points: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Project points into one or more cameras at once
+
+    Args:
+        points - (N, 3) positions
+        matrices - (C, 3, 4) camera matrices (see camera_matrix)
+
+    Returns:
+        (C, N, 2) pixel coordinates
+    """
+    points_hom = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    pixels = np.einsum("cij,nj->cni", matrices, points_hom)
+    return pixels[..., :2] / pixels[..., 2:3]
+
+
+def compute_waypoints(
+    box_positions: np.ndarray,
+    positions: np.ndarray,
+    reference_from,
+    agent_reference,
+    calibs: Dict,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Compute the 3D and pixel waypoints of future positions for one frame
+
+    All horizons and all cameras share a single matrix operation, so adding
+    cameras only adds the cost of building their camera matrices.
+
+    Args:
+        box_positions - (H, 3) future box positions in reference_from
+        positions - (H, 3) future agent positions in reference_from
+        reference_from - reference frame of the future positions
+        agent_reference - reference frame of the agent at the current frame
+        calibs - dictionary of camera name to calibration
+
+    Returns:
+        (H, 3) waypoints in the agent frame with camera axes and a
+        dictionary of camera name to (H, 2) pixel waypoints
+    """
+    R, t = reference_affine(reference_from, agent_reference)
+    waypoints_3d = (box_positions @ R.T + t) @ stan_to_cam_matrix().T
+    cameras = list(calibs.keys())
+    if len(cameras) == 0:
+        return waypoints_3d, {}
+    matrices = np.stack(
+        [camera_matrix(reference_from, calibs[camera]) for camera in cameras]
+    )
+    pixels = project_points(positions, matrices)
+    return waypoints_3d, dict(zip(cameras, pixels))
@@ -0,0 +1,118 @@
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from avlm.action_stats import SOURCES, ActionStatistics
+from avlm.dataset import AVLMDataset
+from avlm.generate import GenerationConfig
+from avlm.scene import (
+    build_scene_manager,
+    check_scene_arguments,
+    get_worker_scene_manager,
+    init_worker_scene_manager,
+)
+
+
+def _scene_stats_worker(
+    scenes: List[str], config: GenerationConfig, max_run_length: int
+) -> ActionStatistics:
+    """Aggregate the labels of a chunk of scenes in a worker"""
+    stats = ActionStatistics.from_config(config, max_run_length=max_run_length)
+    for scene in scenes:
+        try:
+            SD = get_worker_scene_manager().get_scene_dataset_by_name(scene)
+        except Exception:
+            print(f"Scene {scene} could not be loaded...skipping")
+            continue
+        stats.update_from_scene(SD, config)
+    return stats
+
+
+def main(args):
+    """Aggregate meta action statistics from a dataset or directly from scenes"""
+    t_start = time.perf_counter()
+    config = GenerationConfig(dt_action=args.dt_action, int_action=args.int_action)
+    if args.output_prefix is not None:
+        # stream the frames of a generated dataset
+        stats = ActionStatistics.from_config(config, max_run_length=args.max_run_length)
+        dataset = AVLMDataset(args.output_prefix, splits=args.splits)
+        stats.update(dataset)
+        dataset.close()
+    else:
+        # label the scenes directly, one partial aggregate per chunk of scenes
+        SM = build_scene_manager(args.dataset, args.dataset_path, args.version)
+        scenes = [scene for split in args.splits for scene in SM.splits_scenes[split]]
+        n_chunks = max(args.workers, 1)
+        chunks = [scenes[i_start::n_chunks] for i_start in range(n_chunks)]
+        stats = ActionStatistics.from_config(config, max_run_length=args.max_run_length)
+        if args.workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=init_worker_scene_manager,
+                initargs=(args.dataset, args.dataset_path, args.version),
+            ) as pool:
+                futures = [
+                    pool.submit(_scene_stats_worker, chunk, config, args.max_run_length)
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    stats.merge(future.result())
+        else:
+            init_worker_scene_manager(args.dataset, args.dataset_path, args.version)
+            stats.merge(_scene_stats_worker(scenes, config, args.max_run_length))
+
+    # print out the class balance
+    sep = "-" * 50
+    print(
+        f"\nAction statistics over {stats.n_sequences} agents and"
+        f" {stats.n_frames} frames in {time.perf_counter() - t_start:.1f} s\n{sep}"
+    )
+    balance = stats.class_balance(SOURCES[0])
+    for horizon, families in balance.items():
+        print(f"{horizon}:")
+        for family, fractions in families.items():
+            print(f"    {family}:")
+            for name, fraction in fractions.items():
+                print(f"        {name:<20s} {100 * fraction:>6.2f}%")
+    print(sep)
+    stats.save(args.output)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--output_prefix",
+        default=None,
+        type=str,
+        help="read a generated dataset instead of labelling the scenes",
+    )
+    parser.add_argument("--dataset_path", default=None, type=str)
+    parser.add_argument(
+        "--version",
+        default=None,
+        type=str,
+        choices=["v1.0-mini", "v1.0-trainval"],
+        help="required when labelling nuScenes scenes",
+    )
+    parser.add_argument(
+        "--dataset", choices=["nuscenes", "synthetic"], default="nuscenes", type=str
+    )
+    parser.add_argument(
+        "--splits", nargs="+", default=["train", "val", "test"], type=str
+    )
+    parser.add_argument("--dt_action", default=1.0, type=float)
+    parser.add_argument("--int_action", default=3.0, type=float)
+    parser.add_argument("--max_run_length", default=50, type=int)
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="number of processes for labelling scenes, 1 runs serially",
+    )
+    parser.add_argument("--output", default="action_stats.json", type=str)
+    args = parser.parse_args()
+    if args.output_prefix is None:
+        check_scene_arguments(parser, args)
+
+    main(args)
@@ -0,0 +1,125 @@
+import json
+import os
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from typing import Dict
+
+from avlm.actions import (
+    Lateral,
+    Longitudinal,
+    get_all_meta_actions_batch,
+    lookahead_indices,
+    states_to_arrays,
+)
+from avlm.generate import GenerationConfig, build_metadata, iter_scene
+from avlm.shards import DatasetWriter
+from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+
+def get_peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark_pipeline(SM: SyntheticManager, config: GenerationConfig) -> Dict:
+    """Time dataset generation over all synthetic scenes, streamed to shards"""
+    with tempfile.TemporaryDirectory() as folder:
+        prefix = os.path.join(folder, "benchmark")
+        n_frames = 0
+        t_start = time.perf_counter()
+        with DatasetWriter(prefix, build_metadata("synthetic")) as writer:
+            for i_scene, scene in enumerate(SM.scenes):
+                SD = SM.get_scene_dataset_by_name(scene)
+                agents = iter_scene(SD, scene, config, progress=False)
+                n_frames += writer.write_scene(f"scene_{i_scene}", scene, agents)[1]
+        t_elapsed = time.perf_counter() - t_start
+        n_bytes = sum(
+            os.path.getsize(os.path.join(folder, shard))
+            for shard in writer.sidecar["shards"]
+        )
+    return {
+        "frames": n_frames,
+        "seconds": t_elapsed,
+        "frames_per_sec": n_frames / t_elapsed,
+        "bytes_per_frame": n_bytes / max(n_frames, 1),
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def benchmark_actions(SM: SyntheticManager, offsets=(2, 4, 6)) -> Dict:
+    """Time the scalar and batch meta action evaluators on the same pairs"""
+    SD = SM.get_scene_dataset_by_name(SM.scenes[0])
+    states = [SD.get_agent(frame, 0) for frame in SD.frames]
+    idx_future = lookahead_indices(len(states), offsets)
+    pairs = [
+        (states[i_row], states[i_future])
+        for i_row, row in enumerate(idx_future)
+        for i_future in row
+        if i_future >= 0
+    ]
+
+    results = {"pairs": len(pairs)}
+    for ACTION in [Lateral, Longitudinal]:
+        t_start = time.perf_counter()
+        for current, future in pairs:
+            ACTION.evaluate(current, future)
+        t_elapsed = time.perf_counter() - t_start
+        results[f"{ACTION.__name__}.evaluate_per_sec"] = len(pairs) / t_elapsed
+
+    t_start = time.perf_counter()
+    quaternions, velocities = states_to_arrays(states)
+    get_all_meta_actions_batch(quaternions, velocities, idx_future)
+    t_elapsed = time.perf_counter() - t_start
+    results["batch_per_sec"] = len(pairs) / t_elapsed
+    results["peak_rss_mb"] = get_peak_rss_mb()
+    return results
+
+
+def main(args):
+    """Benchmark dataset generation on synthetic scenes"""
+    SM = SyntheticManager(
+        SyntheticConfig(
+            n_scenes=args.n_scenes,
+            n_frames=args.n_frames,
+            n_objects=args.n_objects,
+            n_cameras=args.n_cameras,
+        )
+    )
+    config = GenerationConfig(waypoints_all_cameras=args.waypoints_all_cameras)
+    results = {
+        "pipeline": benchmark_pipeline(SM, config),
+        "actions": benchmark_actions(SM),
+    }
+
+    # print out results
+    sep = "-" * 50
+    print(f"\nBenchmark results\n{sep}")
+    for name, result in results.items():
+        print(f"{name}:")
+        for key, value in result.items():
+            print(f"    {key:<32s} {value:>14,.2f}")
+    print(sep)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--n_scenes", default=10, type=int)
+    parser.add_argument("--n_frames", default=40, type=int)
+    parser.add_argument("--n_objects", default=20, type=int)
+    parser.add_argument("--n_cameras", default=6, type=int)
+    parser.add_argument(
+        "--waypoints_all_cameras",
+        action="store_true",
+        help="also project the waypoints into every camera",
+    )
+    parser.add_argument(
+        "--output", default=None, type=str, help="optional JSON file for the results"
+    )
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,109 @@
+import json
+from argparse import ArgumentParser
+
+from avlm.llm_eval import (
+    CompletionClient,
+    FakeCompletionServer,
+    evaluate_prompt_file,
+    get_oracle_responses,
+)
+from avlm.prompts import TEMPLATES, get_template
+
+
+def main(args):
+    """Get the model responses to rendered prompts and parse the predictions"""
+    template = get_template(
+        args.template, horizon=args.horizon, horizons=tuple(args.horizons)
+    )
+    server = None
+    url = args.url
+    if args.fake:
+        # answer each prompt with its target, for offline runs of the pipeline
+        server = FakeCompletionServer(
+            get_oracle_responses(args.prompts), latency=args.fake_latency
+        ).start()
+        url = server.url
+    client = CompletionClient(
+        url,
+        model=args.model,
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+        api_key=args.api_key,
+        max_connections=args.concurrency,
+    )
+    try:
+        stats = evaluate_prompt_file(
+            args.prompts,
+            args.output,
+            template,
+            client,
+            cache_dir=args.cache_dir,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            max_retries=args.max_retries,
+            backoff=args.backoff,
+        )
+    finally:
+        client.close()
+        if server is not None:
+            server.stop()
+    summary = stats.summary()
+
+    # print out the run statistics
+    sep = "-" * 50
+    print(f"\nEvaluated {summary['n_prompts']} prompts with {args.model}\n{sep}")
+    print(f"throughput     {summary['prompts_per_second']:>10.1f} prompts/s")
+    print(f"cache hit rate {100 * summary['cache_hit_rate']:>10.1f}%")
+    print(f"requests       {summary['n_requests']:>10d}")
+    print(f"retries        {summary['n_retries']:>10d}")
+    print(f"failed         {summary['n_failed']:>10d}")
+    for error in dict.fromkeys(stats.errors.values()):
+        print(f"    error: {error}")
+    for percentile in ["p50", "p90", "p99"]:
+        latency = summary[f"latency_{percentile}"]
+        if latency is not None:
+            print(f"latency {percentile}    {1000 * latency:>10.1f} ms")
+    print(sep)
+    if args.stats_output is not None:
+        with open(args.stats_output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("prompts", type=str, help="prompt records from render_prompts")
+    parser.add_argument(
+        "--template", choices=list(TEMPLATES), default="meta_action", type=str
+    )
+    parser.add_argument("--horizon", default="dt_1.00", type=str)
+    parser.add_argument(
+        "--horizons", nargs="+", default=["dt_1.00", "dt_2.00", "dt_3.00"], type=str
+    )
+    parser.add_argument("--url", default="http://localhost:8000", type=str)
+    parser.add_argument("--model", default="default", type=str)
+    parser.add_argument("--api_key", default=None, type=str)
+    parser.add_argument("--max_tokens", default=64, type=int)
+    parser.add_argument("--temperature", default=0.0, type=float)
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="serve the prompt targets from a local fake server instead of --url",
+    )
+    parser.add_argument("--fake_latency", default=0.05, type=float)
+    parser.add_argument("--concurrency", default=16, type=int)
+    parser.add_argument(
+        "--batch_size", default=1, type=int, help="number of prompts per request"
+    )
+    parser.add_argument("--max_retries", default=4, type=int)
+    parser.add_argument("--backoff", default=0.5, type=float)
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        type=str,
+        help="reuse responses from earlier runs with the same model and prompt",
+    )
+    parser.add_argument("--output", default="predictions.jsonl", type=str)
+    parser.add_argument("--stats_output", default=None, type=str)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,92 @@
+import json
+import os
+import time
+from argparse import ArgumentParser
+
+from avlm.columnar import ACTION_SOURCES, get_columnar_path, write_columnar
+from avlm.metrics import SPEED_EDGES, evaluate_files
+
+
+def main(args):
+    """Evaluate prediction files against the ground truth of a dataset"""
+    t_start = time.perf_counter()
+
+    # ground truth columns, converted once from the shards if needed
+    paths = []
+    for split in args.splits:
+        prefix = f"{args.output_prefix}_{split}"
+        path = get_columnar_path(prefix)
+        if not os.path.exists(os.path.join(path, "schema.json")):
+            print(f"Writing the columnar ground truth of {split} to {path}")
+            write_columnar(prefix, path)
+        paths.append(path)
+
+    results = evaluate_files(
+        args.predictions,
+        paths,
+        workers=args.workers,
+        speed_edges=args.speed_edges,
+        slice_source=args.slice_source,
+        slice_horizon=args.slice_horizon,
+    )
+
+    # print out the headline metrics of each file
+    sep = "-" * 50
+    print(
+        f"\nEvaluated {len(results)} prediction files in"
+        f" {time.perf_counter() - t_start:.1f} s\n{sep}"
+    )
+    for file, result in results.items():
+        print(f"{file} ({result['n_predictions']} predictions):")
+        metrics = result["metrics"]["all"]["all"]
+        for field, values in metrics.items():
+            if field.startswith("waypoints"):
+                for horizon, ade, fde, missing in zip(
+                    values["horizons"], values["ade"], values["fde"], values["missing"]
+                ):
+                    if fde is not None:
+                        print(
+                            f"    {field:<20s} {horizon}  ADE {ade:>8.3f}  FDE {fde:>8.3f}"
+                            f"  missing {missing}"
+                        )
+        for horizon, entry in metrics.get(args.slice_source, {}).items():
+            if entry["joint_accuracy"] is not None:
+                print(
+                    f"    {'meta_actions':<20s} {horizon}"
+                    f"  lateral {100 * entry['lateral']['accuracy']:>6.2f}%"
+                    f"  longitudinal {100 * entry['longitudinal']['accuracy']:>6.2f}%"
+                    f"  joint {100 * entry['joint_accuracy']:>6.2f}%"
+                    f"  missing {entry['missing']}"
+                )
+    print(sep)
+    with open(args.output, "w") as f:
+        json.dump(results, f)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("predictions", nargs="+", type=str, help="prediction files")
+    parser.add_argument("--output_prefix", default="dataset", type=str)
+    parser.add_argument("--splits", nargs="+", default=["val"], type=str)
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="number of processes over prediction files, 1 runs serially",
+    )
+    parser.add_argument(
+        "--speed_edges", nargs="+", default=list(SPEED_EDGES), type=float
+    )
+    parser.add_argument(
+        "--slice_source", choices=ACTION_SOURCES, default=ACTION_SOURCES[0], type=str
+    )
+    parser.add_argument(
+        "--slice_horizon",
+        default=0,
+        type=int,
+        help="index of the action horizon of the action class slices",
+    )
+    parser.add_argument("--output", default="metrics.json", type=str)
+    args = parser.parse_args()
+
+    main(args)
@@ -1,43 +1,157 @@
-import json
 import os
+import time
 from argparse import ArgumentParser
-from typing import TYPE_CHECKING, Dict
-
-import numpy as np
-from avapi.nuscenes import nuScenesManager
-from avstack.geometry import q_mult_vec, q_stan_to_cam
-from avstack.geometry.transformations import project_to_image, transform_orientation
-from tqdm import tqdm
-
-from avlm.actions import ACTIONS, Lateral, Longitudinal
-
-
-if TYPE_CHECKING:
-    from avstack.environment import ObjectState
-
-
-def convert_object_to_dictionary_bev(obj: "ObjectState") -> Dict:
-    """Converts object to dictionary for JSON storage
-
-    Assumes input data is in forward-facing camera reference frame with coordinates:
-    X: +right
-    Y: +down
-    Z: +forward
-
-    Puts all the data in the BEV reference frame with the coordinates:
-    X: +right
-    Y: +forward
-    Z: marginalized out (was +up)
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Dict, Iterator, Tuple
+
+from avlm.checkpoint import SceneCheckpoints, process_scene_checkpointed
+from avlm.columnar import write_columnar
+from avlm.dataset import AVLMDataset
+from avlm.dense import DenseWriter, build_dense_scene
+from avlm.generate import GenerationConfig, build_metadata, iter_scene, process_scene
+from avlm.image_cache import ImageCacheConfig, build_image_cache
+from avlm.instrument import NULL_TIMER, StageTimer, write_run_report
+from avlm.scene import (
+    build_scene_manager,
+    check_scene_arguments,
+    get_worker_scene_manager,
+    init_worker_scene_manager,
+)
+from avlm.shards import DatasetWriter, assemble_nested_json
+
+
+def _run_scene_worker(
+    i_scene: int,
+    scene: str,
+    config: GenerationConfig,
+    checkpoint_dir: str = None,
+    instrument: bool = False,
+    dense: bool = False,
+) -> Dict:
+    """Process a single scene in a worker, recording a skip if it cannot be loaded
+
+    If instrument is true, the stage timings of this scene are returned for
+    the main process to merge. If dense is true, the dense arrays of the
+    scene are returned instead of its frames (see avlm.dense).
     """
-    obj_dict = {
-        "ID": obj.ID,
-        "class": obj.obj_type,
-        "position": list(obj.position.x[[0, 2]]),
-        "velocity": list(obj.velocity.x[[0, 2]]),
-        "speed": obj.velocity.norm(),
-        "angle": transform_orientation(obj.attitude.q, "quat", "euler")[2],
+    timer = StageTimer() if instrument else NULL_TIMER
+    result = {
+        "i_scene": i_scene,
+        "scene": scene,
+        "agents": None,
+        "status": "skipped",
+        "worker": os.getpid(),
+        "timer": timer if instrument else None,
     }
-    return obj_dict
+    if checkpoint_dir is not None:
+        checkpoints = SceneCheckpoints(checkpoint_dir, config)
+        agents, result["status"] = process_scene_checkpointed(
+            get_worker_scene_manager(),
+            scene,
+            config,
+            checkpoints,
+            progress=False,
+            timer=timer,
+        )
+        if agents is not None:
+            result["agents"] = [(entry["key"], entry["frames"]) for entry in agents]
+        return result
+    try:
+        with timer.stage("scene_load"):
+            SD = get_worker_scene_manager().get_scene_dataset_by_name(scene)
+    except Exception:
+        timer.count("scene_load_failures")
+        return result
+    if dense:
+        result["agents"] = build_dense_scene(SD, config, timer=timer)
+        result["status"] = "generated"
+        return result
+    agents = process_scene(SD, scene, config, progress=False, timer=timer)
+    result["agents"] = [(key, list(frames.values())) for key, frames in agents.items()]
+    result["status"] = "generated"
+    return result
+
+
+def iter_scene_results(
+    SM,
+    scenes,
+    config: GenerationConfig,
+    pool: ProcessPoolExecutor = None,
+    max_pending: int = 1,
+    checkpoint_dir: str = None,
+    timer: StageTimer = NULL_TIMER,
+    dense: bool = False,
+) -> Iterator[Tuple[int, str, Iterator, str, int]]:
+    """Iterate over the results of all scenes in scene order
+
+    Yields the scene index, scene name, an iterable over the agent key and
+    frames of each agent (None if the scene could not be loaded), the status
+    of the scene (see process_scene_checkpointed), and the process that
+    handled the scene. Without a pool or checkpoints, frames are generated
+    lazily as they are consumed; with a pool, up to max_pending scenes are
+    processed ahead of the consumer. Stage timings from the workers are
+    merged into timer. If dense is true, the dense arrays of each scene are
+    yielded in place of the agent frames.
+    """
+    if pool is None:
+        checkpoints = None
+        if checkpoint_dir is not None:
+            checkpoints = SceneCheckpoints(checkpoint_dir, config)
+        for i_scene, scene in enumerate(scenes):
+            if checkpoints is not None:
+                agents, status = process_scene_checkpointed(
+                    SM, scene, config, checkpoints, timer=timer
+                )
+                if agents is not None:
+                    agents = [(entry["key"], entry["frames"]) for entry in agents]
+                yield i_scene, scene, agents, status, os.getpid()
+                continue
+            try:
+                with timer.stage("scene_load"):
+                    SD = SM.get_scene_dataset_by_name(scene)
+            except Exception:
+                timer.count("scene_load_failures")
+                yield i_scene, scene, None, "skipped", os.getpid()
+                continue
+            if dense:
+                agents = build_dense_scene(SD, config, timer=timer)
+            else:
+                agents = iter_scene(SD, scene, config, timer=timer)
+            yield i_scene, scene, agents, "generated", os.getpid()
+    else:
+        pending = deque()
+
+        def pop_result():
+            with timer.stage("scene_wait"):
+                result = pending.popleft().result()
+            if result["timer"] is not None:
+                timer.merge(result["timer"])
+            return (
+                result["i_scene"],
+                result["scene"],
+                result["agents"],
+                result["status"],
+                result["worker"],
+            )
+
+        for i_scene, scene in enumerate(scenes):
+            pending.append(
+                pool.submit(
+                    _run_scene_worker,
+                    i_scene,
+                    scene,
+                    config,
+                    checkpoint_dir,
+                    timer.enabled,
+                    dense,
+                )
+            )
+            if len(pending) >= max_pending:
+                yield pop_result()
+        while pending:
+            yield pop_result()
 
 
 def main(args, d_key_thresh=15):
@@ -49,381 +163,227 @@ def main(args, d_key_thresh=15):
 
     if len(args.output_prefix) == 0:
         raise ValueError("Output prefix is empty, provide something like 'dataset'")
+    if args.workers < 1:
+        raise ValueError(f"Number of workers must be at least 1, got {args.workers}")
+    if args.dense and (
+        args.checkpoint_dir or args.columnar or args.image_cache_dir is not None
+    ):
+        raise ValueError(
+            "--dense cannot be combined with --checkpoint_dir, --columnar,"
+            " or --image_cache_dir"
+        )
 
     # parse dataset name
-    if args.dataset.lower() == "nuscenes":
-        SM = nuScenesManager(
-            data_dir=args.dataset_path,
-            split=args.version,
-        )
-    elif args.dataset.lower() == "carla":
-        raise NotImplementedError
-    else:
-        raise NotImplementedError(args.dataset.lower())
+    SM = build_scene_manager(args.dataset, args.dataset_path, args.version)
 
     # build metadata
-    metadata = {
-        "action_table": {
-            action.__name__: {str(state): int(state) for state in action}
-            for action in ACTIONS
-        },
-        "reverse_action_table": {
-            action.__name__: {int(state): str(state) for state in action}
-            for action in ACTIONS
-        },
-        "dataset": args.dataset,
-        "waypoints_3d_reference": "camera",
-    }
-
-    # loop over splits
-    for split in ["train", "val", "test"]:
-        frames_completed = 0
-        agents_completed = 0
-        scenes_completed = 0
-        scenes = SM.splits_scenes[split]
-        print(f"\n\nProcessing split: {split}, {len(scenes)} scenes\n\n")
-
-        # loop over available scenes
-        ds_scenes = {}
-        for i_scene, scene in enumerate(scenes):
-            print(f"Processing scene {i_scene+1}/{len(scenes)}")
-            ds_agents = {}
-            try:
-                SD = SM.get_scene_dataset_by_name(scene)
-            except Exception:
-                print(
-                    f"Scene {scene} could not be loaded, potentially due to"
-                    f"missing CAN data (for nuScenes)...skipping"
-                )
-                continue
+    metadata = build_metadata(args.dataset)
+    config = GenerationConfig(
+        d_key_thresh=d_key_thresh, waypoints_all_cameras=args.waypoints_all_cameras
+    )
 
-            # loop over available agents
-            agents = SD.get_agent_set(frame=0)
-            for i_agent, agent in enumerate(agents):
-                print(f"Processing agent {i_agent+1}/{len(agents)}")
-                ds_agent = {}
-                agent_reference_init = None
-                agent_state_last = None
+    # pool of workers with their own scene managers
+    pool = None
+    if args.workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker_scene_manager,
+            initargs=(args.dataset, args.dataset_path, args.version),
+        )
 
-                # loop over frames
-                timestamps_all = SD.get_timestamps(
-                    sensor=None, agent=agent, utime=False
+    try:
+        # loop over splits
+        for split in ["train", "val", "test"]:
+            timer = NULL_TIMER if args.no_instrumentation else StageTimer()
+            t_start = time.perf_counter()
+            frames_completed = 0
+            agents_completed = 0
+            scenes_completed = 0
+            scenes_skipped = 0
+            scenes_cached = 0
+            scenes_relabeled = 0
+            scenes = SM.splits_scenes[split]
+            print(f"\n\nProcessing split: {split}, {len(scenes)} scenes\n\n")
+
+            # loop over available scenes -- each frame is streamed to disk
+            prefix_split = f"{args.output_prefix}_{split}"
+            if args.dense:
+                writer = DenseWriter(prefix_split, metadata=metadata, config=config)
+            else:
+                writer = DatasetWriter(
+                    prefix_split,
+                    metadata=metadata,
+                    max_shard_bytes=int(args.max_shard_mb * 2**20),
+                    timer=timer,
                 )
-                frames_all = SD.get_frames(sensor=None, agent=agent)
-                for frame in tqdm(frames_all):
-                    sensor_primary = (
-                        "main_camera"  # assume all cameras are nearly synched
-                    )
-
-                    #########################################################
-                    # NOTE: I am not 100% sure that changing frames
-                    # correctly accounts for the velocity and acceleration
-                    # fields yet, so this is something to watch out for
-                    #########################################################
-
-                    # get agent information
-                    timestamp = SD.get_timestamp(
-                        frame=frame, sensor=sensor_primary, agent=agent
-                    )
-                    cam_calib = SD.get_calibration(
-                        frame=frame, sensor=sensor_primary, agent=agent
-                    )
-
-                    # -- global frame is with world origin
-                    agent_state_global = SD.get_agent(frame=frame, agent=agent)
-                    agent_state_reference = agent_state_global.as_reference()
-                    if agent_reference_init is None:
-                        agent_reference_moving = agent_state_global.as_reference()
-                        # make it a fixed reference
-                        agent_reference_init = (
-                            agent_reference_moving.get_static_reference()
-                        )
-
-                    # -- static local frame is with t=0 origin
-                    agent_state_local = agent_state_global.change_reference(
-                        agent_reference_init,
-                        inplace=False,
-                    )
-
-                    # -- diff frame is differential from last (TODO: fix this)
-                    if agent_state_last is None:
-                        agent_state_diff = agent_state_global.change_reference(
-                            agent_state_global.as_reference(),  # change with itself, so should be 0's
-                            inplace=False,
-                        )
-                    else:
-                        agent_state_diff = agent_state_global.change_reference(
-                            agent_state_last.as_reference(),
-                            inplace=False,
-                        )
-                        agent_state_last = agent_state_global
-
-                    # get camera images
-                    camera_image_paths = {
-                        sensor: SD.get_sensor_data_filepath(
-                            frame=frame, sensor=sensor, agent=agent
-                        )
-                        for sensor in SD.get_sensor_names_by_type(
-                            sensor_type="camera", agent=agent
-                        )
-                    }
-
-                    # get future waypoints
-                    dt_waypoints = 0.5  # spacing between waypoints
-                    int_waypoints = 3  # total time interval
-                    waypoints_3d = {}
-                    waypoints_pixel = {}
-                    for dt_ahead in np.arange(
-                        dt_waypoints, dt_waypoints + int_waypoints, dt_waypoints
-                    ):
-                        if timestamp + dt_ahead <= timestamps_all[-1]:
-                            # get the frame corresponding to this time
-                            frame_ahead = SD.get_frame_at_timestamp(
-                                timestamp=timestamp + dt_ahead,
-                                sensor=sensor_primary,
-                                agent=None,
-                                utime=False,
-                                dt_tolerance=0.5,
-                            )
-
-                            # get future agent position for 3d waypoints in cam coordinates
-                            agent_future = SD.get_agent(frame=frame_ahead, agent=agent)
-                            box_future = agent_future.box.change_reference(
-                                agent_state_reference, inplace=False
-                            )
-                            waypoint_3d = q_mult_vec(
-                                q_stan_to_cam,
-                                box_future.position.x,
-                            )
-
-                            # convert to pixel coordinates in camera
-                            position_future_camera = (
-                                agent_future.position.change_reference(
-                                    cam_calib.reference, inplace=False
-                                )
-                            )
-                            waypoint_pixel = project_to_image(
-                                position_future_camera[:, None].T, cam_calib.P
-                            )[0, :]
-                        else:
-                            waypoint_3d = None
-                            waypoint_pixel = None
-
-                        # store waypoints
-                        waypoints_3d[f"dt_{dt_ahead:.2f}"] = (
-                            list(waypoint_3d)
-                            if waypoint_3d is not None
-                            else waypoint_3d
-                        )
-                        waypoints_pixel[f"dt_{dt_ahead:.2f}"] = (
-                            list(waypoint_pixel)
-                            if waypoint_pixel is not None
-                            else waypoint_pixel
+            with writer:
+                for i_scene, scene, agents, status, worker in iter_scene_results(
+                    SM,
+                    scenes,
+                    config,
+                    pool=pool,
+                    max_pending=2 * args.workers,
+                    checkpoint_dir=args.checkpoint_dir,
+                    timer=timer,
+                    dense=args.dense,
+                ):
+                    print(f"Processing scene {i_scene+1}/{len(scenes)}")
+                    if agents is None:
+                        print(
+                            f"Scene {scene} could not be loaded, potentially due to"
+                            f"missing CAN data (for nuScenes)...skipping"
+                            f" (worker {worker})"
                         )
+                        scenes_skipped += 1
+                        timer.count("scenes_skipped")
+                        continue
 
-                    # get future meta actions
-                    dt_action = 1
-                    int_action = 3
-                    meta_actions_from_ti = {}
-                    meta_actions_from_dt = {}
-                    has_future_in_scene = False
-                    agent_state_global_last = agent_state_global
-                    for dt_ahead in np.arange(
-                        dt_action, dt_action + int_action, dt_action
-                    ):
-                        # only run if the future time is within the dataset
-                        if timestamp + dt_ahead <= timestamps_all[-1]:
-                            has_future_in_scene = True
-                            # get the frame corresponding to this time
-                            frame_ahead = SD.get_frame_at_timestamp(
-                                timestamp=timestamp + dt_ahead,
-                                sensor=sensor_primary,
-                                agent=None,
-                                utime=False,
-                                dt_tolerance=0.5,
-                            )
-
-                            # get the meta action at this time relative to the t=now
-                            agent_current = agent_state_global
-                            agent_future = SD.get_agent(frame=frame_ahead, agent=agent)
-                            meta_action_from_ti = {
-                                "lateral": str(
-                                    Lateral.evaluate(agent_current, agent_future)
-                                ),
-                                "longitudinal": str(
-                                    Longitudinal.evaluate(agent_current, agent_future)
-                                ),
-                            }
-
-                            # get the meta action at this time relative to t=t-dt
-                            agent_current = agent_state_global_last
-                            agent_future = SD.get_agent(frame=frame_ahead, agent=agent)
-                            meta_action_from_dt = {
-                                "lateral": str(
-                                    Lateral.evaluate(agent_current, agent_future)
-                                ),
-                                "longitudinal": str(
-                                    Longitudinal.evaluate(agent_current, agent_future)
-                                ),
-                            }
-
-                            # update for the next meta_action_from_dt
-                            agent_state_global_last = agent_future
-                        else:
-                            meta_action_from_ti = None
-                            meta_action_from_dt = None
-
-                        # store results
-                        meta_actions_from_ti[f"dt_{dt_ahead:.2f}"] = meta_action_from_ti
-                        meta_actions_from_dt[f"dt_{dt_ahead:.2f}"] = meta_action_from_dt
-
-                    # get the current states of all visible objects -- in camera coordinates
-                    objs = SD.get_objects(
-                        frame=frame, sensor=sensor_primary, agent=agent
+                    # add for this scene
+                    n_agents, n_frames = writer.write_scene(
+                        f"scene_{i_scene}", scene, agents
                     )
-                    obj_IDs = [obj.ID for obj in objs]
-
-                    # get the future trajectories of all objects -- in camera coordinates
-                    dt_traj = 0.5  # spacing between waypoints
-                    int_traj = 3  # total time interval
-                    obj_trajectories = {
-                        "previous": {obj.ID: [] for obj in objs},
-                        "current": {obj.ID: None for obj in objs},
-                        "future": {obj.ID: [] for obj in objs},
-                    }
-
-                    # get static camera reference frame (no velocity)
-                    static_cam_reference = cam_calib.reference.get_static_reference()                    
-                    
-                    # loop over the dts behind and ahead
-                    dt_range = np.arange(-dt_traj, dt_traj + int_traj, dt_traj)
-                    if 0 not in dt_range:
-                        raise RuntimeError(
-                            "We need to include dt=0 for the current states"
-                        )
-                    
-
-                    for dt_traj_i in dt_range:
-                        # only run if the consider time is within the dataset
-                        t_this = timestamp + dt_traj_i
-                        if (t_this > timestamps_all[0]) and (
-                            t_this <= timestamps_all[-1]
-                        ):
-                            # get the frame corresponding to this time
-                            frame_this = SD.get_frame_at_timestamp(
-                                timestamp=t_this,
-                                sensor=sensor_primary,
-                                agent=None,
-                                utime=False,
-                                dt_tolerance=0.5,
-                            )
-
-                            # get traj at this time -- assumes consistent object IDs
-                            objs_traj_point = SD.get_objects(
-                                frame=frame_this, sensor=sensor_primary, agent=agent
-                            )
-                            for obj_traj_point in objs_traj_point:
-                                if obj_traj_point.ID in obj_IDs:
-                                    # change reference frame -- make it static so velocity is absolute
-                                    obj_traj_point.change_reference(
-                                        static_cam_reference, inplace=True
-                                    )
-
-                                    # append the object
-                                    entry = {
-                                        "frame": frame_ahead,
-                                        "timestamp": timestamp + dt_ahead,
-                                        "state": convert_object_to_dictionary_bev(
-                                            obj_traj_point
-                                        ),
-                                    }
-                                    if dt_traj_i == 0:
-                                        key = "current"
-                                        obj_trajectories[key][obj_traj_point.ID] = entry
-                                    else:
-                                        if dt_traj_i < 0:
-                                            key = "previous"
-                                        else:
-                                            key = "future"
-                                        obj_trajectories[key][obj_traj_point.ID].append(entry)
-                    
-                    # denote the set of "key" objects
-                    key_objects = [
-                        obj.ID for obj in objs if obj.position.norm() < d_key_thresh
-                    ]
-
-                    # store all data for this frame
-                    token = SD._get_sensor_record(frame, SD.sensors[sensor_primary])
-                    ds_frame = {
-                        "token": token,
-                        "scene": scene,
-                        "agent": agent,
-                        "frame": frame,
-                        "timestamp": timestamp,
-                        "image_paths": camera_image_paths,
-                        "meta_actions_from_ti": meta_actions_from_ti,
-                        "meta_actions_from_dt": meta_actions_from_dt,
-                        "has_future_in_scene": has_future_in_scene,
-                        "waypoints_3d": waypoints_3d,
-                        "waypoints_pixel": waypoints_pixel,
-                        "object_states": {
-                            "key_objects": key_objects,
-                            "trajectoriers": obj_trajectories,
-                        },
-                        "ego_state": {
-                            view: convert_object_to_dictionary_bev(state)
-                            for view, state in zip(
-                                ["global", "local", "diff"],
-                                [
-                                    agent_state_global,
-                                    agent_state_local,
-                                    agent_state_diff,
-                                ],
-                            )
-                        },
-                    }
-
-                    # add this frame to the agent
-                    ds_agent[f"frame_{frame}"] = ds_frame
-                    frames_completed += 1
-
-                # add for this agent
-                ds_agents[f"agent_{agent}"] = ds_agent
-                agents_completed += 1
-
-            # add for this scene
-            ds_scenes[f"scene_{i_scene}"] = ds_agents
-            scenes_completed += 1
-
-        # add for this scene
-        ds_split = {
-            "dataset": ds_scenes,
-            "metadata": metadata,
-        }
-
-        # print out results
-        sep = "-" * 50
-        print(
-            f"\nFinished generating {split} dataset! Results:"
-            f"\n\n{scenes_completed:>6d} scenes completed\n{agents_completed:>6d}"
-            f" agents completed\n{frames_completed:>6d} frames completed\n\n{sep}"
-        )
+                    scenes_completed += 1
+                    scenes_cached += status == "cached"
+                    scenes_relabeled += status == "relabeled"
+                    agents_completed += n_agents
+                    frames_completed += n_frames
+
+            # print out results
+            sep = "-" * 50
+            print(
+                f"\nFinished generating {split} dataset! Results:"
+                f"\n\n{scenes_completed:>6d} scenes completed\n{agents_completed:>6d}"
+                f" agents completed\n{frames_completed:>6d} frames completed"
+                f"\n{scenes_skipped:>6d} scenes skipped"
+                f"\n{scenes_cached:>6d} scenes loaded from checkpoints"
+                f"\n{scenes_relabeled:>6d} scenes relabeled from checkpoints\n\n{sep}"
+            )
+
+            # save the nested dataset for compatibility
+            if not (args.no_nested_json or args.dense):
+                with timer.stage("nested_json"):
+                    assemble_nested_json(prefix_split, f"{prefix_split}.json")
+
+            # save the columnar format for random access
+            if args.columnar and (frames_completed > 0):
+                with timer.stage("columnar"):
+                    write_columnar(prefix_split)
+
+            # save the run report with the stage timings
+            if timer.enabled:
+                write_run_report(
+                    f"{prefix_split}_report.json",
+                    timer,
+                    split=split,
+                    dataset=args.dataset,
+                    workers=args.workers,
+                    config=asdict(config),
+                    wall_time_s=time.perf_counter() - t_start,
+                    summary={
+                        "scenes_completed": scenes_completed,
+                        "agents_completed": agents_completed,
+                        "frames_completed": frames_completed,
+                        "scenes_skipped": scenes_skipped,
+                        "scenes_cached": scenes_cached,
+                        "scenes_relabeled": scenes_relabeled,
+                    },
+                )
 
-        # save dataset
-        file_out = os.path.join(f"{args.output_prefix}_{split}.json")
-        if len(os.path.dirname(file_out)) > 0:
-            os.makedirs(os.path.dirname(file_out), exist_ok=True)
-        with open(file_out, "w") as f:
-            json.dump(ds_split, f)
+        # decode and resize the camera images of all splits once
+        if args.image_cache_dir is not None:
+            datasets = [
+                AVLMDataset(args.output_prefix, splits=[split])
+                for split in ["train", "val", "test"]
+            ]
+            stats = build_image_cache(
+                datasets,
+                args.image_cache_dir,
+                ImageCacheConfig(height=args.image_size[0], width=args.image_size[1]),
+                workers=args.workers,
+            )
+            print(
+                f"\nImage cache: {stats['images_decoded']} images decoded,"
+                f" {stats['images_reused']} reused,"
+                f" {stats['images_compacted']} compacted"
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
-    parser.add_argument("dataset_path", type=str)
     parser.add_argument(
-        "--version", type=str, required=True, choices=["v1.0-mini", "v1.0-trainval"]
+        "dataset_path", nargs="?", default=None, type=str, help="not used by synthetic"
+    )
+    parser.add_argument(
+        "--version",
+        default=None,
+        type=str,
+        choices=["v1.0-mini", "v1.0-trainval"],
+        help="required with --dataset nuscenes",
     )
     parser.add_argument("--output_prefix", default="dataset", type=str)
-    parser.add_argument("--dataset", choices=["nuscenes"], default="nuscenes", type=str)
+    parser.add_argument(
+        "--dataset", choices=["nuscenes", "synthetic"], default="nuscenes", type=str
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="number of processes for scene processing, 1 runs serially",
+    )
+    parser.add_argument(
+        "--max_shard_mb",
+        default=256,
+        type=float,
+        help="size at which the JSON Lines shards are rolled over",
+    )
+    parser.add_argument(
+        "--no_nested_json",
+        action="store_true",
+        help="skip assembling the nested JSON from the shards",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="also write the memory-mappable columnar format",
+    )
+    parser.add_argument(
+        "--dense",
+        action="store_true",
+        help="write the dense trajectory store instead of per-frame records",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        default=None,
+        type=str,
+        help="folder for per-scene checkpoints to resume and incrementally update runs",
+    )
+    parser.add_argument(
+        "--waypoints_all_cameras",
+        action="store_true",
+        help="also project the waypoints into every camera",
+    )
+    parser.add_argument(
+        "--no_instrumentation",
+        action="store_true",
+        help="skip the per-stage timings and the run report",
+    )
+    parser.add_argument(
+        "--image_cache_dir",
+        default=None,
+        type=str,
+        help="folder for a cache of decoded and resized camera images",
+    )
+    parser.add_argument(
+        "--image_size",
+        default=[224, 224],
+        nargs=2,
+        type=int,
+        metavar=("HEIGHT", "WIDTH"),
+        help="size of the cached camera images",
+    )
     args = parser.parse_args()
+    check_scene_arguments(parser, args)
     main(args)
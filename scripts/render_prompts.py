@@ -0,0 +1,93 @@
+import json
+import time
+from argparse import ArgumentParser
+
+from avlm.prompts import TEMPLATES, get_template, render_dataset
+
+
+def main(args):
+    """Render the frames of a generated dataset to prompt records"""
+    t_start = time.perf_counter()
+    template = get_template(
+        args.template,
+        cameras=tuple(args.cameras),
+        horizon=args.horizon,
+        horizons=tuple(args.horizons),
+        source=args.source,
+        max_objects=args.max_objects,
+    )
+    stats = render_dataset(
+        args.output_prefix,
+        template,
+        args.output,
+        splits=args.splits,
+        cache_dir=args.cache_dir,
+        tokenizer=args.tokenizer,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+    summary = stats.summary()
+
+    # print out the length statistics
+    sep = "-" * 50
+    print(
+        f"\nRendered {summary['n_rendered']} of {summary['n_frames']} frames with"
+        f" {args.template} in {time.perf_counter() - t_start:.1f} s"
+        f" ({100 * summary['cache_hit_rate']:.1f}% cached)\n{sep}"
+    )
+    for field in ["prompt", "target"]:
+        print(f"{field}:")
+        for unit, lengths in summary[field].items():
+            print(
+                f"    {unit:<8s} mean {lengths['mean']:>8.1f}  p50 {lengths['p50']:>8.1f}"
+                f"  p95 {lengths['p95']:>8.1f}  max {lengths['max']:>8d}"
+            )
+    print(sep)
+    if args.stats_output is not None:
+        with open(args.stats_output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("output_prefix", type=str, help="prefix of the dataset")
+    parser.add_argument("--splits", nargs="+", default=["train"], type=str)
+    parser.add_argument(
+        "--template", choices=list(TEMPLATES), default="meta_action", type=str
+    )
+    parser.add_argument("--cameras", nargs="+", default=["CAM_FRONT"], type=str)
+    parser.add_argument("--horizon", default="dt_1.00", type=str)
+    parser.add_argument(
+        "--horizons", nargs="+", default=["dt_1.00", "dt_2.00", "dt_3.00"], type=str
+    )
+    parser.add_argument(
+        "--source",
+        choices=["meta_actions_from_ti", "meta_actions_from_dt"],
+        default="meta_actions_from_ti",
+        type=str,
+    )
+    parser.add_argument("--max_objects", default=10, type=int)
+    parser.add_argument("--output", default="prompts.jsonl", type=str)
+    parser.add_argument("--stats_output", default=None, type=str)
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        type=str,
+        help="reuse prompts rendered before with the same template and frame",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        default=None,
+        type=str,
+        help="name or path of a local tokenizer for token counts",
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="number of processes for rendering, 1 runs serially",
+    )
+    parser.add_argument("--chunk_size", default=1024, type=int)
+    args = parser.parse_args()
+
+    main(args)
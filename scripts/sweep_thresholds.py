@@ -0,0 +1,149 @@
+import json
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+from avlm.generate import GenerationConfig
+from avlm.scene import (
+    build_scene_manager,
+    check_scene_arguments,
+    get_worker_scene_manager,
+    init_worker_scene_manager,
+)
+from avlm.threshold_sweep import (
+    SOURCES,
+    ActionDeltas,
+    get_class_balance,
+    sweep_thresholds,
+)
+
+
+def _scene_deltas_worker(
+    scenes: List[str], config: GenerationConfig, source: str
+) -> ActionDeltas:
+    """Compute the deltas of a chunk of scenes in a worker"""
+    deltas = ActionDeltas.from_config(config, source=source)
+    for scene in scenes:
+        try:
+            SD = get_worker_scene_manager().get_scene_dataset_by_name(scene)
+        except Exception:
+            print(f"Scene {scene} could not be loaded...skipping")
+            continue
+        deltas.add_scene(SD, config)
+    return deltas
+
+
+def main(args):
+    """Sweep the meta action thresholds over the scenes of a dataset"""
+    t_start = time.perf_counter()
+    config = GenerationConfig(dt_action=args.dt_action, int_action=args.int_action)
+    SM = build_scene_manager(args.dataset, args.dataset_path, args.version)
+    scenes = [scene for split in args.splits for scene in SM.splits_scenes[split]]
+
+    # compute the deltas once, one partial set per chunk of scenes
+    deltas = ActionDeltas.from_config(config, source=args.source)
+    if args.workers > 1:
+        n_chunks = args.workers
+        chunks = [scenes[i_start::n_chunks] for i_start in range(n_chunks)]
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=init_worker_scene_manager,
+            initargs=(args.dataset, args.dataset_path, args.version),
+        ) as pool:
+            futures = [
+                pool.submit(_scene_deltas_worker, chunk, config, args.source)
+                for chunk in chunks
+            ]
+            for future in futures:
+                deltas.merge(future.result())
+    else:
+        init_worker_scene_manager(args.dataset, args.dataset_path, args.version)
+        deltas.merge(_scene_deltas_worker(scenes, config, args.source))
+    t_deltas = time.perf_counter() - t_start
+
+    # label all threshold settings
+    results = sweep_thresholds(
+        deltas,
+        thresh_veer=args.thresh_veer,
+        thresh_turn=args.thresh_turn,
+        thresh_change=args.thresh_change,
+        thresh_stop=args.thresh_stop,
+    )
+    t_sweep = time.perf_counter() - t_start - t_deltas
+
+    # print out the class balance of each setting
+    sep = "-" * 50
+    print(
+        f"\nSwept {results['n_pairs']} (frame, horizon) pairs: deltas in"
+        f" {t_deltas:.1f} s, labels in {t_sweep:.1f} s\n{sep}"
+    )
+    for family in ["lateral", "longitudinal"]:
+        result = results[family]
+        name_a, name_b = list(result.keys())[:2]
+        balance = get_class_balance(results, family)
+        flips_a = np.asarray(result[f"flips_{name_a}"])
+        print(
+            f"{family} class percentages ({', '.join(result['classes'])})"
+            f" and labels flipped at the next {name_a}:"
+        )
+        for i_a, value_a in enumerate(result[name_a]):
+            for i_b, value_b in enumerate(result[name_b]):
+                fractions = " ".join(f"{100 * f:6.2f}" for f in balance[i_a, i_b])
+                flipped = f"{flips_a[i_a, i_b]:>8d}" if i_a < len(flips_a) else ""
+                print(
+                    f"    {name_a}={value_a:<6g} {name_b}={value_b:<6g}"
+                    f" {fractions} {flipped}"
+                )
+    print(sep)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "dataset_path", nargs="?", default=None, type=str, help="not used by synthetic"
+    )
+    parser.add_argument(
+        "--version",
+        default=None,
+        type=str,
+        choices=["v1.0-mini", "v1.0-trainval"],
+        help="required with --dataset nuscenes",
+    )
+    parser.add_argument(
+        "--dataset", choices=["nuscenes", "synthetic"], default="nuscenes", type=str
+    )
+    parser.add_argument(
+        "--splits", nargs="+", default=["train", "val", "test"], type=str
+    )
+    parser.add_argument("--source", choices=SOURCES, default=SOURCES[0], type=str)
+    parser.add_argument("--dt_action", default=1.0, type=float)
+    parser.add_argument("--int_action", default=3.0, type=float)
+    parser.add_argument("--thresh_veer", nargs="+", default=[3, 4, 5, 6, 7], type=float)
+    parser.add_argument(
+        "--thresh_turn", nargs="+", default=[15, 20, 25, 30], type=float
+    )
+    parser.add_argument(
+        "--thresh_change", nargs="+", default=[0.1, 0.25, 0.5, 1.0], type=float
+    )
+    parser.add_argument(
+        "--thresh_stop", nargs="+", default=[0.25, 0.5, 1.0], type=float
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="number of processes for computing the deltas, 1 runs serially",
+    )
+    parser.add_argument(
+        "--output", default=None, type=str, help="optional JSON file for the results"
+    )
+    args = parser.parse_args()
+    check_scene_arguments(parser, args)
+
+    main(args)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+
+def _make_state(
+    yaw: float,
+    speed: float,
+    t: float = 0.0,
+    ID: int = 0,
+    roll: float = 0.0,
+    pitch: float = 0.0,
+):
+    """Make a vehicle state heading along yaw (degrees) at a given speed
+
+    Roll and pitch (degrees) only tilt the attitude, the velocity stays level.
+    """
+    from avstack.environment.objects import VehicleState
+    from avstack.geometry import Attitude, Box3D, GlobalOrigin3D, Position, Velocity
+    from avstack.geometry.transformations import transform_orientation
+
+    yaw_rad = np.pi / 180 * yaw
+    euler = np.pi / 180 * np.array([roll, pitch, yaw])
+    q = transform_orientation(euler, "euler", "quat")
+    position = Position(np.array([10.0 * t, 0.0, 0.0]), GlobalOrigin3D)
+    attitude = Attitude(q, GlobalOrigin3D)
+    velocity = Velocity(
+        speed * np.array([np.cos(yaw_rad), np.sin(yaw_rad), 0.0]), GlobalOrigin3D
+    )
+    box = Box3D(position=position, attitude=attitude, hwl=[1.5, 1.8, 4.0])
+    state = VehicleState(obj_type="car", ID=ID)
+    state.set(t=t, position=position, box=box, velocity=velocity, attitude=attitude)
+    return state
+
+
+@pytest.fixture
+def make_state():
+    return _make_state
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+def test_counts_of_one_sequence():
+    from avlm.action_stats import ActionStatistics
+    from avlm.actions import ACTION_INVALID, Lateral, Longitudinal
+
+    L, S, A, M = (
+        Lateral.TURN_LEFT,
+        Lateral.STRAIGHT,
+        Longitudinal.ACCEL,
+        Longitudinal.MAINTAIN,
+    )
+    lateral = np.array([[S], [S], [L], [S], [ACTION_INVALID]], dtype=np.int8)
+    longitudinal = np.array([[M], [A], [A], [A], [ACTION_INVALID]], dtype=np.int8)
+    stats = ActionStatistics(["dt_1.00"], max_run_length=2)
+    stats.add_sequence("meta_actions_from_ti", lateral, longitudinal)
+
+    counts = stats.counts["meta_actions_from_ti"]
+    i_s, i_l = sorted(Lateral, key=int).index(S), sorted(Lateral, key=int).index(L)
+    i_a = sorted(Longitudinal, key=int).index(A)
+    assert counts["invalid"].tolist() == [1]
+    assert counts["lateral"][0, i_s] == 3
+    assert counts["lateral"][0, i_l] == 1
+    assert counts["joint"][0, i_l, i_a] == 1
+    assert counts["joint"].sum() == 4
+    assert counts["transitions_lateral"][0, i_s, i_l] == 1
+    assert counts["transitions_lateral"][0, i_l, i_s] == 1
+    assert counts["transitions_lateral"][0].sum() == 3
+    # runs of S (2), L (1), S (1) and A (3, clipped to the last bin)
+    assert counts["runs_lateral"][0, i_s].tolist() == [1, 1]
+    assert counts["runs_longitudinal"][0, i_a].tolist() == [0, 1]
+
+
+def test_records_and_merge_match_scene_labels():
+    from avlm.action_stats import ActionStatistics
+    from avlm.generate import GenerationConfig, process_scene
+    from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+    SM = SyntheticManager(SyntheticConfig(n_scenes=2, n_frames=24, n_objects=2))
+    config = GenerationConfig()
+    from_scenes = ActionStatistics.from_config(config)
+    from_records = ActionStatistics.from_config(config)
+    for scene in SM.scenes:
+        SD = SM.get_scene_dataset_by_name(scene)
+        partial = ActionStatistics.from_config(config)
+        partial.update_from_scene(SD, config)
+        from_scenes.merge(partial)
+        records = [
+            ds_frame
+            for agent in process_scene(SD, scene, config, progress=False).values()
+            for ds_frame in agent.values()
+        ]
+        from_records.update(records)
+
+    assert from_records.n_sequences == from_scenes.n_sequences == 2
+    for source, counts in from_scenes.counts.items():
+        for name, values in counts.items():
+            assert np.array_equal(values, from_records.counts[source][name]), name
+    loaded = ActionStatistics.from_dict(from_scenes.to_dict())
+    assert np.array_equal(
+        loaded.counts["meta_actions_from_dt"]["joint"],
+        from_scenes.counts["meta_actions_from_dt"]["joint"],
+    )
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def _assert_matches_per_object(arrays: dict, expected: list):
+    from avlm.bev import bev_arrays_to_dictionaries
+
+    converted = bev_arrays_to_dictionaries(arrays, arrays["ID"], arrays["class"])
+    for dictionary, expected_dictionary in zip(converted, expected):
+        assert dictionary["ID"] == expected_dictionary["ID"]
+        assert dictionary["class"] == expected_dictionary["class"]
+        for field in ["position", "velocity", "speed"]:
+            assert np.allclose(dictionary[field], expected_dictionary[field])
+        d_angle = dictionary["angle"] - expected_dictionary["angle"]
+        assert np.isclose(np.cos(d_angle), 1.0)
+
+
+def test_identity_matches_per_object(make_state):
+    from avlm.bev import convert_states_to_bev
+    from avlm.generate import convert_object_to_dictionary_bev
+
+    states = [
+        make_state(yaw=yaw, speed=speed, t=t, ID=i)
+        for i, (yaw, speed, t) in enumerate([(0, 5, 0), (30, 2, 1), (-120, 8, 2)])
+    ]
+    arrays = convert_states_to_bev(states)
+    assert arrays["position"].shape == (3, 2)
+    assert arrays["velocity"].shape == (3, 2)
+    assert arrays["speed"].shape == arrays["angle"].shape == (3,)
+    _assert_matches_per_object(
+        arrays, [convert_object_to_dictionary_bev(state) for state in states]
+    )
+
+
+def test_reference_transform_matches_change_reference(make_state):
+    from avstack.geometry import GlobalOrigin3D
+
+    from avlm.bev import convert_states_to_bev, reference_transform
+    from avlm.generate import convert_object_to_dictionary_bev
+
+    reference = make_state(yaw=45, speed=3, t=1).as_reference().get_static_reference()
+    states = [
+        make_state(yaw=yaw, speed=speed, t=t, ID=i)
+        for i, (yaw, speed, t) in enumerate([(0, 5, 0), (60, 2, 2), (170, 4, 3)])
+    ]
+    arrays = convert_states_to_bev(
+        states, reference_transform(GlobalOrigin3D, reference)
+    )
+    _assert_matches_per_object(
+        arrays,
+        [
+            convert_object_to_dictionary_bev(
+                state.change_reference(reference, inplace=False)
+            )
+            for state in states
+        ],
+    )
+
+
+def test_camera_reference_with_roll_and_pitch_matches_change_reference(make_state):
+    from avstack.geometry import GlobalOrigin3D
+
+    from avlm.bev import convert_states_to_bev, reference_transform
+    from avlm.generate import convert_object_to_dictionary_bev
+
+    # camera-like calibration: axes turned to (right, down, forward) and tilted
+    camera = make_state(yaw=-88, speed=0, t=0.15, roll=-93, pitch=4)
+    reference = camera.as_reference().get_static_reference()
+    rng = np.random.default_rng(1)
+    states = [
+        make_state(yaw=yaw, speed=speed, t=t, ID=i, roll=roll, pitch=pitch)
+        for i, (yaw, speed, t, roll, pitch) in enumerate(
+            zip(
+                rng.uniform(-180, 180, 5),
+                rng.uniform(0, 10, 5),
+                rng.uniform(0, 3, 5),
+                rng.uniform(-10, 10, 5),
+                rng.uniform(-10, 10, 5),
+            )
+        )
+    ]
+    arrays = convert_states_to_bev(
+        states, reference_transform(GlobalOrigin3D, reference)
+    )
+    _assert_matches_per_object(
+        arrays,
+        [
+            convert_object_to_dictionary_bev(
+                state.change_reference(reference, inplace=False)
+            )
+            for state in states
+        ],
+    )
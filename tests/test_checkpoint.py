@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class FailingManager:
+    def get_scene_dataset_by_name(self, scene):
+        raise AssertionError("raw scene data should not be loaded")
+
+
+def _checkpoint_agents(n_frames=8):
+    frames = list(range(n_frames))
+    timestamps = [0.5 * frame for frame in frames]
+    label_inputs = {
+        "frames": frames,
+        "timestamps": timestamps,
+        "t_max": timestamps[-1],
+        "quaternions": np.tile([1.0, 0.0, 0.0, 0.0], (n_frames, 1)),
+        "velocities": np.tile([5.0, 0.0, 0.0], (n_frames, 1)),
+    }
+    ds_frames = [{"frame": frame, "meta_actions_from_ti": {}} for frame in frames]
+    return [{"key": "agent_0", "frames": ds_frames, "label_inputs": label_inputs}]
+
+
+def test_label_change_relabels_from_checkpoint(tmp_path):
+    from avlm.checkpoint import SceneCheckpoints, process_scene_checkpointed
+    from avlm.generate import GenerationConfig
+
+    config = GenerationConfig()
+    SceneCheckpoints(str(tmp_path), config).save("scene-0001", _checkpoint_agents())
+
+    # only a label setting changed: same checkpoint, relabeled in place
+    config_new = GenerationConfig(dt_action=0.5, int_action=1)
+    checkpoints = SceneCheckpoints(str(tmp_path), config_new)
+    agents, status = process_scene_checkpointed(
+        FailingManager(), "scene-0001", config_new, checkpoints
+    )
+    assert status == "relabeled"
+    assert list(agents[0]["frames"][0]["meta_actions_from_ti"].keys()) == [
+        "dt_0.50",
+        "dt_1.00",
+    ]
+    assert agents[0]["frames"][-1]["has_future_in_scene"] is False
+
+    # the relabeled checkpoint is now valid as is
+    _, status = process_scene_checkpointed(
+        FailingManager(), "scene-0001", config_new, checkpoints
+    )
+    assert status == "cached"
+
+
+def test_data_change_invalidates_checkpoint(tmp_path):
+    from avlm.checkpoint import SceneCheckpoints, process_scene_checkpointed
+    from avlm.generate import GenerationConfig
+
+    SceneCheckpoints(str(tmp_path), GenerationConfig()).save(
+        "scene-0001", _checkpoint_agents()
+    )
+    config_new = GenerationConfig(dt_waypoints=1.0)
+    checkpoints = SceneCheckpoints(str(tmp_path), config_new)
+    assert checkpoints.load("scene-0001") is None
+
+    class MissingManager:
+        def get_scene_dataset_by_name(self, scene):
+            raise KeyError(scene)
+
+    agents, status = process_scene_checkpointed(
+        MissingManager(), "scene-0001", config_new, checkpoints
+    )
+    assert (agents is None) and (status == "skipped")
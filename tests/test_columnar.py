@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+
+from avlm.columnar import ColumnarDataset, write_columnar
+from avlm.shards import DatasetWriter
+
+
+METADATA = {
+    "action_table": {
+        "Lateral": {"TURN_LEFT": -3, "STRAIGHT": 0, "TURN_RIGHT": 3},
+        "Longitudinal": {"DECEL": -1, "MAINTAIN": 0, "ACCEL": 1},
+    },
+}
+
+
+def make_frame(scene: str, agent: str, frame: int, n_frames: int):
+    has_next = frame < n_frames - 1
+    ego = {"position": [1.0, 2.0], "velocity": [0.0, 3.0], "speed": 3.0, "angle": 0.1}
+    return {
+        "token": f"{scene}-{agent}-{frame:04d}",
+        "scene": scene,
+        "agent": agent,
+        "frame": frame,
+        "timestamp": 0.5 * frame,
+        "has_future_in_scene": has_next,
+        "waypoints_3d": {
+            "dt_0.50": [0.0, 0.0, float(frame)] if has_next else None,
+        },
+        "waypoints_pixel": {"dt_0.50": [10.0, 20.0] if has_next else None},
+        "meta_actions_from_ti": {
+            "dt_1.00": {"lateral": "TURN_LEFT", "longitudinal": "ACCEL"}
+            if has_next
+            else None
+        },
+        "meta_actions_from_dt": {
+            "dt_1.00": {"lateral": "STRAIGHT", "longitudinal": "DECEL"}
+            if has_next
+            else None
+        },
+        "ego_state": {"global": ego, "local": ego, "diff": ego},
+    }
+
+
+@pytest.fixture
+def columnar_path(tmp_path):
+    prefix = os.path.join(tmp_path, "dataset_train")
+    with DatasetWriter(prefix, metadata=METADATA) as writer:
+        for i_scene, scene in enumerate(["scene-b", "scene-a"]):
+            frames = [make_frame(scene, "ego", i, 3) for i in range(3)]
+            writer.write_scene(f"scene_{i_scene}", scene, [("agent_ego", frames)])
+    return write_columnar(prefix)
+
+
+def test_columnar_random_access(columnar_path):
+    dataset = ColumnarDataset(columnar_path)
+    assert len(dataset) == 6
+    i_row = dataset.row("scene-a", "ego", 1)
+    assert i_row == 4
+    sample = dataset[i_row]
+    assert sample["scene"] == "scene-a"
+    assert sample["frame"] == 1
+    assert sample["timestamp"] == 0.5
+    assert np.allclose(sample["waypoints_3d"][0], [0.0, 0.0, 1.0])
+    assert sample["meta_actions_from_ti"][0].tolist() == [-3, 1]
+    assert sample["meta_actions_from_dt"][0].tolist() == [0, -1]
+    assert sample["ego_state"].shape == (3, 6)
+    assert dataset.row_by_token("scene-a-ego-0001") == i_row
+
+
+def test_columnar_null_horizons_masked(columnar_path):
+    dataset = ColumnarDataset(columnar_path)
+    sample = dataset.get("scene-b", "ego", 2)
+    assert not sample["waypoints_3d_valid"][0]
+    assert np.all(np.isnan(sample["waypoints_3d"][0]))
+    assert not sample["meta_actions_from_ti_valid"][0]
+    assert dataset.column("waypoints_pixel_valid").sum() == 4
+
+
+def test_columnar_missing_sample(columnar_path):
+    dataset = ColumnarDataset(columnar_path)
+    assert dataset.row("scene-a", "ego", 7) == -1
+    assert dataset.row("scene-c", "ego", 0) == -1
+    assert dataset.row_by_token("missing") == -1
+    with pytest.raises(KeyError):
+        dataset.get("scene-a", "other", 0)
+
+
+def test_columnar_key_table_matches_search(columnar_path):
+    dataset = ColumnarDataset(columnar_path)
+    rows = [
+        dataset.row(scene, "ego", frame)
+        for scene in ["scene-a", "scene-b"]
+        for frame in range(4)
+    ]
+    os.remove(os.path.join(columnar_path, "key_table.npy"))
+    fallback = ColumnarDataset(columnar_path)
+    assert rows == [
+        fallback.row(scene, "ego", frame)
+        for scene in ["scene-a", "scene-b"]
+        for frame in range(4)
+    ]
@@ -0,0 +1,86 @@
+import pytest
+
+from avlm.dataset import AVLMDataset
+from avlm.shards import DatasetWriter, assemble_nested_json
+
+
+def _frame(scene, agent, frame, lateral):
+    return {
+        "token": f"{scene}_{agent}_{frame}",
+        "scene": scene,
+        "agent": agent,
+        "frame": frame,
+        "image_paths": {"CAM_FRONT": f"{scene}/{frame}.jpg"},
+        "meta_actions_from_ti": {
+            "dt_1.00": {"lateral": lateral, "longitudinal": "MAINTAIN"},
+            "dt_2.00": None,
+        },
+    }
+
+
+def _write_split(prefix):
+    with DatasetWriter(prefix, {"dataset": "test"}, max_shard_bytes=300) as writer:
+        for i_scene, scene in enumerate(["scene-a", "scene-b"]):
+            agents = [
+                (
+                    f"agent_{agent}",
+                    [
+                        _frame(
+                            scene, agent, frame, ["STRAIGHT", "TURN_LEFT"][frame % 2]
+                        )
+                        for frame in range(3)
+                    ],
+                )
+                for agent in [0, 1]
+            ]
+            writer.write_scene(f"scene_{i_scene}", scene, agents)
+
+
+@pytest.mark.parametrize("nested", [False, True])
+def test_dataset_indexing_and_filters(tmp_path, nested):
+    output_prefix = str(tmp_path / "dataset")
+    _write_split(f"{output_prefix}_train")
+    if nested:
+        assemble_nested_json(f"{output_prefix}_train", f"{output_prefix}_train.json")
+        (tmp_path / "dataset_train_metadata.json").unlink()
+
+    dataset = AVLMDataset(output_prefix)
+    assert len(dataset) == 12
+    assert dataset[0]["token"] == "scene-a_0_0"
+    assert dataset[-1]["token"] == "scene-b_1_2"
+    assert [ds_frame["frame"] for ds_frame in dataset][:4] == [0, 1, 2, 0]
+    with pytest.raises(IndexError):
+        dataset[12]
+
+    dataset = AVLMDataset(output_prefix, scenes=["scene-b"], agents=[1])
+    assert [ds_frame["token"] for ds_frame in dataset] == [
+        "scene-b_1_0",
+        "scene-b_1_1",
+        "scene-b_1_2",
+    ]
+    dataset = AVLMDataset(output_prefix, actions={"lateral": "TURN_LEFT"})
+    assert len(dataset) == 4
+    dataset = AVLMDataset(
+        output_prefix, actions={"lateral": "TURN_LEFT"}, action_horizon="dt_2.00"
+    )
+    assert len(dataset) == 0
+
+
+def test_dataset_prefetches_images_in_order(tmp_path):
+    output_prefix = str(tmp_path / "dataset")
+    _write_split(f"{output_prefix}_train")
+    dataset = AVLMDataset(output_prefix, data_root="/data")
+    loaded = []
+    for ds_frame, images in dataset.iter_with_images(prefetch=3, loader=str.upper):
+        loaded.append(images["CAM_FRONT"])
+        assert (
+            images["CAM_FRONT"]
+            == f"/DATA/{ds_frame['scene'].upper()}/{ds_frame['frame']}.JPG"
+        )
+    assert len(loaded) == len(dataset)
+    dataset.close()
+
+
+def test_dataset_missing_split_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        AVLMDataset(str(tmp_path / "dataset"), splits=["val"])
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+def _assert_close_horizons(dense: dict, generated: dict):
+    assert dense.keys() == generated.keys()
+    for key, value in generated.items():
+        if value is None:
+            assert dense[key] is None
+        else:
+            assert np.allclose(dense[key], value)
+
+
+def test_dense_frames_match_generated_frames(tmp_path):
+    from avlm.dense import DenseDataset, DenseWriter, build_dense_scene
+    from avlm.generate import GenerationConfig, process_scene
+    from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+    SM = SyntheticManager(SyntheticConfig(n_scenes=1, n_frames=16, n_objects=4))
+    scene = SM.scenes[0]
+    config = GenerationConfig()
+    SD = SM.get_scene_dataset_by_name(scene)
+    prefix = str(tmp_path / "dataset_train")
+    with DenseWriter(prefix, metadata={}, config=config) as writer:
+        writer.write_scene("scene_0", scene, build_dense_scene(SD, config))
+    generated = list(
+        process_scene(SD, scene, config, progress=False)["agent_0"].values()
+    )
+
+    dataset = DenseDataset(str(tmp_path / "dataset"), splits=["train"])
+    assert len(dataset) == len(generated)
+    for ds_frame, gen_frame in zip(dataset, generated):
+        for field in ["frame", "timestamp", "image_paths", "has_future_in_scene"]:
+            assert ds_frame[field] == gen_frame[field]
+        for field in ["meta_actions_from_ti", "meta_actions_from_dt"]:
+            assert ds_frame[field] == gen_frame[field]
+        for field in ["waypoints_3d", "waypoints_pixel"]:
+            _assert_close_horizons(ds_frame[field], gen_frame[field])
+
+    # new horizons are derived on read without regenerating
+    dataset = DenseDataset(
+        str(tmp_path / "dataset"), dts_waypoints=[0.25, 1.0], dts_action=[1.5]
+    )
+    assert list(dataset[0]["waypoints_3d"].keys()) == ["dt_0.25", "dt_1.00"]
+    assert list(dataset[0]["meta_actions_from_ti"].keys()) == ["dt_1.50"]
+
+
+def test_dense_all_cameras_with_primary_not_first(tmp_path):
+    from avlm.dense import DenseDataset, DenseWriter, build_dense_scene
+    from avlm.generate import GenerationConfig, process_scene
+    from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+    SM = SyntheticManager(
+        SyntheticConfig(n_scenes=1, n_frames=12, n_objects=2, n_cameras=4)
+    )
+    scene = SM.scenes[0]
+    config = GenerationConfig(waypoints_all_cameras=True)
+    SD = SM.get_scene_dataset_by_name(scene)
+    # make the primary camera a later one in the scene's camera order
+    SD.sensors[config.sensor_primary] = "CAM_2"
+    assert SD.get_sensor_names_by_type(sensor_type="camera", agent=0)[0] != "CAM_2"
+    prefix = str(tmp_path / "dataset_train")
+    with DenseWriter(prefix, metadata={}, config=config) as writer:
+        writer.write_scene("scene_0", scene, build_dense_scene(SD, config))
+    generated = list(
+        process_scene(SD, scene, config, progress=False)["agent_0"].values()
+    )
+
+    dataset = DenseDataset(str(tmp_path / "dataset"), splits=["train"])
+    for ds_frame, gen_frame in zip(dataset, generated):
+        _assert_close_horizons(
+            ds_frame["waypoints_pixel"], gen_frame["waypoints_pixel"]
+        )
+        cameras = gen_frame["waypoints_pixel_cameras"]
+        assert ds_frame["waypoints_pixel_cameras"].keys() == cameras.keys()
+        # each camera once, by name, the primary first
+        assert sorted(cameras) == sorted(ds_frame["image_paths"])
+        assert list(cameras)[0] == "CAM_2"
+        for camera, pixels in cameras.items():
+            _assert_close_horizons(ds_frame["waypoints_pixel_cameras"][camera], pixels)
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+from avlm import image_cache
+from avlm.dataset import AVLMDataset
+from avlm.image_cache import ImageCache, ImageCacheConfig, build_image_cache
+from avlm.shards import DatasetWriter
+
+
+def _fake_decode(path, height, width):
+    # pixel value from the file contents so changes to the source are visible
+    with open(path, "r") as f:
+        value = int(f.read())
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def _write_dataset(tmp_path):
+    for camera, value in [("CAM_FRONT", 10), ("CAM_BACK", 20)]:
+        (tmp_path / f"{camera}.jpg").write_text(str(value))
+    frames = [
+        {
+            "token": f"token_{frame}",
+            "frame": frame,
+            "image_paths": {
+                "CAM_FRONT": str(tmp_path / "CAM_FRONT.jpg"),
+                "CAM_BACK": str(tmp_path / "CAM_BACK.jpg"),
+            },
+        }
+        for frame in range(3)
+    ]
+    output_prefix = str(tmp_path / "dataset")
+    with DatasetWriter(f"{output_prefix}_train", {}) as writer:
+        writer.write_scene("scene_0", "scene-a", [("agent_0", frames)])
+    return AVLMDataset(output_prefix)
+
+
+def test_image_cache_reuse_and_invalidation(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "decode_and_resize", _fake_decode)
+    dataset = _write_dataset(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    config = ImageCacheConfig(height=4, width=6, shard_size=1)
+
+    stats = build_image_cache([dataset], cache_dir, config, workers=1)
+    assert stats == {"images_reused": 0, "images_decoded": 2, "images_compacted": 0}
+    cache = ImageCache(cache_dir)
+    assert "token_2" in cache
+    images = cache.get_frame(dataset[2])
+    assert images["CAM_FRONT"].shape == (4, 6, 3)
+    assert images["CAM_FRONT"].dtype == np.uint8
+    assert np.all(images["CAM_BACK"] == 20)
+
+    # unchanged sources are reused
+    stats = build_image_cache([dataset], cache_dir, config, workers=1)
+    assert stats == {"images_reused": 2, "images_decoded": 0, "images_compacted": 0}
+
+    # a changed source is decoded again
+    path = tmp_path / "CAM_BACK.jpg"
+    path.write_text("30")
+    os.utime(path, ns=(0, 123))
+    stats = build_image_cache([dataset], cache_dir, config, workers=1)
+    assert stats == {"images_reused": 1, "images_decoded": 1, "images_compacted": 0}
+    assert np.all(ImageCache(cache_dir).get("token_0", "CAM_BACK") == 30)
+
+    # a new resize invalidates everything
+    config = ImageCacheConfig(height=8, width=8, cameras=("CAM_FRONT",))
+    stats = build_image_cache([dataset], cache_dir, config, workers=1)
+    assert stats == {"images_reused": 0, "images_decoded": 1, "images_compacted": 0}
+    cache = ImageCache(cache_dir)
+    assert list(cache.get_frame(dataset[0])) == ["CAM_FRONT"]
+    assert cache.get("token_0", "CAM_FRONT").shape == (8, 8, 3)
+
+
+def _shard_files(cache_dir):
+    return sorted(file for file in os.listdir(cache_dir) if file.endswith(".npy"))
+
+
+def test_image_cache_drops_stale_shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_cache, "decode_and_resize", _fake_decode)
+    dataset = _write_dataset(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    config = ImageCacheConfig(height=4, width=6, shard_size=2)
+    build_image_cache([dataset], cache_dir, config, workers=1)
+    assert len(_shard_files(cache_dir)) == 1
+
+    # the changed image leaves a stale slot, so the live one is copied out
+    for value in [30, 40]:
+        path = tmp_path / "CAM_BACK.jpg"
+        path.write_text(str(value))
+        os.utime(path, ns=(0, value))
+        stats = build_image_cache([dataset], cache_dir, config, workers=1)
+        assert stats == {"images_reused": 1, "images_decoded": 1, "images_compacted": 1}
+        assert len(_shard_files(cache_dir)) == 1
+        cache = ImageCache(cache_dir)
+        assert cache.index["shards"] == _shard_files(cache_dir)
+        assert np.all(cache.get("token_0", "CAM_FRONT") == 10)
+        assert np.all(cache.get("token_0", "CAM_BACK") == value)
+
+    # a new resize deletes the old shards
+    config = ImageCacheConfig(height=8, width=8, shard_size=2)
+    build_image_cache([dataset], cache_dir, config, workers=1)
+    assert ImageCache(cache_dir).index["shards"] == _shard_files(cache_dir)
+    assert len(_shard_files(cache_dir)) == 1
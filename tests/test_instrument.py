@@ -0,0 +1,43 @@
+import json
+import pickle
+
+from avlm.instrument import NULL_TIMER, StageTimer, write_run_report
+
+
+def test_stage_timer_summary_and_merge():
+    timer = StageTimer()
+    for _ in range(10):
+        with timer.stage("load"):
+            pass
+    timer.count("scenes_skipped")
+
+    # timers come back from worker processes pickled
+    other = pickle.loads(pickle.dumps(timer))
+    timer.merge(other)
+    summary = timer.summary()
+    assert summary["stages"]["load"]["count"] == 20
+    assert summary["stages"]["load"]["p50_ms"] <= summary["stages"]["load"]["p99_ms"]
+    assert summary["counters"] == {"scenes_skipped": 2}
+
+
+def test_stage_timer_records_on_exception():
+    timer = StageTimer()
+    try:
+        with timer.stage("scene_load"):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert timer.summary()["stages"]["scene_load"]["count"] == 1
+
+
+def test_null_timer_records_nothing(tmp_path):
+    with NULL_TIMER.stage("load"):
+        NULL_TIMER.count("frames")
+    NULL_TIMER.merge(StageTimer())
+    assert not NULL_TIMER.enabled
+    assert NULL_TIMER.summary() == {"stages": {}, "counters": {}}
+
+    file_out = tmp_path / "report.json"
+    write_run_report(str(file_out), NULL_TIMER, split="train")
+    with open(file_out, "r") as f:
+        assert json.load(f) == {"split": "train", "stages": {}, "counters": {}}
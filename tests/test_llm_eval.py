@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+from avlm.llm_eval import (
+    CompletionClient,
+    EvalStats,
+    FakeCompletionServer,
+    ResponseCache,
+    complete_prompts,
+    evaluate_prompt_file,
+)
+from avlm.prompts import MetaActionTemplate
+
+
+def test_batches_retries_and_cache(tmp_path):
+    prompts = [f"prompt {i}" for i in range(20)] + ["prompt 0"]
+    with FakeCompletionServer(
+        respond=lambda prompt: prompt.upper(), failure_rate=0.3
+    ) as server:
+        client = CompletionClient(server.url, model="fake")
+        stats = EvalStats()
+        with ResponseCache(str(tmp_path)) as cache:
+            responses = asyncio.run(
+                complete_prompts(
+                    prompts,
+                    client,
+                    cache=cache,
+                    concurrency=4,
+                    batch_size=3,
+                    max_retries=20,
+                    backoff=0.001,
+                    stats=stats,
+                )
+            )
+        assert responses == [prompt.upper() for prompt in prompts]
+        assert server.n_prompts == 20
+        assert stats.n_retries > 0
+        assert stats.n_requests == server.n_requests
+
+        # a rerun is answered from the cache without calling the server
+        stats = EvalStats()
+        with ResponseCache(str(tmp_path)) as cache:
+            assert len(cache) == 20
+            asyncio.run(complete_prompts(prompts, client, cache=cache, stats=stats))
+        assert server.n_prompts == 20
+        assert stats.summary()["cache_hit_rate"] == 1.0
+        client.close()
+
+
+def test_evaluate_prompt_file(tmp_path):
+    file_prompts = str(tmp_path / "prompts.jsonl")
+    with open(file_prompts, "w") as f:
+        for i, lateral in enumerate(["STRAIGHT", "TURN_LEFT"]):
+            target = f"lateral: {lateral}, longitudinal: MAINTAIN"
+            f.write(json.dumps({"token": str(i), "prompt": f"p{i}", "target": target}))
+            f.write("\n")
+    file_out = str(tmp_path / "predictions.jsonl")
+    with FakeCompletionServer(
+        {"p0": "lateral: straight, longitudinal: maintain"}, default="no idea"
+    ) as server:
+        client = CompletionClient(server.url, model="fake")
+        stats = evaluate_prompt_file(
+            file_prompts, file_out, MetaActionTemplate(), client
+        )
+        client.close()
+    with open(file_out, "r") as f:
+        predictions = [json.loads(line) for line in f]
+    assert predictions[0]["meta_actions"] == {
+        "dt_1.00": {"lateral": "STRAIGHT", "longitudinal": "MAINTAIN"}
+    }
+    assert "meta_actions" not in predictions[1]
+    assert stats.summary()["n_prompts"] == 2
+
+
+class _FlakyClient:
+    """Answers each prompt upper-cased, with the faults set by prompt"""
+
+    model = "flaky"
+
+    def __init__(self):
+        self.n_short = 0
+
+    async def complete(self, prompts):
+        if "bad" in prompts:
+            raise ValueError("bad request")
+        if ("short" in prompts) and (self.n_short == 0):
+            self.n_short += 1
+            return [prompt.upper() for prompt in prompts[1:]]
+        return [prompt.upper() for prompt in prompts]
+
+
+def test_batch_failures_are_isolated(tmp_path):
+    prompts = ["a", "b", "short", "c", "bad", "d"]
+    client = _FlakyClient()
+    stats = EvalStats()
+    with ResponseCache(str(tmp_path)) as cache:
+        responses = asyncio.run(
+            complete_prompts(
+                prompts, client, cache=cache, batch_size=2, backoff=0, stats=stats
+            )
+        )
+    assert responses == ["A", "B", "SHORT", "C", None, None]
+    # the short response is retried, and only the batch of "bad" fails
+    assert stats.n_retries == 1
+    assert stats.n_failed == 2
+    assert set(stats.errors) == {"bad", "d"}
+    assert "bad request" in stats.errors["d"]
+    # the completed batches are cached
+    with ResponseCache(str(tmp_path)) as cache:
+        assert len(cache) == 4
+        assert cache.get("flaky", "short") == "SHORT"
+        assert cache.get("flaky", "d") is None
+
+    # a response that stays short fails its batch after the retries
+    class ShortClient(_FlakyClient):
+        async def complete(self, prompts):
+            return prompts[1:]
+
+    stats = EvalStats()
+    responses = asyncio.run(
+        complete_prompts(
+            ["x", "y"],
+            ShortClient(),
+            batch_size=2,
+            max_retries=1,
+            backoff=0,
+            stats=stats,
+        )
+    )
+    assert responses == [None, None]
+    assert stats.errors["x"] == "1 completions for 2 prompts"
+
+
+def test_evaluate_prompt_file_keeps_the_other_predictions(tmp_path):
+    file_prompts = str(tmp_path / "prompts.jsonl")
+    with open(file_prompts, "w") as f:
+        for i, prompt in enumerate(["lateral: straight, longitudinal: accel", "bad"]):
+            f.write(json.dumps({"token": str(i), "prompt": prompt, "target": ""}))
+            f.write("\n")
+    file_out = str(tmp_path / "predictions.jsonl")
+
+    class EchoClient(_FlakyClient):
+        async def complete(self, prompts):
+            await super().complete(prompts)
+            return list(prompts)
+
+    stats = evaluate_prompt_file(
+        file_prompts, file_out, MetaActionTemplate(), EchoClient(), batch_size=1
+    )
+    with open(file_out, "r") as f:
+        predictions = [json.loads(line) for line in f]
+    assert predictions[0]["meta_actions"] == {
+        "dt_1.00": {"lateral": "STRAIGHT", "longitudinal": "ACCEL"}
+    }
+    assert predictions[1] == {"token": "1", "response": None}
+    assert list(stats.errors) == ["bad"]
@@ -0,0 +1,174 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from avlm.columnar import write_columnar
+from avlm.metrics import GroundTruth, evaluate_files
+from avlm.shards import DatasetWriter
+
+
+METADATA = {
+    "action_table": {
+        "Lateral": {"TURN_LEFT": -3, "STRAIGHT": 0, "TURN_RIGHT": 3},
+        "Longitudinal": {"DECEL": -1, "MAINTAIN": 0, "ACCEL": 1},
+    },
+}
+LATERAL = ["TURN_LEFT", "STRAIGHT", "TURN_RIGHT"]
+
+
+def make_frame(scene: str, frame: int, n_frames: int):
+    has_next = frame < n_frames - 1
+    speed = 3.0 * frame
+    ego = {"position": [0.0, 0.0], "velocity": [0.0, speed], "speed": speed, "angle": 0}
+    action = {"lateral": LATERAL[frame % 3], "longitudinal": "ACCEL"}
+    return {
+        "token": f"{scene}-{frame}",
+        "scene": scene,
+        "agent": 0,
+        "frame": frame,
+        "timestamp": 0.5 * frame,
+        "has_future_in_scene": has_next,
+        "waypoints_3d": {
+            "dt_0.50": [0.0, 0.0, 1.0] if has_next else None,
+            "dt_1.00": [1.0, 0.0, 2.0] if has_next else None,
+        },
+        "waypoints_pixel": {
+            "dt_0.50": [10.0, 20.0] if has_next else None,
+            "dt_1.00": [10.0, 30.0] if has_next else None,
+        },
+        "meta_actions_from_ti": {"dt_1.00": action if has_next else None},
+        "meta_actions_from_dt": {"dt_1.00": action if has_next else None},
+        "ego_state": {"global": ego, "local": ego, "diff": ego},
+    }
+
+
+@pytest.fixture
+def ground_truth(tmp_path):
+    prefix = os.path.join(tmp_path, "dataset_train")
+    frames = {scene: [make_frame(scene, i, 5) for i in range(5)] for scene in "ab"}
+    with DatasetWriter(prefix, metadata=METADATA) as writer:
+        for i_scene, (scene, scene_frames) in enumerate(frames.items()):
+            writer.write_scene(f"scene_{i_scene}", scene, [("agent_0", scene_frames)])
+    return write_columnar(prefix), [f for fs in frames.values() for f in fs]
+
+
+def _write_predictions(file, predictions):
+    with open(file, "w") as f:
+        for prediction in predictions:
+            f.write(json.dumps(prediction) + "\n")
+
+
+def test_metrics_of_exact_and_offset_predictions(tmp_path, ground_truth):
+    path, frames = ground_truth
+    file_exact = str(tmp_path / "exact.jsonl")
+    _write_predictions(
+        file_exact,
+        [
+            {
+                "token": ds_frame["token"],
+                "waypoints_3d": ds_frame["waypoints_3d"],
+                "meta_actions": ds_frame["meta_actions_from_ti"],
+            }
+            for ds_frame in frames
+        ]
+        + [{"token": "unknown", "meta_actions": {}}],
+    )
+    file_offset = str(tmp_path / "offset.jsonl")
+    _write_predictions(
+        file_offset,
+        [
+            {
+                "token": ds_frame["token"],
+                "waypoints_bev": {"dt_0.50": [3.0, 5.0], "dt_1.00": [1.0, 6.0]},
+                "meta_actions": {
+                    "dt_1.00": {"lateral": "STRAIGHT", "longitudinal": "ACCEL"}
+                },
+            }
+            for ds_frame in frames
+        ],
+    )
+
+    results = evaluate_files([file_exact, file_offset], [path], workers=2)
+    assert results == evaluate_files([file_exact, file_offset], [path], workers=1)
+
+    exact = results[file_exact]
+    assert exact["n_unmatched"] == 1
+    metrics = exact["metrics"]["all"]["all"]
+    assert metrics["waypoints_3d"]["count"] == [8, 8]
+    assert metrics["waypoints_3d"]["ade"] == [0.0, 0.0]
+    action = metrics["meta_actions_from_ti"]["dt_1.00"]
+    assert action["count"] == 8
+    assert action["joint_accuracy"] == 1.0
+    assert action["lateral"]["accuracy"] == 1.0
+
+    metrics = results[file_offset]["metrics"]
+    waypoints = metrics["all"]["all"]["waypoints_bev"]
+    assert np.allclose(waypoints["fde"], [5.0, 4.0])
+    assert np.allclose(waypoints["ade"], [5.0, 4.5])
+    lateral = metrics["all"]["all"]["meta_actions_from_ti"]["dt_1.00"]["lateral"]
+    # frames 0..3 of each scene have lateral classes 0, 1, 2, 0
+    assert lateral["confusion"] == [[0, 4, 0, 0], [0, 2, 0, 0], [0, 2, 0, 0]]
+    assert lateral["per_class_accuracy"] == {
+        "TURN_LEFT": 0.0,
+        "STRAIGHT": 1.0,
+        "TURN_RIGHT": 0.0,
+    }
+    assert metrics["lateral"]["STRAIGHT"]["meta_actions_from_ti"]["dt_1.00"][
+        "joint_accuracy"
+    ] == pytest.approx(1.0)
+    assert metrics["scene"]["a"]["waypoints_bev"]["count"] == [4, 4]
+    # speeds 0, 3, 6, 9, 12 bucketed by 2, 5, 10, 15 m/s
+    speed = metrics["speed"]
+    assert [speed[name]["waypoints_bev"]["count"][0] for name in speed] == [
+        2,
+        2,
+        4,
+        0,
+        0,
+    ]
+
+
+def test_ground_truth_rows(ground_truth):
+    path, frames = ground_truth
+    gt = GroundTruth([path])
+    tokens = [ds_frame["token"] for ds_frame in frames][::-1] + ["missing"]
+    rows = gt.rows(tokens)
+    assert rows[-1] == -1
+    assert [gt.tokens[row].decode() for row in rows[:-1]] == tokens[:-1]
+
+
+def test_missing_predictions_are_counted(tmp_path, ground_truth):
+    path, frames = ground_truth
+    file = str(tmp_path / "partial.jsonl")
+    predictions = []
+    for i, ds_frame in enumerate(frames):
+        # every other frame has no final waypoint, and every third no action
+        waypoints = dict(ds_frame["waypoints_3d"])
+        if i % 2 == 0:
+            waypoints["dt_1.00"] = None
+        actions = ds_frame["meta_actions_from_ti"] if i % 3 else {"dt_1.00": None}
+        predictions.append(
+            {
+                "token": ds_frame["token"],
+                "waypoints_3d": waypoints,
+                "meta_actions": actions,
+            }
+        )
+    _write_predictions(file, predictions)
+    metrics = evaluate_files([file], [path])[file]["metrics"]["all"]["all"]
+
+    waypoints = metrics["waypoints_3d"]
+    assert waypoints["count"] == [8, 8]
+    # frames 0, 2, 4, 6, 8 miss their final waypoint, 4 of them have a ground truth
+    assert waypoints["missing"] == [0, 4]
+    assert waypoints["fde"] == [0.0, 0.0]
+    action = metrics["meta_actions_from_ti"]["dt_1.00"]
+    assert action["count"] == 8
+    # frames 0, 3, 6 miss their action, frame 9 has no ground truth
+    assert action["missing"] == 3
+    assert action["joint_accuracy"] == pytest.approx(5 / 8)
+
+    with pytest.raises(ValueError):
+        GroundTruth([])
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from avlm.prompts import (
+    MetaActionTemplate,
+    PromptCache,
+    PromptTemplate,
+    get_prompt_key,
+    render_dataset,
+)
+from avlm.shards import DatasetWriter
+
+
+def _frame(scene, frame):
+    action = {"lateral": "STRAIGHT", "longitudinal": "MAINTAIN"}
+    return {
+        "token": f"{scene}_{frame}",
+        "scene": scene,
+        "agent": 0,
+        "frame": frame,
+        "image_paths": {"CAM_FRONT": f"{scene}/{frame}.jpg", "CAM_BACK": "back.jpg"},
+        "meta_actions_from_ti": {"dt_1.00": action if frame < 3 else None},
+        "ego_state": {"global": {"speed": 5.0 + frame, "angle": 0.1}},
+        "object_states": {
+            "key_objects": [2, 1],
+            "trajectoriers": {
+                "current": {
+                    1: {"state": {"class": "car", "position": [1, 5], "speed": 2}},
+                    2: {"state": {"class": "truck", "position": [0, 20], "speed": 0}},
+                }
+            },
+        },
+    }
+
+
+def _write_dataset(prefix):
+    with DatasetWriter(prefix, {"dataset": "test"}) as writer:
+        for i_scene, scene in enumerate(["scene-a", "scene-b"]):
+            frames = [_frame(scene, frame) for frame in range(4)]
+            writer.write_scene(f"scene_{i_scene}", scene, [("agent_0", frames)])
+
+
+def _read_lines(file):
+    with open(file, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_render_dataset_parallel_and_cached(tmp_path):
+    output_prefix = str(tmp_path / "dataset")
+    _write_dataset(f"{output_prefix}_train")
+    template = MetaActionTemplate()
+
+    file_serial = str(tmp_path / "serial.jsonl")
+    stats = render_dataset(output_prefix, template, file_serial, chunk_size=3)
+    records = _read_lines(file_serial)
+    assert len(records) == 6
+    assert records[0]["token"] == "scene-a_0"
+    assert records[0]["image_paths"] == {"CAM_FRONT": "scene-a/0.jpg"}
+    assert records[0]["target"] == "lateral: STRAIGHT, longitudinal: MAINTAIN"
+    # nearest key object is described first
+    assert records[0]["prompt"].index("car") < records[0]["prompt"].index("truck")
+    summary = stats.summary()
+    assert summary["n_frames"] == 8
+    assert summary["n_skipped"] == 2
+    assert summary["prompt"]["chars"]["max"] == max(
+        len(record["prompt"]) for record in records
+    )
+
+    # parallel rendering writes the same records, and reuses the cache
+    cache_dir = str(tmp_path / "cache")
+    file_parallel = str(tmp_path / "parallel.jsonl")
+    for hit_rate in [0.0, 1.0]:
+        stats = render_dataset(
+            output_prefix,
+            template,
+            file_parallel,
+            cache_dir=cache_dir,
+            workers=2,
+            chunk_size=3,
+        )
+        assert _read_lines(file_parallel) == records
+        assert stats.summary()["cache_hit_rate"] == hit_rate
+    # both scenes have the same content in the fields the template reads
+    assert len(PromptCache(cache_dir, template)) == 3
+
+    # a different template setting gets different keys
+    ds_frame = _frame("scene-a", 0)
+    other = MetaActionTemplate(max_objects=1)
+    assert get_prompt_key(template, ds_frame) != get_prompt_key(other, ds_frame)
+
+
+def test_prompt_key_hashes_only_the_fields_read():
+    template = MetaActionTemplate()
+    ds_frame = _frame("scene-a", 0)
+    key = get_prompt_key(template, ds_frame)
+    # fields the template does not read leave the key unchanged
+    unread = {**ds_frame, "waypoints_3d": {"dt_1.00": [1.0, 0.0, 2.0]}}
+    unread["image_paths"] = {"CAM_FRONT": "moved.jpg"}
+    assert get_prompt_key(template, unread) == key
+    read = {**ds_frame, "ego_state": {"global": {"speed": 9.0, "angle": 0.1}}}
+    assert get_prompt_key(template, read) != key
+    other_source = MetaActionTemplate(source="meta_actions_from_dt")
+    assert "meta_actions_from_dt" in other_source.frame_fields
+    assert get_prompt_key(other_source, ds_frame) != key
+
+    with pytest.raises(TypeError):
+        PromptTemplate()
@@ -0,0 +1,106 @@
+import numpy as np
+
+from avlm.spatial import BEVIndex, KeyObjectCriterion, distance_to_path
+
+
+def _random_index(n_objects=200, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-50, 50, size=(n_objects, 2))
+    classes = rng.choice(["car", "truck", "pedestrian"], size=n_objects)
+    path = np.array([[0.0, 0.0], [0.0, 10.0], [5.0, 25.0]])
+    return BEVIndex(
+        positions, IDs=list(range(100, 100 + n_objects)), classes=classes, path=path
+    )
+
+
+def test_distance_to_path():
+    path = np.array([[0.0, 0.0], [0.0, 10.0]])
+    points = np.array([[3.0, 5.0], [0.0, -2.0], [-1.0, 12.0]])
+    assert np.allclose(distance_to_path(points, path), [3.0, 2.0, np.sqrt(5.0)])
+
+
+def test_queries_match_brute_force():
+    index = _random_index()
+    centers = np.array([[0.0, 0.0], [10.0, -5.0]])
+    for center, rows in zip(centers, index.query_radius(centers, 20.0)):
+        distances = np.linalg.norm(index.positions - center, axis=1)
+        assert set(rows.tolist()) == set(np.flatnonzero(distances <= 20.0).tolist())
+        assert np.all(np.diff(distances[rows]) >= 0)
+
+    distances, rows = index.query_knn(centers, k=5)
+    for center, row in zip(centers, rows):
+        expected = np.argsort(np.linalg.norm(index.positions - center, axis=1))[:5]
+        assert row.tolist() == expected.tolist()
+
+    rows_10, rows_30 = index.query_radii([10.0, 30.0])
+    assert set(rows_10.tolist()) <= set(rows_30.tolist())
+    assert len(rows_30) == int((index.distances < 30.0).sum())
+
+    expected = np.flatnonzero(distance_to_path(index.positions, index.path) <= 3.0)
+    assert set(index.query_corridor(3.0).tolist()) == set(expected.tolist())
+
+
+def test_select_many_criteria():
+    index = _random_index()
+    selected = index.select(
+        {
+            "near": KeyObjectCriterion(radius=15.0),
+            "nearest_cars": KeyObjectCriterion(k=3, classes=("car",)),
+            "corridor_trucks": KeyObjectCriterion(corridor=4.0, classes=("truck",)),
+        }
+    )
+    order = np.argsort(index.distances, kind="stable")
+    near = [index.IDs[row] for row in order if index.distances[row] < 15.0]
+    assert selected["near"] == near
+    cars = [index.IDs[row] for row in order if index.classes[row] == "car"][:3]
+    assert selected["nearest_cars"] == cars
+    in_corridor = distance_to_path(index.positions, index.path) <= 4.0
+    trucks = [
+        index.IDs[row]
+        for row in order
+        if in_corridor[row] and (index.classes[row] == "truck")
+    ]
+    assert selected["corridor_trucks"] == trucks
+
+
+def test_from_frame_uses_the_given_path():
+    state = {"ID": 7, "class": "car", "position": [1.0, 10.0]}
+    ds_frame = {
+        "object_states": {
+            "trajectoriers": {"current": {"7": {"state": state}, "8": None}}
+        },
+        "waypoints_3d": {"dt_1.00": [50.0, 0.0, 50.0]},
+    }
+    index = BEVIndex.from_frame(ds_frame)
+    assert index.IDs == [7]
+    assert np.allclose(index.path, [[0.0, 0.0]])
+    path = np.array([[0.0, 0.0], [0.0, 20.0]])
+    index = BEVIndex.from_frame(ds_frame, path=path)
+    assert np.allclose(index.path, path)
+    assert index.query_corridor(1.5).tolist() == [0]
+
+
+def test_corridor_of_a_generated_frame():
+    from avlm.generate import GenerationConfig, process_scene
+    from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+    SM = SyntheticManager(SyntheticConfig(n_scenes=1, n_frames=16, n_objects=12))
+    scene = SM.scenes[0]
+    SD = SM.get_scene_dataset_by_name(scene)
+    frames = list(
+        process_scene(SD, scene, GenerationConfig(), progress=False)["agent_0"].values()
+    )
+    ds_frame = frames[0]
+    path = np.asarray(ds_frame["ego_path_bev"])
+    n_valid = sum(point is not None for point in ds_frame["waypoints_3d"].values())
+    assert path.shape == (1 + n_valid, 2)
+    assert n_valid > 0
+
+    index = BEVIndex.from_frame(ds_frame)
+    assert np.allclose(index.path, path)
+    width = 5.0
+    rows = index.query_corridor(width)
+    expected = np.flatnonzero(distance_to_path(index.positions, path) <= width)
+    assert sorted(rows.tolist()) == expected.tolist()
+    selected = index.select({"in_path": KeyObjectCriterion(corridor=width)})
+    assert selected["in_path"] == [index.IDs[row] for row in rows]
@@ -0,0 +1,161 @@
+import itertools
+
+import numpy as np
+
+
+# scripted maneuvers of the golden scene, 3 seconds each at 2 Hz
+GOLDEN_MANEUVERS = (
+    "straight",
+    "turn_left",
+    "accelerate",
+    "veer_right",
+    "decelerate",
+    "stop",
+)
+
+# run-length encoded labels of meta_actions_from_ti for the golden scene
+GOLDEN_LABELS = {
+    "dt_1.00": {
+        "lateral": [
+            ("STRAIGHT", 5),
+            ("VEER_LEFT", 1),
+            ("TURN_LEFT", 5),
+            ("VEER_LEFT", 1),
+            ("STRAIGHT", 6),
+            ("VEER_RIGHT", 5),
+            ("STRAIGHT", 11),
+            (None, 2),
+        ],
+        "longitudinal": [
+            ("MAINTAIN", 11),
+            ("ACCEL", 7),
+            ("MAINTAIN", 5),
+            ("DECEL", 9),
+            ("BRAKE_TO_STOP", 2),
+            (None, 2),
+        ],
+    },
+    "dt_2.00": {
+        "lateral": [
+            ("STRAIGHT", 3),
+            ("VEER_LEFT", 1),
+            ("TURN_LEFT", 7),
+            ("VEER_LEFT", 1),
+            ("STRAIGHT", 4),
+            ("VEER_RIGHT", 7),
+            ("STRAIGHT", 9),
+            (None, 4),
+        ],
+        "longitudinal": [
+            ("MAINTAIN", 9),
+            ("ACCEL", 9),
+            ("MAINTAIN", 3),
+            ("DECEL", 9),
+            ("BRAKE_TO_STOP", 2),
+            (None, 4),
+        ],
+    },
+    "dt_3.00": {
+        "lateral": [
+            ("STRAIGHT", 1),
+            ("VEER_LEFT", 1),
+            ("TURN_LEFT", 9),
+            ("VEER_LEFT", 1),
+            ("STRAIGHT", 2),
+            ("VEER_RIGHT", 4),
+            ("TURN_RIGHT", 1),
+            ("VEER_RIGHT", 4),
+            ("STRAIGHT", 7),
+            (None, 6),
+        ],
+        "longitudinal": [
+            ("MAINTAIN", 7),
+            ("ACCEL", 11),
+            ("MAINTAIN", 1),
+            ("DECEL", 9),
+            ("BRAKE_TO_STOP", 2),
+            (None, 6),
+        ],
+    },
+}
+
+
+def _golden_scene():
+    from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+    config = SyntheticConfig(
+        n_scenes=1,
+        n_frames=36,
+        n_objects=5,
+        n_cameras=2,
+        frames_per_maneuver=6,
+        maneuvers=GOLDEN_MANEUVERS,
+    )
+    SM = SyntheticManager(config)
+    scene = SM.splits_scenes["train"][0]
+    return scene, SM.get_scene_dataset_by_name(scene)
+
+
+def _run_lengths(labels):
+    return [(label, len(list(group))) for label, group in itertools.groupby(labels)]
+
+
+def test_simulate_maneuvers_speed_never_negative():
+    from avlm.synthetic import simulate_maneuvers
+
+    trajectory = simulate_maneuvers(
+        ["stop"], n_frames=20, dt=0.5, frames_per_maneuver=5, speed_init=8.0
+    )
+    assert np.all(trajectory["speeds"] >= 0)
+    assert trajectory["speeds"][-1] == 0
+    assert np.allclose(trajectory["yaws"], 0)
+
+
+def test_golden_action_labels():
+    from avlm.generate import GenerationConfig, process_scene
+
+    scene, SD = _golden_scene()
+    agents = process_scene(SD, scene, GenerationConfig(), progress=False)
+    frames = list(agents["agent_0"].values())
+    assert len(frames) == 36
+    for dt, golden in GOLDEN_LABELS.items():
+        for family, runs in golden.items():
+            labels = [
+                (ds_frame["meta_actions_from_ti"][dt] or {}).get(family)
+                for ds_frame in frames
+            ]
+            assert _run_lengths(labels) == runs, (dt, family)
+
+
+def test_all_cameras_project_the_primary_once():
+    from avlm.generate import GenerationConfig, process_scene
+    from avlm.synthetic import SyntheticConfig, SyntheticManager
+
+    SM = SyntheticManager(
+        SyntheticConfig(n_scenes=1, n_frames=8, n_objects=2, n_cameras=3)
+    )
+    scene = SM.scenes[0]
+    SD = SM.get_scene_dataset_by_name(scene)
+    config = GenerationConfig(waypoints_all_cameras=True)
+    frames = list(process_scene(SD, scene, config, progress=False)["agent_0"].values())
+    primary = SD.sensors[config.sensor_primary]
+    for ds_frame in frames:
+        cameras = ds_frame["waypoints_pixel_cameras"]
+        # keyed by camera name like the image paths, the primary only once
+        assert list(cameras) == [primary] + [
+            camera for camera in ds_frame["image_paths"] if camera != primary
+        ]
+        assert cameras[primary] == ds_frame["waypoints_pixel"]
+
+
+def test_golden_scalar_evaluate_matches():
+    from avlm.actions import Lateral, Longitudinal
+
+    _, SD = _golden_scene()
+    golden = GOLDEN_LABELS["dt_1.00"]
+    lateral = [label for label, n in golden["lateral"] for _ in range(n)]
+    longitudinal = [label for label, n in golden["longitudinal"] for _ in range(n)]
+    for frame in range(len(SD.frames) - 2):
+        current, future = SD.get_agent(frame, 0), SD.get_agent(frame + 2, 0)
+        assert str(Lateral.evaluate(current, future)) == lateral[frame]
+        assert str(Longitudinal.evaluate(current, future)) == longitudinal[frame]
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def _trajectory(n_frames=60, seed=0):
+    rng = np.random.default_rng(seed)
+    yaws = np.pi / 180 * np.cumsum(rng.normal(0, 8, n_frames))
+    quaternions = np.zeros((n_frames, 4))
+    quaternions[:, 0] = np.cos(yaws / 2)
+    quaternions[:, 3] = np.sin(yaws / 2)
+    velocities = np.zeros((n_frames, 3))
+    velocities[:, 0] = rng.uniform(0, 5, n_frames)
+    return quaternions, velocities
+
+
+def test_sweep_matches_batch_labels():
+    from avlm.actions import (
+        ACTION_INVALID,
+        Lateral,
+        Longitudinal,
+        get_all_meta_actions_batch,
+        lookahead_indices,
+    )
+    from avlm.threshold_sweep import ActionDeltas, sweep_thresholds
+
+    quaternions, velocities = _trajectory()
+    idx_future = lookahead_indices(len(quaternions), [2, 4, 6])
+    deltas = ActionDeltas(["dt_1.00", "dt_2.00", "dt_3.00"])
+    deltas.add(quaternions, velocities, idx_future)
+    results = sweep_thresholds(
+        deltas,
+        thresh_veer=[3, 5],
+        thresh_turn=[20, 25],
+        thresh_change=[0.25, 0.5],
+        thresh_stop=[0.5],
+        chunk_size=16,
+    )
+
+    # the default thresholds are at index (1, 0) and (0, 0) of the grids
+    lateral, longitudinal = get_all_meta_actions_batch(
+        quaternions, velocities, idx_future
+    )
+    for family, labels, ACTION, setting in [
+        ("lateral", lateral, Lateral, (1, 0)),
+        ("longitudinal", longitudinal, Longitudinal, (0, 0)),
+    ]:
+        counts = np.asarray(results[family]["counts"])[setting]
+        classes = sorted(int(label) for label in ACTION)
+        for i_hor in range(labels.shape[1]):
+            column = labels[:, i_hor]
+            column = column[column != ACTION_INVALID]
+            expected = [int((column == label).sum()) for label in classes]
+            assert counts[i_hor].tolist() == expected
+    assert results["n_pairs"] == int((idx_future >= 0).sum())
+
+    # flips between the veer thresholds at the first turn threshold
+    d_yaw = deltas.arrays()["d_yaw"]
+    n_flips = int(
+        (
+            Lateral.classify(d_yaw, thresh_veer=3, thresh_turn=20)
+            != Lateral.classify(d_yaw, thresh_veer=5, thresh_turn=20)
+        ).sum()
+    )
+    assert results["lateral"]["flips_thresh_veer"][0][0] == n_flips
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from avlm.timestamps import TimestampIndex
+
+
+def test_lookup_nearest_with_tolerance():
+    index = TimestampIndex(frames=[10, 11, 12, 13], timestamps=[0.0, 0.5, 1.0, 1.5])
+    frames = index.lookup(np.array([-0.2, 0.2, 0.25, 0.9, 2.1, 5.0]), dt_tolerance=0.5)
+    assert frames.tolist() == [10, 10, 10, 12, -1, -1]
+
+
+def test_lookup_unsorted_input():
+    index = TimestampIndex(frames=[2, 0, 1], timestamps=[1.0, 0.0, 0.5])
+    assert index.lookup(np.array([0.1, 0.6, 0.9]), dt_tolerance=0.1).tolist() == [
+        0,
+        1,
+        2,
+    ]
+
+
+def test_horizon_matrix_bounds():
+    timestamps = np.arange(5) * 0.5
+    index = TimestampIndex(frames=np.arange(5), timestamps=timestamps)
+    frames = index.horizon_matrix(
+        timestamps,
+        offsets=[-0.5, 0.0, 1.0],
+        dt_tolerance=0.1,
+        t_min=timestamps[0],
+        t_max=timestamps[-1],
+    )
+    assert frames.shape == (5, 3)
+    assert frames[:, 0].tolist() == [-1, -1, 1, 2, 3]
+    assert frames[:, 1].tolist() == [-1, 1, 2, 3, 4]
+    assert frames[:, 2].tolist() == [2, 3, 4, -1, -1]
+
+
+def test_empty_index_raises():
+    with pytest.raises(ValueError):
+        TimestampIndex(frames=[], timestamps=[])
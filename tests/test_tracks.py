@@ -0,0 +1,58 @@
+import numpy as np
+
+from avlm.tracks import ObjectTrackIndex
+
+
+class FakePosition:
+    def __init__(self, x):
+        self.x = np.asarray(x, dtype=float)
+
+    def norm(self):
+        return float(np.linalg.norm(self.x))
+
+
+class FakeObject:
+    def __init__(self, ID, x):
+        self.ID = ID
+        self.position = FakePosition(x)
+        self.reference = "sensor"
+
+    def change_reference(self, reference, inplace):
+        self.reference = reference
+
+
+class CountingScene:
+    """Minimal scene dataset that counts object loads"""
+
+    def __init__(self, objects_per_frame):
+        self.objects_per_frame = objects_per_frame
+        self.n_loads = 0
+
+    def get_objects(self, frame, sensor, agent):
+        self.n_loads += 1
+        return [FakeObject(ID, x) for ID, x in self.objects_per_frame[frame]]
+
+
+def test_track_index_loads_each_frame_once():
+    objects_per_frame = [
+        [(1, [3.0, 0.0, 4.0]), (2, [0.0, 0.0, 20.0])],
+        [(1, [3.0, 0.0, 3.0])],
+        [(2, [0.0, 0.0, 18.0]), (1, [3.0, 0.0, 2.0])],
+    ]
+    SD = CountingScene(objects_per_frame)
+    index = ObjectTrackIndex.from_scene(
+        SD, [0, 1, 2], [0.0, 0.5, 1.0], sensor="cam", agent=0, reference="static"
+    )
+    assert SD.n_loads == 3
+    assert len(index) == 2
+    assert index.frame_objects[2] == [2, 1]
+    assert np.allclose(index.frame_distances[0], [5.0, 20.0])
+
+    # tracks are in the common reference and sorted by time
+    track = index[2]
+    assert track.frames.tolist() == [0, 2]
+    assert np.allclose(track.timestamps, [0.0, 1.0])
+    assert all(state.reference == "static" for state in track.states)
+
+    # windows resolve to rows, -1 where the object was not observed
+    assert track.rows(np.array([-1, 0, 1, 2])).tolist() == [-1, 0, -1, 1]
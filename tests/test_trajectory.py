@@ -0,0 +1,42 @@
+import numpy as np
+
+from avlm.trajectory import AgentTrajectory
+
+
+class CountingScene:
+    """Minimal scene dataset that counts state loads"""
+
+    def __init__(self, states):
+        self.states = states
+        self.n_loads = 0
+
+    def get_frames(self, sensor, agent):
+        return list(range(len(self.states)))
+
+    def get_timestamps(self, sensor, agent, utime):
+        return [state.t for state in self.states]
+
+    def get_agent(self, frame, agent):
+        self.n_loads += 1
+        return self.states[frame]
+
+
+def test_trajectory_loads_each_state_once(make_state):
+    states = [make_state(yaw=2.0 * i, speed=5.0, t=0.5 * i) for i in range(6)]
+    SD = CountingScene(states)
+    traj = AgentTrajectory.from_scene(SD, agent=0)
+    assert len(traj) == 6
+    assert SD.n_loads == 6
+    for frame in range(6):
+        assert traj.states[traj.row(frame)] is states[frame]
+    assert SD.n_loads == 6
+    assert np.allclose(traj.timestamps, 0.5 * np.arange(6))
+    assert traj.velocities.shape == (6, 3)
+    assert traj.quaternions.shape == (6, 4)
+    assert traj.row(7) == -1
+
+
+def test_trajectory_rows(make_state):
+    states = [make_state(yaw=0, speed=1, t=t) for t in [0.0, 0.5]]
+    traj = AgentTrajectory([3, 5], [0.0, 0.5], states)
+    assert traj.rows(np.array([5, 3, 4, -1])).tolist() == [1, 0, -1, -1]
@@ -0,0 +1,23 @@
+import numpy as np
+
+from avlm.waypoints import project_points, reference_affine
+
+
+def test_project_points_matches_per_camera():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(1, 10, size=(6, 3))
+    matrices = rng.normal(size=(3, 3, 4))
+    pixels = project_points(points, matrices)
+    assert pixels.shape == (3, 6, 2)
+    for i_cam, matrix in enumerate(matrices):
+        for i_pt, point in enumerate(points):
+            uvw = matrix @ np.append(point, 1.0)
+            assert np.allclose(pixels[i_cam, i_pt], uvw[:2] / uvw[2])
+
+
+def test_reference_affine_identity():
+    from avstack.geometry import GlobalOrigin3D
+
+    R, t = reference_affine(GlobalOrigin3D, GlobalOrigin3D)
+    assert np.allclose(R, np.eye(3))
+    assert np.allclose(t, 0)